@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+Preloading the images used by a game.
+
+The manifest lists every image named in the unit and player descriptions,
+together with the largest size (in pixels) at which it is displayed. An
+AssetPreloader decodes the images on a background thread, scales them
+down to their display size, and keeps the results in an on-disk cache of
+raw RGBA data, so that later launches don't need to decode anything.
+
+Only decoding happens in the background; the textures are created later,
+on the main thread (see image_atlas.loadSharedAtlas).
+"""
+
+import hashlib
+import logging
+import os
+import struct
+import threading
+
+import numpy as np
+
+# Image names are relative to the game's directory.
+GAME_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# The directory of the texture cache.
+CACHE_DIR = os.path.join(GAME_DIR, '.texture_cache')
+
+# Bump this whenever the format of the cache files (or the scaling)
+# changes, so that stale files get ignored.
+CACHE_VERSION = 1
+
+# magic, version, width, height
+_HEADER = struct.Struct('<4sBHH')
+_MAGIC = 'CDTX'
+
+def buildManifest(unitFactory, playerFactory, pieceSize=None):
+    """Returns the images used by the units and players, as a sorted list
+    of (name, size) pairs.
+
+    pieceSize is the (height, width) in pixels of a 1x1 piece. If it is
+    given, size is the largest height and the largest width at which the
+    image is displayed; otherwise, it is None (ie. the images aren't scaled).
+    """
+
+    sizes = {}
+    def add(name, desc):
+        size = None
+        if pieceSize is not None:
+            size = (pieceSize[0] * int(desc.get('height', 1)),
+                    pieceSize[1] * int(desc.get('width', 1)))
+            if name in sizes:
+                # The image has to be big enough in both directions.
+                size = (max(size[0], sizes[name][0]), max(size[1], sizes[name][1]))
+        sizes[name] = size
+
+    for desc in unitFactory.descriptions.values():
+        add(desc['imageBase'] + '.png', desc)
+        add(desc['charge']['imageBase'] + '.png', desc['charge'])
+    for desc in playerFactory.descriptions.values():
+        add(desc['wall']['image'], desc['wall'])
+    return sorted(sizes.items())
+
+def scaleImage(pixels, size):
+    """Scales an RGBA image (a height x width x 4 uint8 array) down so that
+    it fits in size, keeping its aspect ratio.
+
+    Each pixel of the result is the average of the pixels that it covers,
+    weighted by their alpha. Images that already fit are returned as they
+    are.
+    """
+
+    height, width = pixels.shape[:2]
+    scale = min(float(size[0]) / height, float(size[1]) / width)
+    if scale >= 1:
+        return pixels
+    newHeight = max(1, int(round(height * scale)))
+    newWidth = max(1, int(round(width * scale)))
+
+    # Premultiply by alpha, so that transparent pixels don't bleed color.
+    p = pixels.astype('float64')
+    p[..., :3] *= p[..., 3:] / 255.0
+    rows = (np.arange(newHeight) * height) // newHeight
+    cols = (np.arange(newWidth) * width) // newWidth
+    summed = np.add.reduceat(np.add.reduceat(p, rows, axis=0), cols, axis=1)
+    counts = np.outer(np.diff(np.append(rows, height)),
+                      np.diff(np.append(cols, width)))
+    result = summed / counts[..., np.newaxis]
+    alpha = result[..., 3:]
+    result[..., :3] = np.where(alpha > 0, result[..., :3] * 255.0 / np.maximum(alpha, 1e-9), 0)
+    return np.clip(np.round(result), 0, 255).astype('uint8')
+
+def decodeImage(name):
+    """Decodes an image file with pyglet.
+
+    Returns an array of RGBA pixels, with the bottom row first (as
+    pyglet and OpenGL expect).
+    """
+
+    import pyglet
+    image = pyglet.image.load(name, file=pyglet.resource.file(name))
+    data = image.get_image_data().get_data('RGBA', image.width * 4)
+    return np.frombuffer(data, dtype='uint8').reshape((image.height, image.width, 4))
+
+class AssetPreloader(object):
+    """Decodes the images in a manifest on a background thread."""
+
+    def __init__(self, manifest, cacheDir=CACHE_DIR, decode=decodeImage):
+        """Creates a preloader; call start to begin loading.
+
+        manifest is a list of (name, size) pairs, as made by buildManifest.
+        cacheDir is where the decoded images are cached (None for no
+        cache). decode is the function that decodes an image file.
+        """
+
+        self.manifest = list(manifest)
+        self.cacheDir = cacheDir
+        self.decode = decode
+        # The decoded images, indexed by name.
+        self.images = {}
+        # Counters, for checking how well the cache works.
+        self.cacheHits = 0
+        self.decoded = 0
+        self._done = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='AssetPreloader')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def run(self):
+        """Loads all the images (on the calling thread)."""
+
+        try:
+            for name, size in self.manifest:
+                try:
+                    self.images[name] = self._load(name, size)
+                except Exception:
+                    # The image will be loaded the usual way, when it is
+                    # needed, and that will report the error.
+                    logging.exception('Could not preload %s' % name)
+        finally:
+            self._done.set()
+
+    def wait(self, timeout=None):
+        """Waits until all the images are loaded; returns False on timeout."""
+
+        if self._thread is None:
+            self.run()
+        return self._done.wait(timeout)
+
+    def get(self, name):
+        """Returns the pixels of an image in the manifest, or None.
+
+        Waits for the background thread if necessary.
+        """
+
+        self.wait()
+        return self.images.get(name)
+
+    def _cachePath(self, name, size):
+        stat = os.stat(os.path.join(GAME_DIR, name))
+        key = repr((name, size, stat.st_mtime, stat.st_size, CACHE_VERSION))
+        return os.path.join(self.cacheDir, hashlib.sha1(key).hexdigest() + '.rgba')
+
+    def _load(self, name, size):
+        cachePath = None
+        if self.cacheDir is not None:
+            cachePath = self._cachePath(name, size)
+            pixels = readCached(cachePath)
+            if pixels is not None:
+                self.cacheHits += 1
+                return pixels
+
+        pixels = self.decode(name)
+        if size is not None:
+            pixels = scaleImage(pixels, size)
+        self.decoded += 1
+
+        if cachePath is not None:
+            try:
+                writeCached(cachePath, pixels)
+            except (IOError, OSError):
+                pass
+        return pixels
+
+def readCached(path):
+    """Reads a cached image, or returns None if there isn't a valid one."""
+
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except IOError:
+        return None
+    if len(data) < _HEADER.size:
+        return None
+    magic, version, width, height = _HEADER.unpack_from(data)
+    if (magic != _MAGIC or version != CACHE_VERSION or
+            len(data) != _HEADER.size + width * height * 4):
+        return None
+    return np.frombuffer(data, dtype='uint8', offset=_HEADER.size).reshape((height, width, 4))
+
+def writeCached(path, pixels):
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    height, width = pixels.shape[:2]
+    # Write to a temporary file first, so that other processes never see
+    # half-written files.
+    tmpPath = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmpPath, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, CACHE_VERSION, width, height))
+        f.write(np.ascontiguousarray(pixels).tostring())
+    os.rename(tmpPath, path)
@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the board rules.
+
+Times the operations that the game does on every move (normalize, adding
+pieces, colToAdd, calling pieces, beginning a turn and calculating damage)
+on boards generated from a seed, at several sizes and densities. For each
+operation, the benchmark reports the number of operations per second, the
+50th, 90th and 99th percentile times, and the number of objects allocated.
+
+The results can be saved as JSON (--output), and compared with a previous
+run (--compare), eg.
+
+    python benchmark_board.py --output before.json
+    (make some changes)
+    python benchmark_board.py --compare before.json
+
+Allocations are counted with the garbage collector, which is disabled
+while an operation runs: the count is the net number of container objects
+(lists, dicts, pieces, ...) that the operation created.
+"""
+
+import argparse
+import gc
+import json
+import logging
+import subprocess
+import sys
+import timeit
+
+import numpy as np
+
+from board import Board
+from game_manager import GameManager
+from described_object_factory import UnitFactory, PlayerFactory
+from type_table import TypeTable
+import board_generator
+import snapshot
+
+# The board sizes, as (height, width).
+SIZES = [(6, 8), (8, 8), (16, 16), (32, 32)]
+
+# The fraction of the board that is filled.
+DENSITIES = [0.3, 0.7]
+
+# The mixes of pieces (see board_generator.generateBoard).
+MIXES = {
+    'mixed': {'fattyRatio': 0.1, 'chargedRatio': 0.1, 'wallDensity': 0.1},
+    'fatty': {'fattyRatio': 0.5, 'chargedRatio': 0.1, 'wallDensity': 0.1},
+    'walls': {'fattyRatio': 0.1, 'chargedRatio': 0.1, 'wallDensity': 0.8},
+}
+
+# The number of pieces that callPieces is asked to call.
+CALLED_PIECES = 8
+
+def scenarios(sizes=SIZES, densities=DENSITIES, mixes=None):
+    """Returns the scenarios to run, as a list of dicts.
+
+    Every size is run at every density with the 'mixed' pieces; the other
+    mixes are run at the highest density.
+    """
+
+    if mixes is None:
+        mixes = sorted(MIXES)
+    result = []
+    for height, width in sizes:
+        for mix in mixes:
+            for density in densities:
+                if mix != 'mixed' and density != max(densities):
+                    continue
+                result.append({'height': height, 'width': width,
+                               'density': density, 'mix': mix})
+    return result
+
+def scenarioName(scenario):
+    return '%(height)dx%(width)d-%(density).1f-%(mix)s' % scenario
+
+class Benchmark(object):
+    """Builds the boards and times the operations on them."""
+
+    def __init__(self, seed=0):
+        self.seed = seed
+        self.unitFac = UnitFactory('unit_descriptions.xml')
+        self.playerFac = PlayerFactory('player_descriptions.xml')
+        self.table = TypeTable(self.unitFac, self.playerFac)
+        self.players = [self.newPlayer(), self.newPlayer()]
+
+        self.operations = [
+            ('normalize', self.setupNormalize, self.runNormalize),
+            ('addPiece+normalize', self.setupAddPiece, self.runAddPiece),
+            ('colToAdd', self.setupColToAdd, self.runColToAdd),
+            ('callPieces', self.setupCallPieces, self.runCallPieces),
+            ('beginTurn', self.setupBeginTurn, self.runBeginTurn),
+            ('damageCalculate', self.setupDamage, self.runDamage),
+            ('ghostBoard', self.setupGhostBoard, self.runGhostBoard),
+            ('generateBoard', self.setupGenerate, self.runGenerate),
+        ]
+
+    def newPlayer(self):
+        return self.playerFac.create('Camel', self.unitFac,
+                baseWeights=[1, 1, 1], baseNames=['Archer', 'Swordsman', 'Swordsman'],
+                specialWeights=[10], specialNames=['Angel'], specialRarity=[3])
+
+    def randomUnit(self, random, fattyRatio):
+        player = self.players[0]
+        color = player.baseColor[random.randint(len(player.baseColor))]
+        if random.uniform() < fattyRatio:
+            name = 'Angel'
+        else:
+            name = player.baseNames[random.randint(len(player.baseNames))]
+        return self.unitFac.create(name, color, player=player)
+
+    def buildBoard(self, scenario, seed):
+        """Generates a normalized board for a scenario."""
+
+        mix = MIXES[scenario['mix']]
+        board = board_generator.generateBoard(self.players[0], seed,
+                scenario['height'], scenario['width'], scenario['density'],
+                mix['fattyRatio'], mix['chargedRatio'], mix['wallDensity'])
+        board.random = np.random.RandomState(seed)
+        return board
+
+    def copyBoard(self, data):
+        return snapshot.unpackBoard(data, self.table, self.players[0])
+
+    # The operations. Each one has a setup function, which is not timed,
+    # and a run function, which is. setup gets the snapshot of the board
+    # and a random number generator, and returns the argument for run.
+
+    def setupNormalize(self, data, random):
+        return self.copyBoard(data)
+
+    def runNormalize(self, board):
+        board.normalize()
+
+    def setupAddPiece(self, data, random):
+        board = self.copyBoard(data)
+        unit = self.randomUnit(random, 0.1)
+        cols = [c for c in range(board.width) if board.canAddPiece(unit, c)]
+        if not cols:
+            return None
+        return board, unit, cols[random.randint(len(cols))]
+
+    def runAddPiece(self, args):
+        if args is not None:
+            board, unit, col = args
+            board.addPiece(unit, col)
+            board.normalize()
+
+    def setupColToAdd(self, data, random):
+        board = self.copyBoard(data)
+        board.random = random
+        return board, self.randomUnit(random, 0.1)
+
+    def runColToAdd(self, args):
+        board, unit = args
+        board.colToAdd(unit)
+
+    def setupCallPieces(self, data, random):
+        # The game changes its players (their mana, moves, random number
+        # generators, ...), so every game gets new ones; otherwise the
+        # results would depend on the operations that ran before.
+        players = [self.newPlayer(), self.newPlayer()]
+        board = snapshot.unpackBoard(data, self.table, players[0])
+        other = Board(board.height, board.width)
+        manager = GameManager(players[0], board, players[1], other,
+                              seed=random.randint(2 ** 31))
+        players[0].maxUnitTotal = len(board.units) + CALLED_PIECES
+        return manager
+
+    def runCallPieces(self, manager):
+        manager.callPieces()
+
+    def setupBeginTurn(self, data, random):
+        board = self.copyBoard(data)
+        # Make the next turn an attacking one, so that the attackers get
+        # removed as well.
+        for attack in board.currentAttacks:
+            attack.turn = 1
+        return board
+
+    def runBeginTurn(self, board):
+        board.beginTurn()
+
+    def setupDamage(self, data, random):
+        board = self.copyBoard(data)
+        attackers = []
+        col = 0
+        while col < board.width:
+            unit = self.randomUnit(random, 0.1)
+            if col + unit.width > board.width:
+                break
+            unit.position = [0, col]
+            attacker = unit.charge()
+            attacker.turn = 0
+            attackers.append(attacker)
+            col += unit.width
+        return board, attackers
+
+    def runDamage(self, args):
+        board, attackers = args
+        board.damageCalculate(attackers)
+
+    def setupGhostBoard(self, data, random):
+        return self.copyBoard(data)
+
+    def runGhostBoard(self, board):
+        board.ghostBoard()
+
+    def setupGenerate(self, data, random):
+        # Generate a board like the one in the snapshot, with a new seed.
+        board = self.copyBoard(data)
+        filled = sum(p.height * p.width for p in board.units)
+        return ((board.height, board.width), float(filled) / board.height / board.width,
+                random.randint(2 ** 31))
+
+    def runGenerate(self, args):
+        (height, width), density, seed = args
+        board_generator.generateBoard(self.players[0], seed, height, width, density)
+
+    def time(self, data, setup, run, random, minTime, maxIterations):
+        """Runs an operation until it has taken minTime seconds (but at
+        least 5 times, and at most maxIterations times).
+
+        Returns the lists of times and allocation counts, and the number
+        of times that the operation failed. Failures (eg. a board that
+        can't be normalized) are not timed, but they are counted, since
+        they are bugs in the rules.
+        """
+
+        times = []
+        allocations = []
+        failures = 0
+        total = 0.0
+        while (len(times) + failures < maxIterations and
+               (len(times) < 5 or total < minTime)):
+            arg = setup(data, random)
+            gc.collect()
+            gc.disable()
+            try:
+                before = gc.get_count()[0]
+                start = timeit.default_timer()
+                run(arg)
+                elapsed = timeit.default_timer() - start
+                allocations.append(gc.get_count()[0] - before)
+            except IndexError:
+                failures += 1
+                continue
+            finally:
+                gc.enable()
+            times.append(elapsed)
+            total += elapsed
+        return times, allocations, failures
+
+    def run(self, scenarios, operations=None, minTime=0.2, maxIterations=1000):
+        """Runs the benchmark, and returns a list of results."""
+
+        results = []
+        for scenario in scenarios:
+            name = scenarioName(scenario)
+            board = self.buildBoard(scenario, self.seed)
+            data = snapshot.packBoard(board, self.table)
+            for opName, setup, run in self.operations:
+                if operations is not None and opName not in operations:
+                    continue
+                # Every operation gets the same random numbers.
+                random = np.random.RandomState(self.seed)
+                times, allocations, failures = self.time(data, setup, run, random,
+                                                         minTime, maxIterations)
+                result = summarize(times, allocations)
+                result['failures'] = failures
+                result.update(scenario)
+                result.update({'scenario': name, 'operation': opName,
+                               'pieces': len(board.units)})
+                results.append(result)
+                logging.info('%-22s %-20s %s' % (name, opName, formatResult(result)))
+        return results
+
+def summarize(times, allocations):
+    if not times:
+        return {'iterations': 0, 'opsPerSec': 0.0, 'p50': float('nan'),
+                'p90': float('nan'), 'p99': float('nan'), 'allocations': float('nan')}
+    times = np.array(times)
+    p50, p90, p99 = np.percentile(times, [50, 90, 99])
+    return {'iterations': len(times),
+            'opsPerSec': len(times) / times.sum() if times.sum() > 0 else float('inf'),
+            'p50': p50, 'p90': p90, 'p99': p99,
+            'allocations': float(np.median(allocations))}
+
+def formatResult(result):
+    text = ('%9.1f ops/s  p50 %8.3f ms  p90 %8.3f ms  p99 %8.3f ms  %7.0f allocs'
+            % (result['opsPerSec'], result['p50'] * 1000, result['p90'] * 1000,
+               result['p99'] * 1000, result['allocations']))
+    if result.get('failures'):
+        text += '  (%d failed)' % result['failures']
+    return text
+
+def currentCommit():
+    """Returns the git commit of the working tree, or None."""
+
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       stderr=subprocess.STDOUT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(baseline, results, threshold):
+    """Prints how results compare with the results of a previous run.
+
+    Returns the number of operations that got slower by more than threshold
+    (a fraction of their p50 time).
+    """
+
+    old = dict(((r['scenario'], r['operation']), r) for r in baseline['results'])
+    regressions = 0
+    print '%-22s %-20s %10s %10s %8s' % ('scenario', 'operation', 'old p50', 'new p50', 'change')
+    for r in results:
+        key = (r['scenario'], r['operation'])
+        if key not in old:
+            continue
+        before = old[key]['p50']
+        change = r['p50'] / before - 1 if before > 0 else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '  SLOWER'
+            regressions += 1
+        print '%-22s %-20s %8.3fms %8.3fms %+7.1f%%%s' % (
+            key[0], key[1], before * 1000, r['p50'] * 1000, change * 100, flag)
+    return regressions
+
+def parseSize(text):
+    height, width = text.split('x')
+    return int(height), int(width)
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the board rules.')
+    parser.add_argument('--sizes', type=lambda s: [parseSize(x) for x in s.split(',')],
+                        default=SIZES, help='board sizes, eg. 6x8,16x16')
+    parser.add_argument('--densities', type=lambda s: [float(x) for x in s.split(',')],
+                        default=DENSITIES, help='board densities, eg. 0.3,0.7')
+    parser.add_argument('--mixes', type=lambda s: s.split(','), default=None,
+                        help='piece mixes (%s)' % ', '.join(sorted(MIXES)))
+    parser.add_argument('--operations', type=lambda s: s.split(','), default=None,
+                        help='only run these operations')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='seconds to spend on each operation (default: %(default)s)')
+    parser.add_argument('--max-iterations', type=int, default=1000)
+    parser.add_argument('--output', help='save the results to this JSON file')
+    parser.add_argument('--compare', help='compare with the results in this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='with --compare, the slowdown (as a fraction) that '
+                        'counts as a regression (default: %(default)s)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parseArgs(argv)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    benchmark = Benchmark(args.seed)
+    results = benchmark.run(scenarios(args.sizes, args.densities, args.mixes),
+                            args.operations, args.min_time, args.max_iterations)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'commit': currentCommit(),
+                       'python': sys.version,
+                       'seed': args.seed,
+                       'results': results}, f, indent=1, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, results, args.threshold):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,9 +2,38 @@
 
 import numpy as np
 import logging
+import threading
+import weakref
 from event_hook import EventHook
 from ghost_piece import GhostPiece
 from attack_summary import AttackSummary
+from object_pool import KeyedPool
+from normalize_profiler import NullProfiler
+import tracing
+
+# Fatty alignment runs inside normalize, so its trace points only build
+# their events when the tracer is enabled.
+_trace = tracing.getTracer('board.fatty')
+
+# The profiler of the boards that don't have one.
+_noProfiler = NullProfiler()
+
+class _GhostPools(threading.local):
+    """colToAdd probes every column on a ghost copy of the board. The
+    copies (keyed by their size) and their ghost pieces are private to
+    colToAdd, so they are reused instead of being made for every probe.
+    Each thread has its own pools, since colToAdd only reads the board
+    and may be called from several threads (eg. by an AI)."""
+
+    def __init__(self):
+        self.boards = KeyedPool(4)
+        self.pieces = KeyedPool(256)
+
+_ghostPools = _GhostPools()
+
+def _acquireGhost(piece):
+    return _ghostPools.pieces.acquire(GhostPiece, lambda: GhostPiece(piece),
+                                      lambda ghost: ghost.reset(piece))
 
 class Board:
     """Represents one player's board.
@@ -42,6 +71,10 @@ class Board:
         # Keeps track of piece positions so that we can detect if they
         # have changed.
         self._piecePositions = {}
+
+        # Incremented every time the pieceUpdated handlers are triggered,
+        # so that views can tell when their cached data is stale.
+        self.version = 0
         
         # Event handler that will be triggered each time
         # when an attack formation is created
@@ -66,6 +99,49 @@ class Board:
         #after all currentAttacks have been updated
         self.turnBegun = EventHook()
 
+        # The random number generator used by colToAdd. This is numpy's
+        # global one unless the GameManager gives us our own.
+        self.random = np.random
+
+        # A normalize_profiler.NormalizeProfiler, or None. If set, every
+        # normalize reports the time spent in each of its phases.
+        self.profiler = None
+
+        # Weak references to the snapshots that still share some columns
+        # (or the set of units) with the board. See snapshot(). Only the
+        # board's thread uses the list, so there are no callbacks (which
+        # would run on whichever thread drops a snapshot).
+        self._snapshots = []
+        # The thread that changes the board (the one that made it).
+        self._thread = threading.current_thread()
+
+    def reset(self):
+        """Empties the board and puts it back in the state of a new board
+        (of the same size), without reallocating it. Event handlers are
+        removed as well. The version keeps counting up, so that views
+        which cache data by version see that the board has changed.
+
+        Returns the pieces that were on the board, which are left as they
+        were (eg. to give them back to their factory).
+        """
+
+        units = list(self.units)
+        self._copyOnWrite(units=True)
+        self._thread = threading.current_thread()
+        self.grid.fill(None)
+        self.units.clear()
+        self.currentAttacks.clear()
+        self._updatedPieces.clear()
+        self._piecePositions.clear()
+        self.version += 1
+        for hook in (self.pieceUpdated, self.attackMade, self.wallMade,
+                     self.fusionMade, self.attackNow, self.attackReceived,
+                     self.turnBegun):
+            hook.clearHandlers()
+        self.random = np.random
+        self.profiler = None
+        return units
+
     def __getitem__(self, item):
         '''Return the corresponding sub-table of grid.
         Throws an error if index out of bound '''
@@ -88,11 +164,15 @@ class Board:
         remove None and redundancies . Items scanned by column then by row, in the input order
         """
         units = list()
+        # Use a set for the membership test, so that tall columns
+        # don't make this quadratic.
+        seen = set()
         for j in cols:
             for i in rows:
-                   if self[i,j] is not None:
-                       if self[i,j] not in units:
-                           units.append(self[i,j])
+                unit = self[i,j]
+                if unit is not None and unit not in seen:
+                    seen.add(unit)
+                    units.append(unit)
         return units
 
     def __setitem__(self, item, unit):
@@ -108,6 +188,7 @@ class Board:
             jmax = j
         if imax >= self.grid.shape[0] or jmax >= self.grid.shape[1]:
             raise IndexError("Index larger than board size")
+        self._copyOnWrite(j if isinstance(j, (tuple, list)) else [j])
         self.grid[i,j] = unit
 
     @property
@@ -127,18 +208,30 @@ class Board:
         """Updates the board by sliding pieces by priority, find and update links,
         and iterate these 2 steps until no more updates required.
         """
-        madeStuff = 1
-        while(madeStuff > 0):
-            madeStuff = 0
-            self._shiftByPriority() #shift higher priority guys to front
-            self._reportPieceUpdates()
-            create = self._createFormations() #check and make new formations
-            self._reportPieceUpdates()
-            #if created new things, need to shift by priority again            
-            madeStuff += create
-            createWall = self._mergeWalls() #if created walls            
-            madeStuff += createWall
-            self._reportPieceUpdates()
+        profiler = self.profiler or _noProfiler
+        profiler.begin(self)
+        try:
+            madeStuff = 1
+            while madeStuff > 0:
+                profiler.add('passes')
+                madeStuff = 0
+                #shift higher priority guys to front
+                profiler.time('shiftByPriority', self._shiftByPriority)
+                profiler.time('reportPieceUpdates', self._reportPieceUpdates)
+                #check and make new formations
+                create = profiler.time('createFormations', self._createFormations)
+                profiler.time('reportPieceUpdates', self._reportPieceUpdates)
+                #if created new things, need to shift by priority again
+                madeStuff += create
+                #if created walls
+                merges = profiler.time('mergeWalls', self._mergeWalls)
+                profiler.add('merges', merges)
+                madeStuff += merges
+                profiler.time('reportPieceUpdates', self._reportPieceUpdates)
+        except Exception, e:
+            profiler.end(type(e).__name__)
+            raise
+        profiler.end()
 
     def _reportPieceUpdates(self):
         """Trigger pieceUpdated events.
@@ -157,6 +250,7 @@ class Board:
         self._updatedPieces.update(moved)
 
         if self._updatedPieces:
+            self.version += 1
             # Pass a copy, so that it isn't cleared when we clear our version.
             self.pieceUpdated.callHandlers(self._updatedPieces.copy())
 
@@ -175,22 +269,22 @@ class Board:
 
         ALSO: merge units that can be merged (such as fusing)
 
-        Returns true if anything changed.
+        Returns the number of merges.
         """
         #cycle through units by column over (j), then over row (i)
-        updated = False
+        merged = 0
         for j in range(self.grid.shape[1]):
             for i in range(self.boardHeight[j]):
                 unit = self[i,j]
                 if unit is not None:
                     unitTop = self[i+unit.size[0],j]
                     if unitTop and unit.canMerge(unitTop):
-                        updated = True
+                        merged += 1
                         self._deleteFromGrid(unitTop)
                         unit.merge(unitTop)
                         self._deletePiece(unitTop)
                         break
-        return updated
+        return merged
 
     def _shiftByPriority(self):
         """Shift pieces by priority.
@@ -214,10 +308,10 @@ class Board:
             #sort by decreasing priority
             unitCol = sorted(unitCol, key = lambda piece: piece.slidePriority, reverse = True)
             #copy this over to the board
-            self[range(nrow), j] = None
+            column = np.empty(nrow, dtype=object)
             i = 0
             for unit in unitCol:
-                self[range(i, i+unit.size[0]), j] = unit
+                column[i:(i+unit.size[0])] = unit
                 # If in the correct reference column, check if the unit has moved
                 if i != unit.position[0] and j == unit.position[1]:
                     updated = True
@@ -226,16 +320,30 @@ class Board:
                     fatty.add(unit)
                 #check the next height level
                 i += unit.size[0]
+            # Only write the columns that changed, so that snapshots keep
+            # sharing the others.
+            if any(a is not b for a, b in zip(column, self.grid[:, j])):
+                self[range(nrow), j] = column
+        # Realign the fatties in a fixed order (by column, then row), so
+        # that the result doesn't depend on the order of the set.
+        fatty = sorted(fatty, key=lambda unit: (unit.position[1], unit.position[0]))
         #check for fatty disalignment
+        profiler = self.profiler or _noProfiler
+        profiler.add('alignFattyTries',
+                     profiler.time('alignFatty', self._alignFatties, fatty))
+        return updated
+
+    def _alignFatties(self, fatty):
+        """Aligns the fatties, and returns the number of tries it took."""
         trynum = 0
         while self._doAlignFatty(fatty):
             trynum = trynum + 1
-            logging.debug( 'Done fatty alignment trial number %s' % trynum)
-            self.dumpPosition()
+            if _trace.enabled:
+                _trace.event('try', number=trynum, pieces=self._positions())
             if(trynum > 100):
                 logging.error('shiftByPriority attempting to realign fatty over 100 times')
                 raise IndexError("Attempted to realign fatty over 100 times")
-        return updated
+        return trynum
 
     def _unitIsHere(self, unit, pos):
         """Returns true if unit.position is pos, and
@@ -255,7 +363,8 @@ class Board:
         updated = False
         for unit in fatList:
             if not self._unitIsHere(unit, unit.position): #if not aligned
-                logging.debug("Fatty named %s at position %s is not aligned." % (unit.name, str(unit.position)))
+                if _trace.enabled:
+                    _trace.event('misaligned', name=unit.name, position=unit.position)
                 #flag updated as True since we'll need another iteration
                 updated = True
                 #look up where the top corner is in the column
@@ -266,7 +375,8 @@ class Board:
                         topCornerLoc = i
                         break           
                 #if top corner is higher
-                logging.debug("His current top corner is in row %s. Expected row is %s" % (topCornerLoc, unit.position[0]+1))
+                if _trace.enabled:
+                    _trace.event('topCorner', row=topCornerLoc, expected=unit.position[0]+1)
                 if topCornerLoc > unit.position[0]+1:
                     #shift the leftside up as far as possible
                     delta = topCornerLoc - (unit.position[0]+1)
@@ -275,13 +385,16 @@ class Board:
                         if(self._canShiftUp(j-1,unit.position[0]+1+i, topCornerLoc)):
                             maxShift = i
                     #shift up by maxshift
-                    logging.debug("We need to shift his leftside up by %s. We can shift by %s" % (delta, maxShift))
+                    if _trace.enabled:
+                        _trace.event('shiftLeftUp', needed=delta, possible=maxShift)
                     if(maxShift > 0):
                         shifted = self._doShiftUp(j-1, unit.position[0], unit.position[0]+maxShift)
-                        logging.debug("Successfully shifted: %s" % shifted)
+                        if _trace.enabled:
+                            _trace.event('shifted', shifted=shifted)
                     if maxShift == 0 or not shifted: 
                         #if cannot shift the left side up, then shift the rightside down
-                        logging.debug("Cannot shift the left side up. Shifting the right side down")
+                        if _trace.enabled:
+                            _trace.event('shiftRightDown')
                         self._doShiftDown(j, topCornerLoc-1,unit.position[0], 2)
                 #if top corner is lower
                 if topCornerLoc < unit.position[0] +1:
@@ -292,18 +405,20 @@ class Board:
                         if(self._canShiftUp(j, topCornerLoc-1, topCornerLoc-1+maxShift)):
                             maxShift = i
                     #shift up by maxshift
-                    logging.debug("We need to shift his rightside up by %s. We can shift by %s" % (delta, maxShift))
+                    if _trace.enabled:
+                        _trace.event('shiftRightUp', needed=delta, possible=maxShift)
                     if(maxShift > 0):                    
                         shifted = self._doShiftUp(j, topCornerLoc-1, topCornerLoc-1+maxShift)
-                        logging.debug("Successfully shifted: %s" % shifted)
+                        if _trace.enabled:
+                            _trace.event('shifted', shifted=shifted)
                     if maxShift == 0 or not shifted:
                         #then shift the leftside down
-                        logging.debug("Cannot shift right side up. Shifting the left side down")
+                        if _trace.enabled:
+                            _trace.event('shiftLeftDown')
                         self._doShiftDown(j-1,unit.position[0], topCornerLoc+maxShift,2)
-                if self._unitIsHere(unit, unit.position):
-                    logging.debug('Successfully realigned fatty to position %s' % str(unit.position))
-                else:
-                    logging.debug('Alignment not successful for fatty at position %s' % str(unit.position))
+                if _trace.enabled:
+                    _trace.event('realigned', position=unit.position,
+                                 success=self._unitIsHere(unit, unit.position))
         return updated
 
     def _canShiftUp(self, col, oldRow, newRow):
@@ -411,6 +526,28 @@ class Board:
             self._addToGrid(piece)
         return row
 
+    def dropRows(self, width, ignore=None):
+        """Returns the row at which a piece of the given width would be
+        added, for every column.
+
+        This is rowToAdd for all the columns at once (the result is a
+        numpy array with one entry per column), except that it doesn't
+        need a piece. If ignore is a piece on the board, it is treated as
+        if it had been removed.
+        """
+
+        occupied = np.not_equal(self.grid, None)
+        if ignore is not None and ignore in self.units:
+            row, col = ignore.position
+            occupied[row:(row + ignore.height), col:(col + ignore.width)] = False
+
+        top = self.height - np.argmax(occupied[::-1], axis=0)
+        heights = np.where(occupied.any(axis=0), top, 0)
+
+        # The piece lands on the highest of the columns that it covers.
+        padded = np.concatenate([heights, np.zeros(width - 1, dtype=heights.dtype)])
+        return np.max([padded[k:(k + self.width)] for k in range(width)], axis=0)
+
     def canAddPiece(self, piece, col):
         """Checks whether the given piece fits in the given column."""
 
@@ -488,6 +625,7 @@ class Board:
         if any([u != None and u != piece for u in region]):
             raise ValueError("Piece and board disagree on position", piece, piece.position)
 
+        self._copyOnWrite(range(col, col+fat))
         self.grid[row:(row+tall), col:(col+fat)] = None
 
     def _addToGrid(self, piece):
@@ -509,6 +647,7 @@ class Board:
         if any(occupied):
             raise ValueError("Position is already occupied")
 
+        self._copyOnWrite(range(col, col+fat))
         self.grid[row:(row+tall), col:(col+fat)] = piece
 
     def _deletePiece(self, piece):
@@ -521,6 +660,7 @@ class Board:
         if piece not in self.units:
             raise ValueError("Tried to remove a non-existent piece")
 
+        self._copyOnWrite([], units=True)
         self.units.remove(piece)
         self._deleteFromGrid(piece)
         self._updatedPieces.add(piece)
@@ -528,6 +668,30 @@ class Board:
         piece.oldPosition = piece.position
         piece.position = None
 
+    def _loadPieces(self, pieces, pieceIds, attacks):
+        """Replace the contents of the board.
+
+        pieces is a list of pieces with their positions already set,
+        pieceIds is an integer array with the same shape as the grid, whose
+        entries are 1 + the index in pieces of the piece occupying that
+        square (0 means empty), and attacks is the set of pieces that are
+        charging.
+        """
+
+        for u in self.units:
+            u.oldPosition = u.position
+            u.position = None
+            self._updatedPieces.add(u)
+
+        lookup = np.empty(len(pieces) + 1, dtype=object)
+        lookup[1:] = pieces
+        self._copyOnWrite(units=True)
+        self.grid[:, :] = lookup[pieceIds]
+        self.units = set(pieces)
+        self.currentAttacks = set(attacks)
+        self._updatedPieces.update(pieces)
+        self._reportPieceUpdates()
+
     def _piecesInRegion(self, offset, regionSize):
         """The list of pieces in the rectangle of the given size
         at the given offset."""
@@ -600,6 +764,8 @@ class Board:
         transformingPieces = set()
         # counter for number of walls formed
         wallCount = 0
+        # The order in which ghost pieces were created; see below.
+        ghostOrder = {}
         
         for unit in unitList:
             # Look at the pieces in the charging region.  If there are some,
@@ -640,7 +806,7 @@ class Board:
             if unit in self.units:
                 charged = unit.charge()
                 chargedEndPosition = charged.position[0]+charged.size[0]
-                chargers = set(self._chargers(unit))
+                chargers = self._chargers(unit)
                 # Delete all chargers unless the unit that was charged is
                 # multichargeable.
                 # If also transforming, make a ghost piece at the end of
@@ -650,6 +816,7 @@ class Board:
                     if x in self.units:
                         if x in transformingChargers:
                             ghost = GhostPiece(x)
+                            ghostOrder[ghost] = len(ghostOrder)
                             ghost.position[0] = chargedEndPosition
                             transformingPieces.add(ghost)
                             transformingChargers.add(ghost)
@@ -666,6 +833,7 @@ class Board:
                 # and mark it as transforming
                 if unit in transformingPieces:
                     ghost = GhostPiece(unit)
+                    ghostOrder[ghost] = len(ghostOrder)
                     ghost.position[0] = chargedEndPosition
                     transformingPieces.add(ghost)
                     transformingChargers.add(ghost)
@@ -680,9 +848,12 @@ class Board:
         #update the set of currentAttacks. 
             self.currentAttacks.update(set(chargedPieces))
         
-        # Create walls.
+        # Create walls. Go through the pieces in a fixed order (by column,
+        # then row, with ghosts in the order they were made), so that the
+        # result doesn't depend on the order of the set.
         transformedPieces = []
-        for unit in transformingPieces:
+        transformOrder = lambda u: (u.position[1], u.position[0], ghostOrder.get(u, -1))
+        for unit in sorted(transformingPieces, key=transformOrder):
             transformed = unit.transform()        
 
             #Vanilla case: unit is not involved in charging. 
@@ -710,7 +881,10 @@ class Board:
         #only call handler if some wall was made. 
         if len(transformedPieces) > 0:
             self.wallMade.callHandlers([set(transformedPieces), wallCount])
-                
+
+        profiler = self.profiler or _noProfiler
+        profiler.add('formations', len(chargedPieces))
+        profiler.add('walls', len(transformedPieces))
         return bool(chargedPieces or transformedPieces)
 
     def _canInsertPiece(self, piece, position):
@@ -748,7 +922,8 @@ class Board:
 
     def _appearPiece(self, piece, pos):
         """Place a new piece in the given position."""
-        self.units.add(piece)                
+        self._copyOnWrite([], units=True)
+        self.units.add(piece)
         piece.position = pos
         self._addToGrid(piece)
         self._updatedPieces.add(piece)
@@ -767,17 +942,21 @@ class Board:
         """
         #logging.debug(str([u.position for u in self.units]))
         # choose a random ordering of the columns
-        columnList = list(np.random.permutation(self.width))
+        columnList = list(self.random.permutation(self.width))
         for col in columnList:
             # Make a copy of the current board, then add a copy of the
             # piece in the current column.  If no formations are created,
             # then the column is ok.
             if self.canAddPiece(piece, col):
-                boardCopy = self.ghostBoard()
-                ghost = GhostPiece(piece)
-                boardCopy.addPiece(ghost, col)
-                if not boardCopy._createFormations():
-                    return col
+                boardCopy, ghosts = self._pooledGhostBoard()
+                try:
+                    ghost = _acquireGhost(piece)
+                    ghosts.append(ghost)
+                    boardCopy.addPiece(ghost, col)
+                    if not boardCopy._createFormations():
+                        return col
+                finally:
+                    self._releaseGhostBoard(boardCopy, ghosts)
         return None
 
     def ghostBoard(self):
@@ -787,6 +966,62 @@ class Board:
             ghost = GhostPiece(u)
             boardCopy._appearPiece(ghost, u.position)
         return boardCopy
+
+    def _pooledGhostBoard(self):
+        """Like ghostBoard, but the board and the ghosts come from the
+        pools. Returns the board and a list of the ghosts; give them back
+        with _releaseGhostBoard."""
+        key = (self.height, self.width)
+        boardCopy = _ghostPools.boards.acquire(key, lambda: Board(*key))
+        ghosts = []
+        for u in self.units:
+            ghost = _acquireGhost(u)
+            ghosts.append(ghost)
+            boardCopy._appearPiece(ghost, u.position)
+        return boardCopy, ghosts
+
+    def _releaseGhostBoard(self, boardCopy, ghosts):
+        boardCopy.reset()
+        _ghostPools.boards.release((boardCopy.height, boardCopy.width), boardCopy)
+        for ghost in ghosts:
+            # Don't keep the real pieces alive.
+            ghost.reset()
+            _ghostPools.pieces.release(GhostPiece, ghost)
+
+    def snapshot(self):
+        """Return a read-only BoardSnapshot of the board as it is now.
+
+        Taking a snapshot copies nothing: the snapshot shares the grid
+        with the board, and the board copies a column (or the set of
+        units) into its snapshots just before it first changes it.
+
+        Snapshots must be taken on the thread that changes the board (the
+        one that made it), between changes; they can then be handed to
+        other threads. Raises RuntimeError on any other thread, since the
+        board could be halfway through a change.
+        """
+        if threading.current_thread() is not self._thread:
+            raise RuntimeError("Board snapshots must be taken on the board's own thread")
+        snap = BoardSnapshot(self)
+        self._snapshots.append(weakref.ref(snap))
+        return snap
+
+    def _copyOnWrite(self, cols=None, units=False):
+        """Called before the board changes the given columns (all of them
+        if cols is None) and, if units is true, the set of units."""
+        if not self._snapshots:
+            return
+        if cols is None:
+            cols = range(self.width)
+        live = []
+        for ref in self._snapshots:
+            snap = ref()
+            # Forget the snapshots that are gone, or that don't share
+            # anything any more.
+            if snap is not None and not snap._copy(self.grid, cols,
+                                                   self.units if units else None):
+                live.append(ref)
+        self._snapshots = live
     
     def selfConsistent(self):
         """ Return true if board and units agree on their positions"""
@@ -825,9 +1060,9 @@ class Board:
     def damageCalculate(self, attackEnemies):
         """ Handle damage calculations done on this board by attackEnemies """
 
-        # TODO: this doesn't currently define the order of attacking units.
+        # Attacking units go from left to right.
         summaries = []
-        for enemy in attackEnemies:
+        for enemy in sorted(attackEnemies, key=lambda piece: (piece.column, piece.row)):
             col = enemy.column
             # Find all the units in front of the enemy.
             defendUnits = self._piecesInRegion(offset = [0,col], regionSize = [self.height, enemy.width])
@@ -860,9 +1095,110 @@ class Board:
         self.attackReceived.callHandlers(summaries)
         self._reportPieceUpdates()
     
+    def _positions(self):
+        '''The positions and sizes of the units, sorted by columns.'''
+        unitSorted = sorted(self.units, key = lambda unit: unit.position[1])
+        return [(list(u.position), u.size) for u in unitSorted]
+
     def dumpPosition(self):
         ''''This prints out the board and the sizes of the units.
         Sorted by columns
         '''
-        unitSorted = sorted(self.units, key = lambda unit: unit.position[1])
-        print str([(u.position, str(u.size)) for u in unitSorted])
+        print str([(pos, str(size)) for pos, size in self._positions()])
+
+class BoardSnapshot(object):
+    """An immutable view of a board at the time of Board.snapshot().
+
+    The snapshot can be read from other threads while the board changes
+    (but see Board.snapshot).
+    The pieces themselves are shared with the board (so their positions
+    are the current ones); the positions in the snapshot are the squares
+    that the pieces occupy in its grid.
+    """
+
+    def __init__(self, board):
+        self._board = board
+        self.height = board.height
+        self.width = board.width
+        self.version = board.version
+
+        # The columns that the board has changed since the snapshot was
+        # taken, copied from before the change. The others are still the
+        # board's.
+        self._columns = {}
+        # The set of units, if the board has changed it.
+        self._units = None
+
+    def _copy(self, grid, cols, units):
+        """Keeps the given columns of grid and (if it's not None) the set
+        of units, unless they were copied already. Returns True if
+        nothing is shared with the board any more."""
+        for j in cols:
+            if j not in self._columns:
+                self._columns[j] = grid[:, j].copy()
+        if units is not None and self._units is None:
+            self._units = frozenset(units)
+        return self._units is not None and len(self._columns) == self.width
+
+    def _cell(self, i, j):
+        # The board copies a column before changing it, so if the column
+        # isn't copied after reading the board's, then what we read was
+        # still the old value.
+        unit = self._board.grid[i, j]
+        column = self._columns.get(j)
+        if column is not None:
+            return column[i]
+        return unit
+
+    def column(self, j):
+        """Return a copy of column j (row 0 first)."""
+        unit = self._board.grid[:, j].copy()
+        column = self._columns.get(j)
+        if column is not None:
+            return column.copy()
+        return unit
+
+    def __getitem__(self, item):
+        """Like Board.__getitem__."""
+        i, j = item
+        imax = max(i) if isinstance(i, (tuple, list)) else i
+        jmax = max(j) if isinstance(j, (tuple, list)) else j
+        if imax >= self.height or jmax >= self.width:
+            return None
+        if not isinstance(i, (tuple, list)) and not isinstance(j, (tuple, list)):
+            return self._cell(i, j)
+        rows, cols = np.broadcast_arrays(np.asarray(i), np.asarray(j))
+        ret = np.empty(rows.shape, dtype=object)
+        for k in range(ret.size):
+            ret.flat[k] = self._cell(rows.flat[k], cols.flat[k])
+        return ret
+
+    @property
+    def units(self):
+        """A frozenset of the pieces on the board."""
+        units = frozenset(self._board.units)
+        if self._units is not None:
+            return self._units
+        return units
+
+    @property
+    def boardHeight(self):
+        """Like Board.boardHeight."""
+        heightA = np.zeros(self.width, dtype = 'int8')
+        for j in range(self.width):
+            column = self.column(j)
+            for i in reversed(range(self.height)):
+                if column[i] is not None:
+                    heightA[j] = i+1
+                    break
+        return heightA
+
+    def position(self, piece):
+        """Return the [row, col] of the piece in the snapshot, or None if
+        it wasn't on the board."""
+        for j in range(self.width):
+            column = self.column(j)
+            for i in range(self.height):
+                if column[i] is piece:
+                    return [i, j]
+        return None
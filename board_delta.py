@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Compact binary deltas describing how a board changes.
+
+A BoardDeltaEncoder listens to a board's pieceUpdated event and turns
+every notification into a delta: a list of fixed-size records saying
+which pieces appeared, disappeared or moved. Deltas are queued until the
+consumer (eg. the connection to a remote client) asks for them; if the
+consumer falls behind, the queued notifications are coalesced so that
+each piece goes straight to its latest position.
+"""
+
+import struct
+
+# Flags in the delta records.
+APPEAR = 1
+DISAPPEAR = 2
+MOVE = 4
+# Set on APPEAR records if the new piece replaces (for example, is the
+# charged version of) a piece that disappeared from the same square in
+# the same delta.
+REPLACE = 8
+
+# sequence number, number of records
+_HEADER = struct.Struct('<IH')
+# piece id, flags, old row, old column, new row, new column, type id, color id
+_RECORD = struct.Struct('<IBbbbbBB')
+
+def coalesceStages(stages, isVisible):
+    """Collapses a list of update stages into a single stage.
+
+    Each stage is an iterable of (piece, position) pairs, where position is
+    None if the piece was removed. In the result, every piece only appears
+    once, with its latest position. isVisible(piece) should return True if
+    the consumer of the stages already knows about the piece; pieces that
+    it doesn't know about and that were removed again are dropped.
+    """
+
+    latest = {}
+    for stage in stages:
+        for piece, position in stage:
+            latest[piece] = position
+    return set((p, pos) for p, pos in latest.items()
+               if pos is not None or isVisible(p))
+
+class BoardDeltaEncoder(object):
+    """Encodes the changes to a board as a stream of binary deltas."""
+
+    def __init__(self, board, table=None, maxPending=8):
+        """Starts listening to board.
+
+        table is a TypeTable, used to include the type of the pieces that
+        appear. If there are more than maxPending deltas waiting to be
+        sent, they are coalesced into one.
+
+        The first delta contains all the pieces currently on the board.
+        """
+
+        self.board = board
+        self.table = table
+        self.maxPending = maxPending
+        self.sequence = 0
+        # The stages that haven't been encoded yet.
+        self.pending = []
+
+        # The ids of the pieces that the consumer knows about, and the
+        # positions that it thinks they have.
+        self._ids = {}
+        self._sent = {}
+        self._nextId = 1
+
+        self._updateNotification(board.units)
+        board.pieceUpdated.addHandler(self._updateNotification)
+
+    def close(self):
+        """Stops listening to the board."""
+        self.board.pieceUpdated.removeHandler(self._updateNotification)
+
+    def _isVisible(self, piece):
+        return piece in self._ids
+
+    def _updateNotification(self, pieces):
+        copyPos = lambda pos: None if pos is None else tuple(pos)
+        self.pending.append(set((p, copyPos(p.position)) for p in pieces))
+        if len(self.pending) > self.maxPending:
+            self.pending = [coalesceStages(self.pending, self._isVisible)]
+
+    def hasDelta(self):
+        return bool(self.pending)
+
+    def popDelta(self):
+        """Returns the next delta, or None if there isn't one."""
+
+        if not self.pending:
+            return None
+        return self._encode(self.pending.pop(0))
+
+    def popAll(self):
+        """Returns a single delta covering all the pending changes."""
+
+        stage = coalesceStages(self.pending, self._isVisible)
+        self.pending = []
+        return self._encode(stage)
+
+    def _typeOf(self, piece):
+        if self.table is None:
+            return (0, 0)
+        return self.table.encode(piece)
+
+    def _encode(self, stage):
+        gone = []
+        changed = []
+        for piece, position in stage:
+            if position is None:
+                if piece in self._ids:
+                    gone.append(piece)
+            elif piece not in self._ids or self._sent[self._ids[piece]] != position:
+                changed.append((piece, position))
+
+        records = []
+        vacated = set()
+        for piece in gone:
+            pid = self._ids.pop(piece)
+            old = self._sent.pop(pid)
+            vacated.add(old)
+            records.append((pid, DISAPPEAR, old[0], old[1], -1, -1, 0, 0))
+
+        for piece, position in changed:
+            typeId, colorId = self._typeOf(piece)
+            if piece in self._ids:
+                pid = self._ids[piece]
+                old = self._sent[pid]
+                records.append((pid, MOVE, old[0], old[1],
+                                position[0], position[1], typeId, colorId))
+            else:
+                pid = self._nextId
+                self._nextId += 1
+                self._ids[piece] = pid
+                flags = APPEAR
+                if position in vacated:
+                    flags |= REPLACE
+                records.append((pid, flags, -1, -1,
+                                position[0], position[1], typeId, colorId))
+            self._sent[pid] = position
+
+        records.sort()
+        self.sequence += 1
+        parts = [_HEADER.pack(self.sequence, len(records))]
+        parts.extend(_RECORD.pack(*r) for r in records)
+        return ''.join(parts)
+
+def decodeDelta(data):
+    """Decodes a delta.
+
+    Returns a pair (sequence, records) where each record is a tuple
+    (pieceId, flags, oldPosition, newPosition, typeId, colorId); positions
+    are (row, column) pairs, or None.
+    """
+
+    sequence, count = _HEADER.unpack_from(data, 0)
+    records = []
+    for i in range(count):
+        (pid, flags, oldRow, oldCol, newRow, newCol,
+         typeId, colorId) = _RECORD.unpack_from(data, _HEADER.size + i * _RECORD.size)
+        old = None if oldRow < 0 else (oldRow, oldCol)
+        new = None if newRow < 0 else (newRow, newCol)
+        records.append((pid, flags, old, new, typeId, colorId))
+    return sequence, records
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Random boards, for benchmarks and tests.
+
+generateBoard makes a board from a seed: the same seed and parameters
+always give the same board. The boards are already normalized (normalize
+doesn't change them), so they look like boards that came up in a game:
+walls at the front, then the charging units, then the other units, with
+no formations left to make.
+
+The pieces are placed directly with addPieceAtPosition. Instead of
+normalizing, every placement is checked against the formation rules of
+the pieces around it, and rejected if it would make a formation.
+"""
+
+import numpy as np
+
+from board import Board
+from wall import Wall
+
+def generateBoard(player, seed, height=6, width=8, density=0.6,
+                  fattyRatio=0.1, chargedRatio=0.1, wallDensity=0.1,
+                  unitNames=None):
+    """Returns a random normalized board.
+
+    Params:
+        player owns the units, and its unitFactory creates them.
+        density is the fraction of the squares that are filled (the
+            board may end up emptier, if no more pieces fit).
+        fattyRatio is the fraction of the units that are 2x2.
+        chargedRatio is the fraction of the filled squares that hold
+            charging units.
+        wallDensity is the fraction of the columns that have a wall.
+        unitNames are the names of the units to choose from (all the
+            units of the factory, by default).
+    """
+
+    random = np.random.RandomState(seed)
+    factory = player.unitFactory
+    if unitNames is None:
+        unitNames = sorted(factory.descriptions)
+    skinnyNames = [n for n in unitNames if _size(factory, n) == (1, 1)]
+    fattyNames = [n for n in unitNames if _size(factory, n) != (1, 1)]
+    colors = player.baseColor
+
+    board = Board(height, width)
+    heights = [0] * width
+
+    for col in range(width):
+        if random.uniform() < wallDensity:
+            _place(board, heights, Wall(player.wallDescription, None), col)
+
+    target = int(density * height * width)
+    chargedTarget = int(chargedRatio * target)
+
+    def randomUnit():
+        if fattyNames and (not skinnyNames or random.uniform() < fattyRatio):
+            name = fattyNames[random.randint(len(fattyNames))]
+        else:
+            name = skinnyNames[random.randint(len(skinnyNames))]
+        return factory.create(name, colors[random.randint(len(colors))], player=player)
+
+    # The charging units go first, since they slide in front of the
+    # other units. Placements keep failing once the board is (nearly)
+    # full, so we stop after a few failures in a row.
+    charged = 0
+    failures = 0
+    while charged < chargedTarget and failures < width:
+        unit = randomUnit()
+        unit.position = [0, 0]
+        piece = unit.charge()
+        piece.turn = random.randint(1, piece.maxTurns + 1)
+        piece.toughness = piece.defaultChargeAtTurn(piece.turn)
+        col = _randomColumn(board, heights, piece, random)
+        if col is None or _merges(board, heights, piece, col):
+            failures += 1
+            continue
+        _place(board, heights, piece, col)
+        board.currentAttacks.add(piece)
+        charged += piece.height * piece.width
+        failures = 0
+
+    failures = 0
+    while sum(heights) < target and failures < width:
+        unit = randomUnit()
+        col = _randomColumn(board, heights, unit, random)
+        if col is None:
+            failures += 1
+            continue
+        # Try the other colors before giving up on the column.
+        start = random.randint(len(colors))
+        for i in range(len(colors)):
+            unit.color = colors[(start + i) % len(colors)]
+            _place(board, heights, unit, col)
+            if not _makesFormation(board, unit):
+                failures = 0
+                break
+            _unplace(board, heights, unit)
+        else:
+            failures += 1
+
+    # Forget about the pieces having been added, so that the first
+    # normalize has nothing to report.
+    board._reportPieceUpdates()
+    return board
+
+def _size(factory, name):
+    desc = factory.descriptions[name]
+    return (int(desc.get('height', 1)), int(desc.get('width', 1)))
+
+def _randomColumn(board, heights, piece, random):
+    """Returns a random column where the piece fits, or None.
+
+    Pieces that are more than one square wide only fit where the columns
+    under them are equally high, so that they don't need aligning.
+    """
+
+    tall, fat = piece.size
+    cols = [c for c in range(board.width - fat + 1)
+            if heights[c] + tall <= board.height and
+            all(heights[c + k] == heights[c] for k in range(1, fat))]
+    if not cols:
+        return None
+    return cols[random.randint(len(cols))]
+
+def _place(board, heights, piece, col):
+    board.addPieceAtPosition(piece, heights[col], col)
+    for k in range(piece.width):
+        heights[col + k] += piece.height
+
+def _unplace(board, heights, piece):
+    col = piece.position[1]
+    board._deletePiece(piece)
+    for k in range(piece.width):
+        heights[col + k] -= piece.height
+
+def _merges(board, heights, piece, col):
+    """Checks whether the piece would merge with one in front of it.
+
+    This follows Board._mergeWalls, which looks for the piece on top of
+    every square of a piece (not just the last one), so a piece can merge
+    with one that isn't directly in front of it.
+    """
+
+    for k in range(piece.width):
+        top = heights[col + k]
+        for row in range(top):
+            front = board.grid[row, col + k]
+            if (front is not None and row + front.height >= top and
+                    row + front.height < top + piece.height and
+                    front.canMerge(piece)):
+                return True
+    return False
+
+def _makesFormation(board, piece):
+    """Checks whether a piece that was just placed completes a charging
+    formation or a wall.
+
+    Only the pieces whose charging or transforming regions can reach the
+    new piece are checked: charging regions are at most 2 squares deep and
+    start right behind a piece at most 2 squares tall, and transforming
+    regions are at most 2 squares wide. The regions are the same as in
+    Board._chargeFull and Board._transformFull, but read straight from the
+    grid, since this runs for every piece.
+    """
+
+    row, col = piece.position
+    grid = board.grid
+    nearby = set(grid[max(0, row - 3):(row + piece.height),
+                      max(0, col - 2):(col + piece.width)].flat)
+    nearby.discard(None)
+    for x in nearby:
+        xRow, xCol = x.position
+        height, width = x.chargingRegion()
+        if _regionFull(grid, xRow + x.height, xCol, height, width, x.canCharge):
+            return True
+        height, width = x.transformingRegion()
+        if _regionFull(grid, xRow, xCol + x.width, height, width, x.canTransform):
+            return True
+    return False
+
+def _regionFull(grid, row, col, height, width, accepts):
+    """Checks whether a region is full of pieces that are all accepted."""
+
+    if (height == 0 or width == 0 or
+            row + height > grid.shape[0] or col + width > grid.shape[1]):
+        return False
+    pieces = set(grid[row:(row + height), col:(col + width)].flat)
+    return None not in pieces and all(accepts(p) for p in pieces)
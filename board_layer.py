@@ -3,32 +3,70 @@
 import cocos
 import logging
 import pyglet
+from pyglet.gl import *
+from pyglet.graphics import Batch, OrderedGroup
 from piece_layer import PieceLayer
 from board_position_layer import BoardPositionLayer
+from object_pool import KeyedPool
+from timeline import Timeline
+from board_delta import coalesceStages
+from event_hook import EventHook
 from cocos.actions.interval_actions import MoveTo
-from cocos.layer.util_layers import ColorLayer
+
+# The board's background is drawn below all the pieces.
+BOARD_GROUP = OrderedGroup(-1)
+
+def slide(node, position, duration):
+    """Moves a node to position over duration seconds (or straight away,
+    if the duration is 0)."""
+
+    if duration > 0:
+        node.do(MoveTo(position, duration))
+    else:
+        node.stop()
+        node.position = position
 
 class BoardLayer(BoardPositionLayer):
     """The visual representation of a Board."""
 
-    def __init__(self, board, pieceHeight, pieceWidth, reflect):
+    def __init__(self, board, pieceHeight, pieceWidth, reflect, maxPooled=16,
+                 timeline=None, maxQueuedStages=8):
         """Construct a BoardLayer.
 
         board is the instance of Board that we visually represent.
         pieceHeight and pieceWidth are dimensions of the pieces (in pixels)
         reflect is False if the board should be displayed with row 0 at
             the top.
+        maxPooled is the number of unused piece layers of each kind that
+            are kept around for reuse.
+        timeline is the Timeline that runs the animation stages; by
+            default, the board has one of its own.
+        maxQueuedStages is the number of animation stages that can wait
+            (eg. while the board is frozen) before they are coalesced.
         """
 
         super(BoardLayer, self).__init__(pieceHeight, pieceWidth, reflect)
 
         self.board = board
         self.pieceLayers = {}
-        self.bgLayer = ColorLayer(255, 255, 255, 80,
-                                  width=(pieceWidth * board.width),
-                                  height=(pieceHeight * board.height))
-        self.add(self.bgLayer)
 
+        # All the pieces (and the background) are drawn through one batch,
+        # using textures from the shared atlases.
+        self.batch = Batch()
+        width = pieceWidth * board.width
+        height = pieceHeight * board.height
+        self.bgVertices = self.batch.add(4, GL_QUADS, BOARD_GROUP,
+                ('v2i', (0, 0, 0, height, width, height, width, 0)),
+                ('c4B', (255, 255, 255, 80) * 4))
+
+        # Piece layers that aren't in use, keyed by the size and image of
+        # their pieces. Charging or transforming a unit replaces it by a
+        # new piece, so this saves creating lots of layers (and sprites).
+        self.pool = KeyedPool(maxPooled)
+
+        if timeline is None:
+            timeline = Timeline(pyglet.clock)
+        self.timeline = timeline
         self.slideTime = 0.2
         self.chargeTime = 0.2
         self.pauseTime = 0.1
@@ -36,10 +74,17 @@ class BoardLayer(BoardPositionLayer):
         # animation stages: sliding pieces, creating new pieces, sliding pieces
         # again, etc.  The animationQueue has the list of animation stages
         # that are yet to be animated.  Each entry is a set of (piece, position)
-        # pairs to be updated at that stage.
+        # pairs to be updated at that stage. If the queue gets longer than
+        # maxQueuedStages, it is collapsed into a single stage that moves
+        # every piece straight to its latest position.
         self.animationQueue = []
+        self.maxQueuedStages = maxQueuedStages
         self.isAnimating = False
         self._frozen = False
+
+        # Triggered when an animation stage starts, with the number of
+        # pieces that it animates.
+        self.stageStarted = EventHook()
         
         # Add all the pieces that are currently on the board.
         for p in board.units:
@@ -49,6 +94,26 @@ class BoardLayer(BoardPositionLayer):
         board.pieceUpdated.addHandler(self._updateNotification)
         board.turnBegun.addHandler(self.refreshPieces)
 
+    def teardown(self):
+        """Disconnects the layer from its board and drops its piece
+        layers, so that neither keeps the other alive. The layer can't
+        be used afterwards."""
+
+        self.board.pieceUpdated.removeHandler(self._updateNotification)
+        self.board.turnBegun.removeHandler(self.refreshPieces)
+        self.stageStarted.clearHandlers()
+        # Stages that are already on the timeline do nothing.
+        self._frozen = True
+        self.animationQueue = []
+        for pl in self.pieceLayers.values():
+            pl.stop()
+            self.remove(pl)
+            pl.setBatch(None)
+        self.pieceLayers.clear()
+        for pl in self.pool.free():
+            pl.setBatch(None)
+        self.pool.clear()
+
     def freeze(self):
         """When the board layer is frozen, it no longer attempts to
         animate piece updates."""
@@ -57,7 +122,7 @@ class BoardLayer(BoardPositionLayer):
 
     def unfreeze(self):
         self._frozen = False
-        self._nextAnimationStage(0)
+        self._nextAnimationStage()
 
     def _updateNotification(self, pieces):
         """Called whenever the board is updated."""
@@ -68,23 +133,27 @@ class BoardLayer(BoardPositionLayer):
         piecePositions = [(p, copyPos(p.position)) for p in pieces]
         #logging.debug("Board_layer updating pieces " + str(piecePositions))
         self.animationQueue.append(set(piecePositions))
+        if len(self.animationQueue) > self.maxQueuedStages:
+            self.animationQueue = [coalesceStages(self.animationQueue, self._isVisible)]
         if not self.isAnimating:
             self.isAnimating = True
-            pyglet.clock.schedule_once(self._nextAnimationStage, 0)
+            self.timeline.after(0, self._nextAnimationStage)
 
-    # dt is ignored, but it's needed because of the API to
-    # pyglet.clock.schedule_once
-    def _nextAnimationStage(self, dt):
+    def _isVisible(self, piece):
+        return piece in self.pieceLayers
+
+    def _nextAnimationStage(self):
         if self._frozen:
             return
 
         if self.animationQueue:
             pieces = self.animationQueue.pop(0)
+            self.stageStarted.callHandlers(len(pieces))
             timeout = 0 # time (in s) for this stage to complete
             for p in pieces:
                 timeout = max(timeout, self._updatePiece(*p))
 
-            pyglet.clock.schedule_once(self._nextAnimationStage, timeout + self.pauseTime)
+            self.timeline.after(timeout + self.pauseTime, self._nextAnimationStage)
         else:
             self.isAnimating = False
             # TODO: emit an event?
@@ -122,6 +191,15 @@ class BoardLayer(BoardPositionLayer):
             self._appearPiece(piece, position)
             return self.chargeTime
 
+    def draw(self):
+        super(BoardLayer, self).draw()
+        for pl in self.pieceLayers.values():
+            pl.sync()
+        glPushMatrix()
+        self.transform()
+        self.batch.draw()
+        glPopMatrix()
+
     def hidePiece(self, piece):
         """Hide the specified piece (without removing it from the board)."""
 
@@ -132,11 +210,19 @@ class BoardLayer(BoardPositionLayer):
 
         self.pieceLayers[piece].visible = True
 
-    def _addPieceLayer(self, piece):
-        """Create a PieceLayer from the given piece, add it to my display list
-        and return it."""
+    def _poolKey(self, piece):
+        return (tuple(piece.size), piece.imageName())
 
-        pieceLayer = self.createPieceLayer(piece)
+    def _addPieceLayer(self, piece):
+        """Create a PieceLayer from the given piece (or reuse an old one),
+        add it to my display list and return it."""
+
+        pieceLayer = self.pool.acquire(self._poolKey(piece),
+                                       lambda: self.createPieceLayer(piece, self.batch))
+        # Rebind even if the layer last showed this piece (eg. a piece
+        # that was removed and added back), since releasing it hid it.
+        pieceLayer.setBatch(self.batch)
+        pieceLayer.rebind(piece)
         self.pieceLayers[piece] = pieceLayer
         self.add(pieceLayer)
         return pieceLayer
@@ -165,7 +251,7 @@ class BoardLayer(BoardPositionLayer):
         pl = self.pieceLayers[piece]
         y = self.yAt(position[0], piece.size[0])
         x = self.xAt(position[1])
-        pl.do(MoveTo((x, y), self.slideTime))
+        slide(pl, (x, y), self.timeline.scaled(self.slideTime))
 
     def _warpPiece(self, piece, position):
         """Move a piece instantaneously to a new position."""
@@ -182,6 +268,32 @@ class BoardLayer(BoardPositionLayer):
 
         pl = self.pieceLayers.pop(piece)
         self.remove(pl)
+        self.releasePieceLayer(pl)
+
+    def detachPiece(self, piece):
+        """Removes a piece's layer from the board and returns it.
+
+        The layer is taken out of the board's batch, so that it can be
+        added elsewhere (eg. an attacking unit, which moves across both
+        boards). Give it back with releasePieceLayer when done.
+        """
+
+        pl = self.pieceLayers.pop(piece)
+        self.remove(pl)
+        pl.setBatch(None)
+        return pl
+
+    def releasePieceLayer(self, pl):
+        """Puts a piece layer that is no longer displayed into the pool."""
+
+        pl.stop()
+        if self.pool.release(self._poolKey(pl.piece), pl):
+            # Keep it in the batch, but hidden.
+            pl.setBatch(self.batch)
+            pl.visible = False
+            pl.sync()
+        else:
+            pl.setBatch(None)
 
     def refreshPieces(self):
         """Call refresh on all pieces in the board.
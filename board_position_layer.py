@@ -40,9 +40,12 @@ class BoardPositionLayer(cocos.layer.Layer):
         """The x coordinate of the left edge of the given column."""
         return col * self.pieceWidth
 
-    def createPieceLayer(self, piece):
-        """Create a PieceLayer from the given piece."""
+    def createPieceLayer(self, piece, batch=None):
+        """Create a PieceLayer from the given piece.
+
+        If batch is given, the PieceLayer is drawn as part of that batch.
+        """
 
         return PieceLayer(piece, self.pieceWidth * piece.size[1],
-                                 self.pieceHeight * piece.size[0])
+                                 self.pieceHeight * piece.size[0], batch)
  
@@ -1,13 +1,114 @@
 # -*- coding: utf-8 -*-
 
 from xml_utils import xmlToDict
-from unit import Unit
-from player import Player
+from object_pool import KeyedPool
 
-import xml.etree.ElementTree as ETree
+# Unit, Player and ElementTree are imported when they are first needed,
+# so that tools that only read (cached) descriptions start quickly.
+import cPickle as pickle
+import hashlib
+import logging
+import os
+
+# Compiled descriptions are stored next to the XML file, with this suffix.
+CACHE_SUFFIX = '.cache'
+
+# Bump this whenever the format of the compiled descriptions changes, so
+# that stale caches get ignored.
+CACHE_VERSION = 1
+
+# Compiled descriptions that have already been loaded by this process,
+# indexed by the absolute path of the XML file. Each entry is a pair
+# (mtime, descriptions).
+_loaded = {}
+
+def _convertNumbers(desc):
+    """Returns a copy of desc with integer-valued strings turned into ints."""
+
+    if isinstance(desc, dict):
+        return dict((k, _convertNumbers(v)) for k, v in desc.items())
+    if isinstance(desc, list):
+        return [_convertNumbers(v) for v in desc]
+    if isinstance(desc, basestring):
+        try:
+            return int(desc)
+        except ValueError:
+            return desc
+    return desc
+
+def compileDescriptions(descriptionFile):
+    """Parses an XML description file.
+
+    Returns a dictionary of descriptions, indexed by their names, in which
+    all the numeric fields have already been converted to ints.
+    """
+
+    import xml.etree.ElementTree as ETree
+    root = ETree.parse(descriptionFile).getroot()
+    descriptions = {}
+    for c in root:
+        desc = _convertNumbers(xmlToDict(c))
+        descriptions[desc['name']] = desc
+    return descriptions
+
+def loadDescriptions(descriptionFile):
+    """Returns the compiled descriptions in descriptionFile.
+
+    The XML file is only parsed if neither this process nor the on-disk
+    cache (stored next to the XML file) has an up-to-date compiled version.
+    The cache is keyed by the modification time of the XML file and,
+    if that has changed, by a hash of its contents.
+    """
+
+    path = os.path.abspath(descriptionFile)
+    mtime = os.path.getmtime(path)
+    if path in _loaded and _loaded[path][0] == mtime:
+        return _loaded[path][1]
+
+    cachePath = path + CACHE_SUFFIX
+    cache = None
+    try:
+        with open(cachePath, 'rb') as f:
+            cache = pickle.load(f)
+        if cache.get('version') != CACHE_VERSION:
+            cache = None
+    except Exception:
+        # A missing or corrupted cache just means that we recompile.
+        cache = None
+
+    if cache is not None and cache['mtime'] == mtime:
+        descriptions = cache['descriptions']
+    else:
+        with open(path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+
+        # If only the mtime changed (eg. because the file was checked out
+        # again), we can keep the compiled descriptions.
+        if cache is not None and cache['hash'] == digest:
+            descriptions = cache['descriptions']
+        else:
+            descriptions = compileDescriptions(path)
+
+        cache = {'version': CACHE_VERSION,
+                 'mtime': mtime,
+                 'hash': digest,
+                 'descriptions': descriptions}
+        try:
+            with open(cachePath, 'wb') as f:
+                pickle.dump(cache, f, pickle.HIGHEST_PROTOCOL)
+        except (IOError, OSError):
+            logging.warning('Could not write description cache %s' % cachePath)
+
+    _loaded[path] = (mtime, descriptions)
+    return descriptions
 
 class DescribedObjectFactory(object):
     """Factory for creating objects according to an XML description."""
+
+    # A list of (field, type) pairs that every description must have.
+    # Fields of nested descriptions are separated by slashes.
+    requiredFields = [('name', basestring)]
+
     def __init__(self, constructor, descriptionFile):
         """
             constructor is a function that creates an object from
@@ -16,31 +117,100 @@ class DescribedObjectFactory(object):
                 the various objects that can be created.
         """
         self.constructor = constructor
-        root = ETree.parse(descriptionFile).getroot()
-        units = [xmlToDict(c) for c in root]
-        
-        # Enter the units into a dictionary, indexed by their names.
-        self.descriptions = {}
-        for u in units:
-            self.descriptions[u['name']] = u
-    
+
+        # The descriptions, indexed by their names. They may be shared
+        # with other factories, so they should not be modified.
+        self.descriptions = loadDescriptions(descriptionFile)
+        for desc in self.descriptions.values():
+            self._validate(desc)
+
+        # Objects given back with release, keyed by name, for create to
+        # reuse.
+        self.pool = KeyedPool()
+
+    def _validate(self, desc):
+        """Raises ValueError if desc is missing a required field."""
+
+        for field, fieldType in self.requiredFields:
+            val = desc
+            for key in field.split('/'):
+                if not isinstance(val, dict) or key not in val:
+                    raise ValueError('Description of "%s" is missing field "%s"'
+                                     % (desc.get('name'), field))
+                val = val[key]
+            if not isinstance(val, fieldType):
+                raise ValueError('Field "%s" of "%s" has the wrong type: %r'
+                                 % (field, desc.get('name'), val))
+
     def create(self, name, *args, **kwargs):
         """Creates a new object.
-        
+
         The characteristics of the object are determined by its description
         in the configuration file. Any additional arguments will be
         passed to the object's constructor."""
-        
+
         if name not in self.descriptions:
             raise ValueError('Did not find an object named "%s"' % name)
 
-        return self.constructor(self.descriptions[name], *args, **kwargs)
+        desc = self.descriptions[name]
+        def reset(obj):
+            # Start over from an empty object, as if it was new.
+            obj.__dict__.clear()
+            type(obj).__init__(obj, desc, *args, **kwargs)
+        return self.pool.acquire(name, lambda: self.constructor(desc, *args, **kwargs),
+                                 reset)
+
+    def release(self, obj):
+        """Gives back an object that was made by create, so that create
+        can reuse it. Nothing else may use the object afterwards.
+
+        Returns False if the object can't be reused (because it wasn't
+        made by this factory, eg. a charged unit, or the pool is full).
+        """
+
+        desc = getattr(obj, 'description', None)
+        name = desc.get('name') if isinstance(desc, dict) else None
+        if desc is None or self.descriptions.get(name) is not desc:
+            return False
+        obj.__dict__.clear()
+        return self.pool.release(name, obj)
+
+def _createUnit(*args, **kwargs):
+    from unit import Unit
+    return Unit(*args, **kwargs)
+
+def _createPlayer(*args, **kwargs):
+    from player import Player
+    return Player(*args, **kwargs)
 
 class UnitFactory(DescribedObjectFactory):
+    requiredFields = [('name', basestring),
+                      ('toughness', int),
+                      ('height', int),
+                      ('width', int),
+                      ('imageBase', basestring),
+                      ('charge/name', basestring),
+                      ('charge/height', int),
+                      ('charge/width', int),
+                      ('charge/initialPower', int),
+                      ('charge/maxPower', int),
+                      ('charge/turns', int),
+                      ('charge/imageBase', basestring)]
+
     def __init__(self, descriptionFile):
-        super(UnitFactory, self).__init__(Unit, descriptionFile)
+        super(UnitFactory, self).__init__(_createUnit, descriptionFile)
 
 class PlayerFactory(DescribedObjectFactory):
-    def __init__(self, descriptionFile):
-        super(PlayerFactory, self).__init__(Player, descriptionFile)
+    requiredFields = [('name', basestring),
+                      ('race', basestring),
+                      ('maxLife', int),
+                      ('maxMoves', int),
+                      ('maxMana', int),
+                      ('maxUnitTotal', int),
+                      ('manaFactor', dict),
+                      ('wall/image', basestring),
+                      ('wall/toughness', int),
+                      ('wall/maxToughness', int)]
 
+    def __init__(self, descriptionFile):
+        super(PlayerFactory, self).__init__(_createPlayer, descriptionFile)
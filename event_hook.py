@@ -1,18 +1,104 @@
+import timeit
+import weakref
+
+class _WeakHandler(object):
+    """Calls a handler without keeping it (or, for a bound method, the
+    object it is bound to) alive."""
+
+    def __init__(self, handler, callback):
+        if getattr(handler, 'im_self', None) is not None:
+            self._ref = weakref.ref(handler.im_self, callback)
+            self._func = handler.im_func
+        else:
+            self._ref = weakref.ref(handler, callback)
+            self._func = None
+
+    def target(self):
+        """Returns the handler, or None if it has been garbage collected."""
+
+        obj = self._ref()
+        if obj is None or self._func is None:
+            return obj
+        return self._func.__get__(obj, type(obj))
+
+    @property
+    def dead(self):
+        return self._ref() is None
+
+    def __call__(self, *args, **kwargs):
+        handler = self.target()
+        if handler is not None:
+            handler(*args, **kwargs)
+
+    def __eq__(self, other):
+        if isinstance(other, _WeakHandler):
+            other = other.target()
+        handler = self.target()
+        return handler is not None and handler == other
+
+    def __ne__(self, other):
+        return not self == other
+
 class EventHook(object):
     """A class for managing event handlers.
+
+    Handlers are called in the order in which they were added. Adding a
+    handler that is already there does nothing.
     """
+
+    # If this is set (eg. to a perf_stats.PerfStats), every handler call
+    # of every hook is timed: profiler.handlerStarted(handler) is called
+    # before it and profiler.handlerCalled(handler, seconds) after it. The
+    # time of a handler includes the handlers that it triggers in turn.
+    profiler = None
+
     def __init__(self):
-        self._handlers = set()
-        
+        self._handlers = []
+
     def addHandler(self, handler):
-        self._handlers.add(handler)
-        
+        if handler not in self._handlers:
+            self._handlers.append(handler)
+
+    def addWeakHandler(self, handler):
+        """Adds a handler that doesn't keep anything alive: a bound method
+        is dropped when its object is garbage collected, and any other
+        function when the function is. (So don't pass a lambda, unless
+        something else keeps it.)"""
+
+        if handler not in self._handlers:
+            hookRef = weakref.ref(self)
+            def collected(ref):
+                hook = hookRef()
+                if hook is not None:
+                    hook._removeDeadHandlers()
+            self._handlers.append(_WeakHandler(handler, collected))
+
+    def _removeDeadHandlers(self):
+        # Make a new list, in case the handlers are being called.
+        self._handlers = [h for h in self._handlers
+                          if not (isinstance(h, _WeakHandler) and h.dead)]
+
     def removeHandler(self, handler):
         self._handlers.remove(handler)
-        
+
     def clearHandlers(self):
-        self._handlers.clear()
-        
+        del self._handlers[:]
+
     def callHandlers(self, *args, **kwargs):
+        if EventHook.profiler is not None:
+            return self._callProfiled(EventHook.profiler, args, kwargs)
         for h in self._handlers:
             h(*args, **kwargs)
+
+    def _callProfiled(self, profiler, args, kwargs):
+        for h in self._handlers:
+            if isinstance(h, _WeakHandler):
+                h = h.target()
+                if h is None:
+                    continue
+            profiler.handlerStarted(h)
+            start = timeit.default_timer()
+            try:
+                h(*args, **kwargs)
+            finally:
+                profiler.handlerCalled(h, timeit.default_timer() - start)
@@ -0,0 +1,467 @@
+# -*- coding: utf-8 -*-
+"""
+Differential fuzzing of board engines.
+
+A faster implementation of the board rules has to behave exactly like
+board.Board. The fuzzer checks this by starting the reference Board and
+a candidate engine from the same random board (see board_generator.py),
+playing the same random actions on both, and comparing the pieces, the
+events and the AttackSummary lists after every step.
+
+When the engines disagree, the failing case is shrunk: actions and pieces
+are dropped for as long as the engines still disagree. If the divergence
+comes down to a single normalize, the result is written in the format of
+test_board_configurations.json, with the reference engine's board as the
+expected end configuration, and can be pasted in there. Otherwise the
+remaining actions are saved with it, in a file ending in .replay.json;
+TestBoardConfigurations would ignore those actions, so such a case can
+only be rerun with --replay.
+
+    python fuzz_board.py --candidate fast_board:FastBoard --trials 10000
+
+The candidate is given as module:Class; the class is constructed as
+Class(height, width), and it needs the same interface as Board.
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import sys
+
+import numpy as np
+
+from board import Board
+from charging_unit import ChargingUnit
+from described_object_factory import UnitFactory, PlayerFactory
+from wall import Wall
+import board_generator
+
+# The board sizes, as (height, width).
+SIZES = [(6, 8), (8, 8), (12, 10)]
+
+# The piece attributes that are compared, and saved in configurations.
+PIECE_KEYS = ['name', 'color', 'size', 'toughness', 'turn', 'maxPower', 'maxToughness']
+
+def loadClass(spec):
+    """Returns the class named by a 'module:Class' string."""
+
+    moduleName, className = spec.split(':')
+    return getattr(importlib.import_module(moduleName), className)
+
+def pieceToJSON(piece):
+    """Describes a piece, in the format of test_board_configurations.json."""
+
+    desc = {'position': list(piece.position)}
+    for key in PIECE_KEYS:
+        if hasattr(piece, key):
+            val = getattr(piece, key)
+            desc[key] = list(val) if isinstance(val, tuple) else val
+    return desc
+
+def boardToJSON(board):
+    return sorted((pieceToJSON(p) for p in board.units),
+                  key=lambda d: (d['position'][1], d['position'][0]))
+
+def addJSONPiece(board, pieceDesc, unitFactory, player):
+    """Creates a piece from a JSON description and adds it to the board.
+
+    The piece is a unit by default. Walls are named 'Wall', and charging
+    units are named after the charged form of a unit (eg. 'Swordsman
+    Charged'); these are added to the board's attacks. The other keys are
+    set as attributes of the piece.
+    """
+
+    position = pieceDesc['position']
+    name = pieceDesc.get('name', 'Swordsman')
+    color = pieceDesc.get('color', 'blue')
+    if name in unitFactory.descriptions:
+        piece = unitFactory.create(name, color, player)
+    elif name == 'Wall':
+        piece = Wall(player.wallDescription, None)
+    else:
+        baseNames = [n for n, desc in unitFactory.descriptions.items()
+                     if desc['charge']['name'] == name]
+        if not baseNames:
+            raise ValueError('Unknown piece %s' % name)
+        unit = unitFactory.create(baseNames[0], color, player)
+        unit.position = list(position)
+        piece = unit.charge()
+
+    for key, val in pieceDesc.items():
+        if key == 'position': continue
+        #we want size to be a tuple
+        if key == 'size':
+            piece.size = tuple(val)
+        else:
+            setattr(piece, key, val)
+
+    board.addPieceAtPosition(piece, position[0], position[1])
+    if isinstance(piece, ChargingUnit):
+        board.currentAttacks.add(piece)
+    return piece
+
+def describePiece(piece):
+    position = None if piece.position is None else tuple(piece.position)
+    return (position,) + tuple(getattr(piece, key, None) for key in PIECE_KEYS)
+
+def describePieces(pieces):
+    return sorted(describePiece(p) for p in pieces)
+
+def describeSummaries(summaries):
+    return [(describePiece(s.attacker),
+             [(None if a.defender is None else describePiece(a.defender),
+               a.damageDealt, a.defenderDead) for a in s.attacks])
+            for s in summaries]
+
+class Engine(object):
+    """A board, with a record of the events that it emits."""
+
+    def __init__(self, boardClass, config, unitFactory, player, seed):
+        self.unitFactory = unitFactory
+        self.player = player
+        height, width = config['dimensions']
+        self.board = boardClass(height, width)
+        for pieceDesc in config['startConfig']:
+            addJSONPiece(self.board, pieceDesc, unitFactory, player)
+        self.board.random = np.random.RandomState(seed)
+
+        self.events = []
+        b = self.board
+        b.pieceUpdated.addHandler(lambda pieces: self._record('pieceUpdated', describePieces(pieces)))
+        b.attackMade.addHandler(lambda pieces: self._record('attackMade', describePieces(pieces)))
+        b.wallMade.addHandler(lambda args: self._record('wallMade', describePieces(args[0]), args[1]))
+        b.fusionMade.addHandler(lambda *args: self._record('fusionMade'))
+        b.attackNow.addHandler(lambda pieces: self._record('attackNow', describePieces(pieces)))
+        b.attackReceived.addHandler(lambda summaries: self._record('attackReceived', describeSummaries(summaries)))
+        b.turnBegun.addHandler(lambda: self._record('turnBegun'))
+
+    def _record(self, *event):
+        self.events.append(event)
+
+    def unit(self, name, color):
+        return self.unitFactory.create(name, color, self.player)
+
+    def apply(self, action):
+        """Performs an action, and returns what happened: the result, the
+        events, and the state of the board afterwards.
+
+        An exception counts as a result; the board is unusable after it.
+        """
+
+        self.events = []
+        try:
+            result = self._apply(action)
+        except Exception, e:
+            return ('error', type(e).__name__), self.events, None
+        state = (describePieces(self.board.units),
+                 describePieces(self.board.currentAttacks))
+        return result, self.events, state
+
+    def _apply(self, action):
+        b = self.board
+        kind = action[0]
+        if kind == 'normalize':
+            b.normalize()
+        elif kind == 'add':
+            name, color, col = action[1:]
+            unit = self.unit(name, color)
+            if not b.canAddPiece(unit, col):
+                return 'skipped'
+            b.addPiece(unit, col)
+            b.normalize()
+        elif kind == 'delete':
+            piece = b[action[1], action[2]]
+            if piece is None:
+                return 'skipped'
+            b.deletePiece(piece)
+        elif kind == 'move':
+            piece = b[action[1], action[2]]
+            if piece is None:
+                return 'skipped'
+            b.movePiece(piece, action[3])
+        elif kind == 'colToAdd':
+            return b.colToAdd(self.unit(action[1], action[2]))
+        elif kind == 'beginTurn':
+            b.beginTurn()
+        elif kind == 'damage':
+            attackers = []
+            for name, color, col in action[1]:
+                unit = self.unit(name, color)
+                unit.position = [0, col]
+                attacker = unit.charge()
+                attacker.turn = 0
+                attackers.append(attacker)
+            b.damageCalculate(attackers)
+        else:
+            raise ValueError('Unknown action %s' % kind)
+        return None
+
+class Fuzzer(object):
+    def __init__(self, candidate, reference=Board):
+        self.candidate = candidate
+        self.reference = reference
+        self.unitFac = UnitFactory('unit_descriptions.xml')
+        self.playerFac = PlayerFactory('player_descriptions.xml')
+        self.player = self.playerFac.create('Camel', self.unitFac,
+                baseWeights=[1, 1, 1], baseNames=['Archer', 'Swordsman', 'Swordsman'],
+                specialWeights=[10], specialNames=['Angel'], specialRarity=[3])
+        self.unitNames = sorted(self.unitFac.descriptions)
+
+    def randomConfig(self, random):
+        height, width = SIZES[random.randint(len(SIZES))]
+        board = board_generator.generateBoard(self.player, random.randint(2 ** 31),
+                height, width, density=random.uniform(0, 0.8),
+                fattyRatio=random.uniform(0, 0.4), chargedRatio=random.uniform(0, 0.3),
+                wallDensity=random.uniform(0, 0.5))
+        return {'dimensions': [height, width], 'startConfig': boardToJSON(board)}
+
+    def randomAction(self, random, board):
+        colors = self.player.baseColor
+        def randomUnit():
+            return (self.unitNames[random.randint(len(self.unitNames))],
+                    colors[random.randint(len(colors))])
+        def randomPiece():
+            pieces = sorted(board.units, key=lambda p: p.position)
+            return pieces[random.randint(len(pieces))].position
+
+        choice = random.randint(10)
+        if choice < 4:
+            return ('add',) + randomUnit() + (random.randint(board.width),)
+        if choice < 5 and board.units:
+            return ('delete',) + tuple(randomPiece())
+        if choice < 7 and board.units:
+            return ('move',) + tuple(randomPiece()) + (random.randint(board.width),)
+        if choice < 8:
+            return ('colToAdd',) + randomUnit()
+        if choice < 9:
+            return ('beginTurn',)
+        attackers = []
+        col = random.randint(board.width)
+        while col < board.width - 1 and len(attackers) < 3:
+            name, color = randomUnit()
+            attackers.append((name, color, col))
+            col += 2 + random.randint(3)
+        return ('damage', attackers)
+
+    def engines(self, config, seed):
+        return (Engine(self.reference, config, self.unitFac, self.player, seed),
+                Engine(self.candidate, config, self.unitFac, self.player, seed))
+
+    def trial(self, seed, steps):
+        """Plays random actions on both engines.
+
+        Returns None if they agree, or a failing case: a dict with the
+        starting configuration, the seed of the boards' random number
+        generators, and the actions up to the first disagreement.
+        """
+
+        random = np.random.RandomState(seed)
+        config = self.randomConfig(random)
+        reference, candidate = self.engines(config, seed)
+        actions = []
+        for i in range(steps):
+            action = self.randomAction(random, reference.board)
+            actions.append(action)
+            expected = reference.apply(action)
+            if candidate.apply(action) != expected:
+                return dict(config, seed=seed, actions=actions)
+            if expected[2] is None:
+                # Both failed in the same way; the boards are unusable.
+                break
+        return None
+
+    def diverges(self, case):
+        """Returns the index of the first action on which the engines
+        disagree, or None."""
+
+        reference, candidate = self.engines(case, case['seed'])
+        for i, action in enumerate(case['actions']):
+            expected = reference.apply(action)
+            if candidate.apply(action) != expected:
+                return i
+            if expected[2] is None:
+                break
+        return None
+
+    def shrink(self, case):
+        """Returns a smaller version of a failing case.
+
+        If the failure doesn't happen again (eg. the candidate isn't
+        deterministic), the case is returned as it is.
+        """
+
+        case = dict(case)
+        case['actions'] = list(case['actions'])
+        failure = self.diverges(case)
+        if failure is None:
+            logging.warning('seed %d: the failure could not be reproduced, '
+                            'so the case was not shrunk' % case['seed'])
+            return case
+        # Drop the actions after the failure, then as many of the rest as
+        # possible, in ever smaller chunks.
+        case['actions'] = case['actions'][:failure + 1]
+        case = self._shrinkList(case, 'actions')
+
+        # Turn the last action into a plain normalize, if that still fails.
+        normalized = self._asNormalize(case)
+        if normalized is not None:
+            case = normalized
+        return self._shrinkList(case, 'startConfig')
+
+    def _shrinkList(self, case, key):
+        chunk = max(1, len(case[key]) // 2)
+        while chunk >= 1:
+            i = 0
+            while i < len(case[key]):
+                smaller = dict(case)
+                smaller[key] = case[key][:i] + case[key][i + chunk:]
+                if self.diverges(smaller) is not None:
+                    case = smaller
+                else:
+                    i += chunk
+            chunk //= 2
+        return case
+
+    def _asNormalize(self, case):
+        """Converts a case to a single normalize of the board as it was just
+        before the last action (with the last action's piece added,
+        removed or moved). Returns None if the engines agree on that."""
+
+        reference = Engine(self.reference, case, self.unitFac, self.player, case['seed'])
+        for action in case['actions'][:-1]:
+            reference.apply(action)
+        b = reference.board
+        action = case['actions'][-1]
+        kind = action[0]
+        if kind == 'add':
+            unit = reference.unit(action[1], action[2])
+            if not b.canAddPiece(unit, action[3]):
+                return None
+            b._appearPiece(unit, [b.rowToAdd(unit, action[3]), action[3]])
+        elif kind == 'delete' and b[action[1], action[2]] is not None:
+            b._deletePiece(b[action[1], action[2]])
+        elif kind == 'move' and b[action[1], action[2]] is not None:
+            piece = b[action[1], action[2]]
+            if not b.canAddPiece(piece, action[3]):
+                return None
+            b._deleteFromGrid(piece)
+            b.addPiece(piece, action[3])
+        elif kind != 'normalize':
+            return None
+
+        normalized = dict(case, startConfig=boardToJSON(b), actions=[('normalize',)])
+        if self.diverges(normalized) is None:
+            return None
+        return normalized
+
+    def testConfig(self, case):
+        """Returns a shrunk case in the format of test_board_configurations.json,
+        with the reference engine's result as the end configuration."""
+
+        reference = Engine(self.reference, case, self.unitFac, self.player, case['seed'])
+        for action in case['actions']:
+            reference.apply(action)
+        config = {'comment': 'Found by fuzz_board.py (seed %d)' % case['seed'],
+                  'dimensions': case['dimensions'],
+                  'startConfig': case['startConfig'],
+                  'endConfig': boardToJSON(reference.board)}
+        if case['actions'] != [('normalize',)]:
+            config['seed'] = case['seed']
+            config['actions'] = case['actions']
+        return config
+
+_fuzzer = None
+
+def _initWorker(candidateSpec, referenceSpec):
+    global _fuzzer
+    logging.disable(logging.CRITICAL)
+    _fuzzer = Fuzzer(loadClass(candidateSpec), loadClass(referenceSpec))
+
+def _runTrial(args):
+    seed, steps = args
+    try:
+        return seed, _fuzzer.trial(seed, steps)
+    except Exception, e:
+        # A bug in the harness (or an engine that can't even be set up).
+        return seed, {'error': '%s: %s' % (type(e).__name__, e)}
+
+def fuzz(candidateSpec, referenceSpec='board:Board', trials=1000, steps=50,
+         seed=0, jobs=None):
+    """Runs trials in parallel, and returns a list of (seed, failing case)
+    pairs."""
+
+    args = [(seed + i, steps) for i in range(trials)]
+    if jobs == 1:
+        _initWorker(candidateSpec, referenceSpec)
+        try:
+            results = map(_runTrial, args)
+        finally:
+            logging.disable(logging.NOTSET)
+    else:
+        pool = multiprocessing.Pool(jobs, _initWorker, (candidateSpec, referenceSpec))
+        try:
+            results = pool.map(_runTrial, args, chunksize=max(1, trials // 100))
+        finally:
+            pool.terminate()
+    return [(s, case) for s, case in results if case is not None]
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description='Compare a board engine with board.Board.')
+    parser.add_argument('--candidate', default='board:Board',
+                        help='the engine to test, as module:Class')
+    parser.add_argument('--reference', default='board:Board')
+    parser.add_argument('--trials', type=int, default=1000)
+    parser.add_argument('--steps', type=int, default=50,
+                        help='actions per trial (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='the seed of the first trial')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='worker processes (default: one per core)')
+    parser.add_argument('--output', default='fuzz_failures',
+                        help='directory for the shrunk failing cases')
+    parser.add_argument('--replay', help='rerun a saved case, and report whether it still fails')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parseArgs(argv)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    fuzzer = Fuzzer(loadClass(args.candidate), loadClass(args.reference))
+    if args.replay:
+        with open(args.replay) as f:
+            config = json.load(f)
+        case = dict(config, seed=config.get('seed', 0),
+                    actions=[tuple(a) for a in config.get('actions', [['normalize']])])
+        failed = fuzzer.diverges(case) is not None
+        logging.info('%s: %s' % (args.replay, 'still fails' if failed else 'passes'))
+        return 1 if failed else 0
+
+    failures = fuzz(args.candidate, args.reference, args.trials, args.steps,
+                    args.seed, args.jobs)
+    logging.info('%d trials of %d steps, %d failed'
+                 % (args.trials, args.steps, len(failures)))
+    if not failures:
+        return 0
+
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output)
+    for seed, case in failures:
+        if 'error' in case:
+            logging.info('seed %d: %s' % (seed, case['error']))
+            continue
+        config = fuzzer.testConfig(fuzzer.shrink(case))
+        if 'actions' in config:
+            path = os.path.join(args.output, 'seed%d.replay.json' % seed)
+        else:
+            path = os.path.join(args.output, 'seed%d.json' % seed)
+        with open(path, 'w') as f:
+            json.dump(config, f, indent=1, sort_keys=True)
+        logging.info('seed %d: %d pieces, %d actions, saved to %s'
+                     % (seed, len(config['startConfig']),
+                        len(config.get('actions', [])), path))
+    return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,30 +1,20 @@
 import cocos
-from cocos.actions.interval_actions import MoveTo
 import logging
 
-from board_layer import BoardLayer
+from board_layer import BoardLayer, slide
 from selector_layer import SelectorLayer
 from meter_layer import MeterLayer
 from textbox_layer import TextBoxLayer
 from player import Player
+from timeline import Timeline
+from event_hook import EventHook
+import tracing
 import pyglet as pyglet
 
-# See layout.svg for a diagram of all these constants.
-GAME_WIDTH = 1024
-GAME_HEIGHT = 768
+from layout import *
 
-BOARD_WIDTH = 512
-BOARD_HEIGHT = 288
-
-BOARD_GAP = 48
-TOP_MARGIN = (GAME_HEIGHT - 2 * BOARD_HEIGHT - BOARD_GAP) / 2
-BOTTOM_MARGIN = TOP_MARGIN
-
-LEFT_MARGIN = (GAME_WIDTH - BOARD_WIDTH) / 2
-RIGHT_MARGIN = LEFT_MARGIN
-
-# The speed that units move to attack (in seconds per pixel)
-ATTACK_SPEED = 0.003
+# yAt runs for every piece that the board layers place.
+_trace = tracing.getTracer('game_layer.layout')
 
 class PlayerLayers:
     pass
@@ -40,12 +30,22 @@ class GameLayer(cocos.layer.Layer):
     def __init__(self, bottomPlayer, bottomBoard, topPlayer, topBoard, gameManager):
         super(GameLayer, self).__init__()
 
+        # The handlers we add to the game's events, as (hook, handler)
+        # pairs, so that teardown can remove them.
+        self._handlers = []
+
         pieceWidth = BOARD_WIDTH / bottomBoard.width
         pieceHeight = BOARD_HEIGHT / bottomBoard.height
 
+        # All the animations (of both boards, and of the attacks) run on one
+        # timeline. Set its timeScale or fastForward to speed them up.
+        self.timeline = Timeline(pyglet.clock)
+
         # FIXME: rename to topBoardLayer and bottomBoardLayer
-        self.topBoard = BoardLayer(topBoard, pieceHeight, pieceWidth, True)
-        self.bottomBoard = BoardLayer(bottomBoard, pieceHeight, pieceWidth, False)
+        self.topBoard = BoardLayer(topBoard, pieceHeight, pieceWidth, True,
+                                   timeline=self.timeline)
+        self.bottomBoard = BoardLayer(bottomBoard, pieceHeight, pieceWidth, False,
+                                      timeline=self.timeline)
         self.pieceHeight = pieceHeight
         self.pieceWidth = pieceWidth
         self.gameManager = gameManager
@@ -76,16 +76,20 @@ class GameLayer(cocos.layer.Layer):
         self._addPlayerInfo(topPlayer, self.other, False)
 
         # Initialize event handlers.
-        self.gameManager.switchTurn.addHandler(self.switchPlayer)
+        self._connect(self.gameManager.switchTurn, self.switchPlayer)
         # When either board has changed, refresh the appearance of
         # the corresponding selector.
-        topBoard.pieceUpdated.addHandler(
-                lambda x: self.topSelector.refresh())
-        bottomBoard.pieceUpdated.addHandler(
-                lambda x: self.bottomSelector.refresh())
+        self._connect(topBoard.pieceUpdated,
+                      lambda x: self.topSelector.refresh())
+        self._connect(bottomBoard.pieceUpdated,
+                      lambda x: self.bottomSelector.refresh())
+
+        self._connect(topBoard.attackReceived, self.animateAttack)
+        self._connect(bottomBoard.attackReceived, self.animateAttack)
 
-        topBoard.attackReceived.addHandler(self.animateAttack)
-        bottomBoard.attackReceived.addHandler(self.animateAttack)
+        # Triggered with the name of every released key that acts on the
+        # boards (see _actsOnBoard), before the game acts on it.
+        self.keyReleased = EventHook()
 
     def _addPlayerInfo(self, player, playerLayers, isBottomPlayer):
         """Add the player display (life, mana, etc.) layers to the game.
@@ -107,15 +111,15 @@ class GameLayer(cocos.layer.Layer):
                                (0, 0, 255, 255))     # full mana color
         manaMeter.value = player.mana
         self.add(manaMeter)
-        player.manaChanged.addHandler(lambda x: manaMeter.setValue(x))
+        self._connect(player.manaChanged, lambda x: manaMeter.setValue(x))
 
         movesTextBox = TextBoxLayer(player.maxMoves)
         self.add(movesTextBox)
-        player.moveChanged.addHandler(lambda x: movesTextBox.setValue(x))
+        self._connect(player.moveChanged, lambda x: movesTextBox.setValue(x))
 
         unitsTextBox = TextBoxLayer(player.maxUnitTotal)
         self.add(unitsTextBox)
-        player.unitChanged.addHandler(lambda x: unitsTextBox.setValue(x))
+        self._connect(player.unitChanged, lambda x: unitsTextBox.setValue(x))
 
         boardY = BOTTOM_MARGIN
         if not isBottomPlayer:
@@ -131,6 +135,22 @@ class GameLayer(cocos.layer.Layer):
         playerLayers.movesCounter = movesTextBox
         playerLayers.unitsCounter = unitsTextBox
 
+    def _connect(self, hook, handler):
+        hook.addHandler(handler)
+        self._handlers.append((hook, handler))
+
+    def teardown(self):
+        """Disconnects the layers from the game, so that the game's
+        boards and players don't keep them alive."""
+
+        for hook, handler in self._handlers:
+            hook.removeHandler(handler)
+        self._handlers = []
+        self.keyReleased.clearHandlers()
+        self.topBoard.teardown()
+        self.bottomBoard.teardown()
+        self.timeline.clear()
+
     @property
     def currentBoard(self):
         return self.current.selector.board
@@ -176,6 +196,8 @@ class GameLayer(cocos.layer.Layer):
 
         keyName = pyglet.window.key.symbol_string(key)
         logging.debug('key "%s" released' % keyName)
+        if self._actsOnBoard(keyName):
+            self.keyReleased.callHandlers(keyName)
         if keyName == "SPACE": # Pick up or drop the selected piece.
             if self.current.selector.heldPiece is None:
                 self.current.selector.pickUp()
@@ -202,6 +224,15 @@ class GameLayer(cocos.layer.Layer):
         if keyName == "END": # End the turn.
             self.gameManager.endTurn()
 
+    def _actsOnBoard(self, keyName):
+        """Whether on_key_release changes a board for this key (so that
+        an animation follows). Picking up a piece only moves the
+        selector."""
+
+        if keyName == "SPACE":
+            return self.current.selector.heldPiece is not None
+        return keyName in ("RETURN", "BACKSPACE", "END")
+
     def xAt(self, col):
         """Returns the pixel location of the left edge of the given column."""
 
@@ -213,7 +244,8 @@ class GameLayer(cocos.layer.Layer):
         If height is also given, returns the bottom edge of a piece with
         that height, whose y-position is the given row."""
 
-        logging.debug('row %s, height %s' % (row, height))
+        if _trace.enabled:
+            _trace.event('yAt', row=row, height=height)
         if board == self.bottomBoard or board == self.bottomBoard.board:
             return self.bottomBoard.yAt(row, height) + self.bottomBoard.y
         else:
@@ -226,9 +258,9 @@ class GameLayer(cocos.layer.Layer):
         self.bottomBoard.freeze()
         # TODO: disable the selectors, etc.
         self.attackQueue = attackSummaries
-        pyglet.clock.schedule_once(self._nextAttack, 0)
+        self.timeline.after(0, self._nextAttack)
 
-    def _nextAttack(self, dt):
+    def _nextAttack(self):
         # This function is called when the next unit is ready to start
         # attacking.
 
@@ -247,30 +279,33 @@ class GameLayer(cocos.layer.Layer):
         # The attacking unit gets removed from its board layer and added
         # here, because we will animate it across both boards.
         attackPiece = attack.attacker
-        attackPieceLayer = attackBoardLayer.pieceLayers[attackPiece]
-        attackBoardLayer._deletePiece(attackPiece)
+        attackPieceLayer = attackBoardLayer.detachPiece(attackPiece)
         attackPieceLayer.x = self.xAt(attackPiece.oldColumn)
         attackPieceLayer.y = self.yAt(attackBoard, attackPiece.oldRow, attackPiece.height)
         self.add(attackPieceLayer)
         logging.debug('Created attacker at (%d,%d)' % (attackPieceLayer.x, attackPieceLayer.y))
 
         self._currentAttacker = attackPieceLayer
+        self._currentAttackBoardLayer = attackBoardLayer
         self._currentAttackQueue = attack.attacks
-        self._continueAttack(0)
+        self._continueAttack()
 
-    def _continueAttack(self, dt, oldDefender=None):
+    def _continueAttack(self):
         # This function is called when the current attacking unit has
         # run into the previous defender and is ready to
         # move on to the next one.
 
         def cleanupAttack():
             self.remove(self._currentAttacker)
+            # The layer can be reused by the board it came from.
+            self._currentAttackBoardLayer.releasePieceLayer(self._currentAttacker)
             self._currentAttacker = None
+            self._currentAttackBoardLayer = None
             self._currentAttackQueue = None
 
         if not self._currentAttackQueue:
             # The attacker ran out of strength; move on to the next one.
-            pyglet.clock.schedule_once(self._nextAttack, 0)
+            self.timeline.after(0, self._nextAttack)
             cleanupAttack()
             return
 
@@ -307,12 +342,12 @@ class GameLayer(cocos.layer.Layer):
             y = defenderTop
 
         time = ATTACK_SPEED * distance
-        self._currentAttacker.do(MoveTo((x, y), time))
+        slide(self._currentAttacker, (x, y), self.timeline.scaled(time))
 
         logging.debug('Moving on to defender at %s in time %s' % ((x, y), time))
-        pyglet.clock.schedule_once(self._doAttack, time, attack)
+        self.timeline.after(time, self._doAttack, attack)
 
-    def _doAttack(self, dt, attack):
+    def _doAttack(self, attack):
         # This is called when the attacker has just touched the defender.
         if attack.defenderDead:
             self.other.boardLayer._deletePiece(attack.defender)
@@ -321,5 +356,5 @@ class GameLayer(cocos.layer.Layer):
             # Got through to the player.
             self.other.lifeMeter.value -= attack.damageDealt
 
-        self._continueAttack(0)
+        self._continueAttack()
 
@@ -5,7 +5,11 @@ Created on Thu May 17 17:50:36 2012
 @author: tran
 """
 import logging
+import numpy as np
 from event_hook import EventHook
+import tracing
+
+_trace = tracing.getTracer('game_manager.mana')
 
 class GameManager(object):
     """Runs the game.
@@ -15,16 +19,40 @@ class GameManager(object):
 
     Events:
         switchTurn: triggered whenever a player ends their turn.
+        actionTaken: triggered after each action requested by a player
+            (as opposed to actions that the game does automatically, like
+            ending the turn when no moves are left). The handlers get two
+            arguments: the name of the GameManager method and a tuple of
+            arguments that describe the action (see replay.py).
         
     Events handled:
         wallMade, chargeMade, and fusionMade from board:
             this information is used to make free moves and update mana.
     """
 
-    def __init__(self, player1, board1, player2, board2):
+    def __init__(self, player1, board1, player2, board2, seed=None):
+        """Sets up a game.
+
+        If seed is given, the game gets its own random number generator
+        (shared by the players and boards), seeded with it. Otherwise,
+        numpy's global generator is used.
+        """
+
+        self.players = (player1, player2)
+        self.boards = (board1, board2)
+
+        self.random = np.random
+        if seed is not None:
+            self.random = np.random.RandomState(seed)
+            for x in self.players + self.boards:
+                x.random = self.random
+
         self._currentPlayerBoard = (player1, board1)
         self._otherPlayerBoard = (player2, board2)
 
+        # The number of turns that have been ended so far.
+        self.turn = 0
+
         #wall, attack, link and fusion counting fields
         self.numWall = 0
         self.numAttack = 0
@@ -33,27 +61,49 @@ class GameManager(object):
         
         #event emitters
         self.switchTurn = EventHook()
+        self.actionTaken = EventHook()
         
-        #event handlers
-        board1.wallMade.addHandler(self._wallMade)
-        board2.wallMade.addHandler(self._wallMade)
-        board1.attackMade.addHandler(self._attackMade)
-        board2.attackMade.addHandler(self._attackMade)
-        board1.fusionMade.addHandler(self._fusionMade)
-        board2.fusionMade.addHandler(self._fusionMade)
-        player1.justDied.addHandler(self._playerJustDied)
-        player2.justDied.addHandler(self._playerJustDied)
+        #event handlers, as (hook, handler) pairs, so that teardown can
+        #remove them.
+        self._handlers = []
+        for board in self.boards:
+            self._connect(board.wallMade, self._wallMade)
+            self._connect(board.attackMade, self._attackMade)
+            self._connect(board.fusionMade, self._fusionMade)
+        # The players may be reused for other games, so they shouldn't
+        # keep this one alive.
+        for player in self.players:
+            player.justDied.addWeakHandler(self._playerJustDied)
+            self._handlers.append((player.justDied, self._playerJustDied))
         
         # When board1 decides it's time to attack, it will call
         # damageCalculate on board2. Then board2's attackReceived event
         # will trigger with the details of the attack; we listen to it
         # to see if the player took damage.
-        board1.attackNow.addHandler(board2.damageCalculate)
-        board2.attackReceived.addHandler(self._attackReceived)
+        self._connect(board1.attackNow, board2.damageCalculate)
+        self._connect(board2.attackReceived, self._attackReceived)
 
         # And the same for the other board.
-        board2.attackNow.addHandler(board1.damageCalculate)
-        board1.attackReceived.addHandler(self._attackReceived)
+        self._connect(board2.attackNow, board1.damageCalculate)
+        self._connect(board1.attackReceived, self._attackReceived)
+
+    def _connect(self, hook, handler):
+        hook.addHandler(handler)
+        self._handlers.append((hook, handler))
+
+    def teardown(self):
+        """Disconnects the game from its boards and players, and drops
+        the handlers of its own events.
+
+        Call this when the game is over, so that the players (if they
+        are reused) don't keep it, or its boards and pieces, alive.
+        """
+
+        for hook, handler in self._handlers:
+            hook.removeHandler(handler)
+        self._handlers = []
+        self.switchTurn.clearHandlers()
+        self.actionTaken.clearHandlers()
 
     @property
     def currentPlayer(self):
@@ -79,13 +129,19 @@ class GameManager(object):
         Returns True if the move succeeded, and False if it was
         an illegal move.
         """
-        if piece is None:
+        if piece is None or piece.position is None:
+            return False
+        # Only the pieces that the player could pick up can move (the
+        # client checks this too, but actions may come from the network).
+        if self.currentBoard[piece.position] is not piece or not self.canPickUp(piece.position):
             return False
         if piece.position[1] == col: #dropping in the same position
             return False
         if self.currentBoard.canAddPiece(piece, col):
+            row, oldCol = piece.position
             self.currentBoard.movePiece(piece, col)
             self._updateMoves()
+            self.actionTaken.callHandlers('movePiece', (row, oldCol, col))
             return True
         else:
             return False
@@ -102,13 +158,24 @@ class GameManager(object):
 
             self.currentBoard.deletePiece(self.currentBoard[position])
             self._updateMoves(offset = 0)
+            self.actionTaken.callHandlers('deletePiece', tuple(position))
         else:
             logging.debug("Tried to delete an empty square %s" % position)
 
     def canPickUp(self, position):
-        """Checks if the current player can pick up a given piece."""
+        """Checks if the current player can pick up a given piece.
 
-        pass
+        The piece has to be moveable, and on top of one of its columns
+        (like SelectorLayer.pickUp).
+        """
+
+        board = self.currentBoard
+        piece = board[position]
+        if piece is None or not piece.moveable:
+            return False
+        heights = board.boardHeight
+        row, col = piece.position
+        return any(heights[c] == row + piece.height for c in range(col, col + piece.width))
 
     def endTurn(self):
         """Ends the active player's turn.
@@ -117,6 +184,10 @@ class GameManager(object):
         Toggles the current player. 
         Triggers the switchTurn event.
         """
+        self._endTurn()
+        self.actionTaken.callHandlers('endTurn', ())
+
+    def _endTurn(self):
         moveLeft = self.currentPlayer.maxMoves - self.currentPlayer.usedMoves
         if moveLeft > 0:
             self._updateMana("move", moveLeft)
@@ -125,6 +196,7 @@ class GameManager(object):
         tmp = self._currentPlayerBoard
         self._currentPlayerBoard = self._otherPlayerBoard
         self._otherPlayerBoard = tmp
+        self.turn += 1
 
         self.switchTurn.callHandlers()
         #begin the new turn
@@ -152,23 +224,25 @@ class GameManager(object):
         if evt == "useMana": # We should only be here if the mana is full.
             self.currentPlayer.mana = 0
         else:
-            logging.debug('updating mana for event "%s" x%s' % (evt, num))
             factor = 0
             try:
                 factor = self.currentPlayer.manaFactor[evt]
             except KeyError:
                 logging.error('player description missing manaFactor ' + evt)
 
-            logging.debug('increment is %s' % (factor * num))
             self.currentPlayer.mana += factor * num
-            logging.debug('new mana is %s' % self.currentPlayer.mana)
+            if _trace.enabled:
+                _trace.event('update', event=evt, count=num,
+                             increment=factor * num, mana=self.currentPlayer.mana)
             
     def useMana(self):
         """ Use mana if allowed. Return True if can use, False otherwise """
+        used = False
         if self.currentPlayer.mana >= self.currentPlayer.maxMana:
             self._updateMana("useMana", 0)
-            return True
-        return False
+            used = True
+        self.actionTaken.callHandlers('useMana', ())
+        return used
     
     def _fusionMade(self, fusion):
         """Count number of fusions """
@@ -214,7 +288,7 @@ class GameManager(object):
         self.currentPlayer.calledUnit = len(self.currentBoard.units)
         
         if self.currentPlayer.usedMoves == self.currentPlayer.maxMoves:
-            self.endTurn()
+            self._endTurn()
     
     def _attackReceived(self, summaries):
         """Someone was just attacked (but not necessarily damaged).
@@ -275,4 +349,5 @@ class GameManager(object):
 
         if addedPieces:
             self._updateMoves()
+        self.actionTaken.callHandlers('callPieces', ())
 
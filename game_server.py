@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+A server that hosts many games in a single process.
+
+Clients connect over TCP or a Unix socket. Every message, in both
+directions, is a frame: a 2-byte little-endian length followed by the
+payload. The first byte of the payload says what kind of message it is:
+
+    client -> server
+        'J' + session name: join (or create) a game session
+        'A' + action: an action encoded as in replay.py
+    server -> client
+        'S' + seat: the client joined; seat is 0 or 1
+        'D' + board index + delta: a board delta (see board_delta.py)
+        'E' + message: an error
+
+Each client gets its own stream of deltas. If a client stops reading,
+its deltas are coalesced, and the server stops reading its actions until
+it has caught up.
+
+The actions are performed on the server's only thread, so a slow action
+(eg. a long normalize cascade) holds up every other session until it is
+done; SessionStats.maxTime shows how long that can be. Run several
+servers to spread the games over more cores.
+"""
+
+import asynchat
+import asyncore
+import logging
+import socket
+import struct
+import time
+
+from board_delta import BoardDeltaEncoder
+import replay
+
+_LENGTH = struct.Struct('<H')
+
+JOIN = 'J'
+ACTION = 'A'
+SEAT = 'S'
+DELTA = 'D'
+ERROR = 'E'
+
+def encodeFrame(payload):
+    return _LENGTH.pack(len(payload)) + payload
+
+def decodeFrames(data):
+    """Splits data into frames.
+
+    Returns a pair (frames, rest), where rest is the incomplete frame at
+    the end of data (if any).
+    """
+
+    frames = []
+    while len(data) >= _LENGTH.size:
+        length = _LENGTH.unpack_from(data)[0]
+        end = _LENGTH.size + length
+        if len(data) < end:
+            break
+        frames.append(data[_LENGTH.size:end])
+        data = data[end:]
+    return frames, data
+
+class SessionStats(object):
+    """Timing information about the actions in a session."""
+
+    def __init__(self):
+        self.actions = 0
+        self.totalTime = 0.0
+        self.maxTime = 0.0
+
+    def add(self, seconds):
+        self.actions += 1
+        self.totalTime += seconds
+        self.maxTime = max(self.maxTime, seconds)
+
+    @property
+    def meanTime(self):
+        if self.actions == 0:
+            return 0.0
+        return self.totalTime / self.actions
+
+class GameSession(object):
+    """A game between two clients."""
+
+    def __init__(self, name, manager, table=None, maxPending=8):
+        self.name = name
+        self.manager = manager
+        self.table = table
+        self.maxPending = maxPending
+        self.stats = SessionStats()
+        # The channels of the two players, indexed by seat.
+        self.seats = [None, None]
+        # For each seat, a list of delta encoders (one per board).
+        self._encoders = [None, None]
+
+    @property
+    def full(self):
+        return None not in self.seats
+
+    def join(self, channel):
+        """Adds a client to the session, and returns its seat."""
+
+        seat = self.seats.index(None)
+        self.seats[seat] = channel
+        self._encoders[seat] = [BoardDeltaEncoder(b, self.table, self.maxPending)
+                                for b in self.manager.boards]
+        channel.sendFrame(SEAT + chr(seat))
+        self.flush(seat)
+        return seat
+
+    def leave(self, channel):
+        seat = self.seats.index(channel)
+        self.seats[seat] = None
+        for encoder in self._encoders[seat]:
+            encoder.close()
+        self._encoders[seat] = None
+
+    @property
+    def empty(self):
+        return self.seats == [None, None]
+
+    def close(self):
+        for channel in self.seats:
+            if channel is not None:
+                self.leave(channel)
+        self.manager.teardown()
+
+    def handleAction(self, channel, data):
+        """Performs an action sent by one of the clients."""
+
+        seat = self.seats.index(channel)
+        try:
+            actions = list(replay.decodeActions(data))
+        except (KeyError, struct.error):
+            channel.sendFrame(ERROR + 'bad action')
+            return
+
+        start = time.time()
+        applied = 0
+        try:
+            for end, name, args in actions:
+                # The turn is checked before every action, since a frame
+                # may end the turn and then carry on.
+                if self.manager.players[seat] is not self.manager.currentPlayer:
+                    channel.sendFrame(ERROR + 'not your turn')
+                    break
+                replay.applyAction(self.manager, name, args)
+                applied += 1
+        except (IndexError, ValueError):
+            channel.sendFrame(ERROR + 'illegal action')
+        if applied:
+            self.stats.add(time.time() - start)
+
+        for s in range(len(self.seats)):
+            self.flush(s)
+
+    def flush(self, seat):
+        """Sends pending deltas to the client in the given seat, unless it
+        has too much unsent data already."""
+
+        channel = self.seats[seat]
+        if channel is None:
+            return
+        for i, encoder in enumerate(self._encoders[seat]):
+            while encoder.hasDelta() and not channel.congested():
+                channel.sendFrame(DELTA + chr(i) + encoder.popDelta())
+
+class GameChannel(asynchat.async_chat):
+    """The server's end of a connection to one client."""
+
+    def __init__(self, sock, server):
+        asynchat.async_chat.__init__(self, sock, map=server.map)
+        self.server = server
+        self.session = None
+        self.seat = None
+        self._frameLength = None
+        self._incoming = []
+        self.set_terminator(_LENGTH.size)
+
+    def sendFrame(self, payload):
+        self.push(encodeFrame(payload))
+
+    def bufferedBytes(self):
+        return sum(len(p) for p in self.producer_fifo if isinstance(p, str))
+
+    def congested(self):
+        return self.bufferedBytes() >= self.server.maxBuffered
+
+    def readable(self):
+        # Backpressure: don't accept more actions from a client that isn't
+        # keeping up with the updates.
+        return asynchat.async_chat.readable(self) and not self.congested()
+
+    def collect_incoming_data(self, data):
+        self._incoming.append(data)
+
+    def found_terminator(self):
+        data = ''.join(self._incoming)
+        self._incoming = []
+        if self._frameLength is None:
+            self._frameLength = _LENGTH.unpack(data)[0]
+            if self._frameLength > 0:
+                self.set_terminator(self._frameLength)
+                return
+            data = ''
+        self._frameLength = None
+        self.set_terminator(_LENGTH.size)
+        self._handleFrame(data)
+
+    def _handleFrame(self, payload):
+        kind, data = payload[:1], payload[1:]
+        if kind == JOIN and self.session is None:
+            self.session = self.server.joinSession(data, self)
+        elif kind == ACTION and self.session is not None:
+            self.session.handleAction(self, data)
+        else:
+            self.sendFrame(ERROR + 'unexpected message')
+
+    def handle_write(self):
+        asynchat.async_chat.handle_write(self)
+        # Now that some data has gone out, there may be room for more.
+        if self.session is not None and self.seat is not None:
+            self.session.flush(self.seat)
+
+    def handle_close(self):
+        if self.session is not None:
+            self.server.leaveSession(self.session, self)
+            self.session = None
+        self.close()
+
+class GameServer(asyncore.dispatcher):
+    """Accepts connections and hosts game sessions."""
+
+    def __init__(self, address, newGame, table=None, maxBuffered=65536):
+        """Starts listening.
+
+        address is either a (host, port) pair or the path of a Unix socket.
+        newGame is a function with no arguments that returns a GameManager
+        for a new session. table is the TypeTable used to encode deltas.
+        If more than maxBuffered bytes are waiting to be sent to a client,
+        its deltas are held back (and coalesced).
+        """
+
+        self.map = {}
+        asyncore.dispatcher.__init__(self, map=self.map)
+        self.newGame = newGame
+        self.table = table
+        self.maxBuffered = maxBuffered
+        # Open sessions, indexed by name.
+        self.sessions = {}
+
+        if isinstance(address, basestring):
+            self.create_socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.set_reuse_addr()
+        self.bind(address)
+        self.listen(16)
+        self.address = self.socket.getsockname()
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair is not None:
+            GameChannel(pair[0], self)
+
+    def joinSession(self, name, channel):
+        """Puts a client in the named session, creating it if needed.
+
+        Returns the session, or None if it is full.
+        """
+
+        session = self.sessions.get(name)
+        if session is None:
+            session = GameSession(name, self.newGame(), self.table)
+            self.sessions[name] = session
+        if session.full:
+            channel.sendFrame(ERROR + 'session is full')
+            return None
+        channel.seat = session.join(channel)
+        return session
+
+    def leaveSession(self, session, channel):
+        session.leave(channel)
+        if session.empty:
+            logging.info('Closing session %s after %d actions (mean %.2f ms, max %.2f ms)'
+                         % (session.name, session.stats.actions,
+                            session.stats.meanTime * 1000, session.stats.maxTime * 1000))
+            session.close()
+            del self.sessions[session.name]
+
+    def poll(self, timeout=0.0):
+        """Handles any pending network events."""
+        asyncore.loop(timeout, count=1, map=self.map)
+
+    def serveForever(self):
+        asyncore.loop(map=self.map)
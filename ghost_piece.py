@@ -23,8 +23,22 @@ class GhostPiece(Piece):
         self.piece = piece
         self.position = None if piece.position is None else list(piece.position)
 
+    def reset(self, piece=None):
+        """Turns this into a ghost of another piece, as if it had just
+        been created (for reusing ghosts). Without a piece, the ghost
+        just forgets its old piece, and has no attributes until it is
+        reset again."""
+        self.__dict__.clear()
+        if piece is not None:
+            GhostPiece.__init__(self, piece)
+
     def __getattr__(self, attr):
-        return self.piece.__getattribute__(attr)
+        # Look in __dict__, so that a ghost without a piece raises an
+        # AttributeError instead of looking for self.piece forever.
+        piece = self.__dict__.get('piece')
+        if piece is None:
+            raise AttributeError(attr)
+        return piece.__getattribute__(attr)
         
     def chargingRegion(self):
         return self.piece.chargingRegion()
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Texture atlases for drawing pieces in batches.
+
+ImageAtlas packs the piece images into a few large textures, and
+GlyphAtlas keeps the fonts used for the indicators on the pieces (pyglet
+renders the glyphs of a font into a shared texture, and caches them).
+Sprites made from the same atlas texture can be drawn by a single
+pyglet.graphics.Batch in one draw call.
+
+The atlases need an OpenGL context, so they should only be created after
+the director has been initialized. sharedAtlas and sharedGlyphs return
+atlases that are shared by all the layers; loadSharedAtlas creates the
+shared atlas from images decoded in the background (see asset_manifest.py).
+"""
+
+import os
+
+import pyglet
+from pyglet.image.atlas import TextureBin, AllocatorException
+
+# The directory whose images are packed when the shared atlas is created.
+IMAGE_DIRECTORY = 'images/human'
+
+class ImageAtlas(object):
+    """Packs images into large textures."""
+
+    def __init__(self, directory=None, size=1024, preloader=None):
+        """Creates an atlas.
+
+        If directory is given, all the PNG images in it are added
+        straight away. Other images are added when they are first asked
+        for. size is the width and height of the atlas textures. If
+        preloader (an AssetPreloader) is given, images that it has
+        decoded are taken from it rather than loaded from their files.
+        """
+
+        self._bin = TextureBin(size, size)
+        self._regions = {}
+        self.preloader = preloader
+        if directory is not None:
+            self.addDirectory(directory)
+
+    def addDirectory(self, directory):
+        """Adds all the PNG images in a directory (relative to the game)."""
+
+        base = os.path.join(os.path.dirname(os.path.abspath(__file__)), directory)
+        for name in sorted(os.listdir(base)):
+            if name.endswith('.png'):
+                # Image names use '/', like the ones in the descriptions.
+                self.region(directory + '/' + name)
+
+    def region(self, name):
+        """Returns the texture region holding an image."""
+
+        region = self._regions.get(name)
+        if region is None:
+            image = self._preloaded(name)
+            if image is None:
+                image = pyglet.image.load(name, file=pyglet.resource.file(name))
+            try:
+                region = self._bin.add(image)
+            except AllocatorException:
+                # Too large for the atlas; it gets a texture of its own.
+                region = image.get_texture()
+            self._regions[name] = region
+        return region
+
+    def _preloaded(self, name):
+        if self.preloader is None:
+            return None
+        pixels = self.preloader.get(name)
+        if pixels is None:
+            return None
+        height, width = pixels.shape[:2]
+        return pyglet.image.ImageData(width, height, 'RGBA', pixels.tostring())
+
+    def addPreloaded(self):
+        """Adds all the images of the preloader (waiting for them)."""
+
+        for name, size in self.preloader.manifest:
+            self.region(name)
+
+class GlyphAtlas(object):
+    """Loads fonts, and keeps their glyphs cached."""
+
+    def __init__(self, fontName='Arial', preload='0123456789'):
+        """Creates a glyph atlas.
+
+        The glyphs of preload are rendered as soon as a font is loaded, so
+        that drawing them later doesn't need to touch the font texture.
+        """
+
+        self.fontName = fontName
+        self.preload = preload
+        self._fonts = {}
+
+    def font(self, size, bold=False):
+        key = (size, bold)
+        font = self._fonts.get(key)
+        if font is None:
+            font = pyglet.font.load(self.fontName, size, bold=bold)
+            font.get_glyphs(self.preload)
+            self._fonts[key] = font
+        return font
+
+class BatchedText(object):
+    """A line of text drawn as one sprite per glyph."""
+
+    def __init__(self, font, color, batch, group):
+        """Creates an empty line of text.
+
+        color is an (r, g, b) tuple.
+        """
+
+        self.font = font
+        self.color = color
+        self.batch = batch
+        self.group = group
+        self.text = ''
+        self.width = 0
+        self._sprites = []
+        self._glyphs = []
+        self._x = 0
+        self._y = 0
+        self._visible = True
+        self._opacity = 255
+
+    @property
+    def height(self):
+        return self.font.ascent - self.font.descent
+
+    def setText(self, text):
+        if text == self.text:
+            return
+        self.delete()
+        self.text = text
+        self._glyphs = self.font.get_glyphs(text)
+        for g in self._glyphs:
+            sprite = pyglet.sprite.Sprite(g, batch=self.batch, group=self.group)
+            sprite.color = self.color
+            self._sprites.append(sprite)
+        self.width = sum(g.advance for g in self._glyphs)
+        self._place()
+
+    def update(self, x, y, visible=True, opacity=255):
+        """Moves the text, so that its bottom left corner is at (x, y)."""
+
+        self._x = x
+        self._y = y
+        self._visible = visible
+        self._opacity = opacity
+        self._place()
+
+    def _place(self):
+        x = self._x
+        baseline = self._y - self.font.descent
+        for sprite, g in zip(self._sprites, self._glyphs):
+            sprite.set_position(x + g.vertices[0], baseline + g.vertices[1])
+            sprite.visible = self._visible
+            sprite.opacity = self._opacity
+            x += g.advance
+
+    def migrate(self, batch):
+        """Moves the sprites to another batch."""
+
+        self.batch = batch
+        for sprite in self._sprites:
+            sprite.batch = batch
+
+    def delete(self):
+        for sprite in self._sprites:
+            sprite.delete()
+        self._sprites = []
+        self._glyphs = []
+        self.text = ''
+        self.width = 0
+
+_atlas = None
+_glyphs = None
+
+def sharedAtlas():
+    """The atlas of piece images, created on first use."""
+
+    global _atlas
+    if _atlas is None:
+        _atlas = ImageAtlas(IMAGE_DIRECTORY)
+    return _atlas
+
+def loadSharedAtlas(preloader):
+    """Creates the shared atlas from the images of an AssetPreloader.
+
+    This waits until the preloader is done, and then creates the textures.
+    """
+
+    global _atlas
+    _atlas = ImageAtlas(preloader=preloader)
+    _atlas.addPreloaded()
+    return _atlas
+
+def sharedGlyphs():
+    """The glyph atlas for the piece indicators, created on first use."""
+
+    global _glyphs
+    if _glyphs is None:
+        _glyphs = GlyphAtlas()
+    return _glyphs
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""
+The positions and sizes of the parts of the game screen.
+
+These are kept apart from the layers, so that they can be used without
+importing cocos.
+"""
+
+# See layout.svg for a diagram of all these constants.
+GAME_WIDTH = 1024
+GAME_HEIGHT = 768
+
+BOARD_WIDTH = 512
+BOARD_HEIGHT = 288
+
+BOARD_GAP = 48
+TOP_MARGIN = (GAME_HEIGHT - 2 * BOARD_HEIGHT - BOARD_GAP) / 2
+BOTTOM_MARGIN = TOP_MARGIN
+
+LEFT_MARGIN = (GAME_WIDTH - BOARD_WIDTH) / 2
+RIGHT_MARGIN = LEFT_MARGIN
+
+# The speed that units move to attack (in seconds per pixel)
+ATTACK_SPEED = 0.003
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Checks that finished games don't leak memory.
+
+Plays many short random games in a row, the way the game server hosts
+them: every game gets new boards and a GameSession (with both seats
+taken, so that the boards have delta encoders listening to them), while
+the players, the factories and the type table are shared between games.
+After each game the session is closed, which tears the game down.
+
+Every so often, the check counts the game objects (boards, pieces,
+managers, ...) that are still alive and all the objects that the garbage
+collector tracks, and (if tracemalloc is available) measures the memory
+in use. If the live game objects grow, if the tracked objects grow at
+every checkpoint by one or more per game, or if the memory grows by more
+than --max-growth bytes per game, some finished games are still
+reachable and the exit status is 1. (Without tracemalloc there is no
+memory measure that can go down, so only the objects are checked.)
+
+A game of 40 actions takes about 0.15 s, so this takes about 25 minutes:
+
+    python leak_check.py --games 10000
+"""
+
+import argparse
+import gc
+import logging
+import sys
+
+import numpy as np
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+from board import Board
+from board_delta import BoardDeltaEncoder
+from described_object_factory import UnitFactory, PlayerFactory
+from event_hook import EventHook
+from game_manager import GameManager
+from game_server import GameSession
+from piece import Piece
+from type_table import TypeTable
+import replay
+import snapshot
+
+# The classes whose instances belong to a single game.
+GAME_CLASSES = (Board, Piece, GameManager, GameSession, BoardDeltaEncoder, EventHook)
+
+class _Channel(object):
+    """Stands in for a client connection, and drops everything."""
+
+    def sendFrame(self, payload):
+        pass
+
+    def congested(self):
+        return False
+
+class LeakCheck(object):
+    def __init__(self, actions=40, seed=0):
+        self.actions = actions
+        self.seed = seed
+        # The number of games that ended with an error in the board code.
+        self.errors = 0
+        self.unitFac = UnitFactory('unit_descriptions.xml')
+        self.playerFac = PlayerFactory('player_descriptions.xml')
+        self.table = TypeTable(self.unitFac, self.playerFac)
+        self.players = [self.playerFac.create('Camel', self.unitFac,
+                            baseWeights=[1, 1, 1], baseNames=['Archer', 'Swordsman', 'Swordsman'],
+                            specialWeights=[10], specialNames=['Angel'], specialRarity=[3])
+                        for i in range(2)]
+        # Every game starts the players from the same state.
+        self._playerData = [snapshot.packPlayer(p) for p in self.players]
+
+    def playGame(self, seed):
+        """Plays a game with random actions, and closes its session."""
+
+        for player, data in zip(self.players, self._playerData):
+            snapshot.unpackPlayer(data, player)
+        manager = GameManager(self.players[0], Board(6, 8),
+                              self.players[1], Board(6, 8), seed=seed)
+        session = GameSession('game', manager, self.table)
+        for seat in range(2):
+            session.join(_Channel())
+
+        rand = np.random.RandomState(seed)
+        try:
+            for i in range(self.actions):
+                board = manager.currentBoard
+                pieces = sorted(board.units, key=lambda p: p.position)
+                choice = rand.randint(4)
+                if choice == 0:
+                    name, args = 'callPieces', ()
+                elif choice == 1 and pieces:
+                    row, col = pieces[rand.randint(len(pieces))].position
+                    name, args = 'movePiece', (row, col, rand.randint(board.width))
+                elif choice == 2 and pieces:
+                    name, args = 'deletePiece', tuple(pieces[rand.randint(len(pieces))].position)
+                else:
+                    name, args = 'endTurn', ()
+                try:
+                    replay.applyAction(manager, name, args)
+                except ValueError:
+                    # A random move that isn't allowed; try something else.
+                    continue
+                for seat in range(2):
+                    session.flush(seat)
+        except IndexError:
+            # The fatty alignment sometimes gives up; that game is over,
+            # but it still has to be freed.
+            self.errors += 1
+        finally:
+            session.close()
+
+    def measure(self):
+        """Returns (live game objects, tracked objects, memory in bytes).
+        The memory is None if tracemalloc isn't tracing."""
+
+        gc.collect()
+        objects = gc.get_objects()
+        live = sum(1 for obj in objects if isinstance(obj, GAME_CLASSES))
+        memory = None
+        if tracemalloc is not None and tracemalloc.is_tracing():
+            memory = tracemalloc.get_traced_memory()[0]
+        return live, len(objects), memory
+
+    def run(self, games, interval=None, warmup=None):
+        """Plays the games, and returns a list of (games played, live game
+        objects, tracked objects, memory) checkpoints. The first
+        checkpoint is taken after the warmup games."""
+
+        interval = interval or max(1, games // 10)
+        warmup = warmup if warmup is not None else min(interval, games)
+        if tracemalloc is not None:
+            tracemalloc.start()
+        try:
+            checkpoints = []
+            for i in range(games):
+                if i == warmup or (i > warmup and (i - warmup) % interval == 0):
+                    checkpoints.append((i,) + self.measure())
+                    logging.info(formatCheckpoint(checkpoints[-1]))
+                # The games' warnings (about pieces that don't fit) would
+                # drown the checkpoints.
+                disabled = logging.root.manager.disable
+                logging.disable(max(disabled, logging.WARNING))
+                try:
+                    self.playGame(self.seed + i)
+                finally:
+                    logging.disable(disabled)
+            checkpoints.append((games,) + self.measure())
+            logging.info(formatCheckpoint(checkpoints[-1]))
+        finally:
+            if tracemalloc is not None:
+                tracemalloc.stop()
+        return checkpoints
+
+def formatCheckpoint(checkpoint):
+    games, live, objects, memory = checkpoint
+    text = '%6d games: %6d live game objects, %8d objects' % (games, live, objects)
+    if memory is not None:
+        text += ', %8d kB' % (memory // 1024)
+    return text
+
+def leaks(checkpoints, maxGrowth):
+    """Returns a list of problems with the checkpoints."""
+
+    problems = []
+    if len(checkpoints) < 2:
+        return problems
+    (startGames, startLive, startObjects, startMemory), \
+        (endGames, endLive, endObjects, endMemory) = checkpoints[0], checkpoints[-1]
+    games = endGames - startGames
+    if endLive > startLive:
+        problems.append('%d game objects were left over from %d games'
+                        % (endLive - startLive, games))
+    # Caches (and the interpreter's own types) may fill up now and then,
+    # but anything that every finished game leaves behind grows between
+    # every checkpoint, by at least one object per game.
+    objects = [c[2] for c in checkpoints]
+    growing = all(b > a for a, b in zip(objects, objects[1:]))
+    if games > 0 and growing and endObjects - startObjects >= games:
+        problems.append('%d objects were left over from %d games'
+                        % (endObjects - startObjects, games))
+    if (games > 0 and startMemory is not None and endMemory is not None and
+            float(endMemory - startMemory) / games > maxGrowth):
+        problems.append('memory grew by %.0f bytes per game'
+                        % (float(endMemory - startMemory) / games))
+    return problems
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description='Check that finished games are freed.')
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--actions', type=int, default=40,
+                        help='the number of actions per game (default: %(default)s)')
+    parser.add_argument('--interval', type=int, default=None,
+                        help='the number of games between checkpoints (default: a tenth)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-growth', type=float, default=64,
+                        help='the memory growth (in bytes per game) that counts '
+                        'as a leak (default: %(default)s)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parseArgs(argv)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if tracemalloc is None:
+        logging.info('tracemalloc is not available; only counting objects')
+
+    check = LeakCheck(args.actions, args.seed)
+    problems = leaks(check.run(args.games, args.interval), args.max_growth)
+    for problem in problems:
+        logging.error(problem)
+    return 1 if problems else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Lockstep multiplayer.
+
+Both peers run the same game (created from the same descriptions and with
+the same seed), and only send each other the actions that their player
+takes. Since the game logic is deterministic, both copies stay identical.
+To catch any difference early, each peer also sends a hash of the game
+state at the start of every turn; if the hashes don't match, the game has
+desynchronized.
+
+Messages are strings, whose first byte says what kind of message it is:
+
+    'A' + action: an action encoded as in replay.py
+    'H' + turn + hash: the hash of the state at the start of a turn
+"""
+
+import struct
+import zlib
+
+from event_hook import EventHook
+import replay
+import snapshot
+
+ACTION = 'A'
+HASH = 'H'
+
+# turn, hash
+_HASH = struct.Struct('<iI')
+
+def stateHash(manager, table):
+    """Returns a 32-bit hash of the state of a game.
+
+    The hash covers both players and boards, whose turn it is and the state
+    of the game's random number generator.
+    """
+    return zlib.crc32(snapshot.packGame(manager, table)) & 0xffffffff
+
+class LockstepPeer(object):
+    """One end of a lockstep game.
+
+    Events:
+        desynced: triggered if the remote game is found to differ from the
+            local one. The handlers get the turn at which the difference
+            was noticed, and the local and remote hashes.
+    """
+
+    def __init__(self, manager, seat, send, table):
+        """Starts sending the local player's actions.
+
+        seat is the index of the local player in manager.players, and send
+        is a function that sends a message to the other peer. table is the
+        TypeTable used for hashing the state.
+        """
+
+        self.manager = manager
+        self.seat = seat
+        self.send = send
+        self.table = table
+        self.desynced = EventHook()
+
+        # The hashes of the turns that haven't been checked yet, indexed
+        # by turn.
+        self._localHashes = {}
+        self._remoteHashes = {}
+        self._hashedTurn = None
+        self._applyingRemote = False
+
+        manager.actionTaken.addHandler(self._actionTaken)
+        self._hashTurn()
+
+    def close(self):
+        self.manager.actionTaken.removeHandler(self._actionTaken)
+
+    @property
+    def localTurn(self):
+        """Whether it is the local player's turn."""
+        return self.manager.currentPlayer is self.manager.players[self.seat]
+
+    def _actionTaken(self, name, args):
+        if not self._applyingRemote:
+            self.send(ACTION + replay.encodeAction(name, args))
+        self._hashTurn()
+
+    def _hashTurn(self):
+        turn = self.manager.turn
+        if turn == self._hashedTurn:
+            return
+        self._hashedTurn = turn
+        h = stateHash(self.manager, self.table)
+        self._localHashes[turn] = h
+        self.send(HASH + _HASH.pack(turn, h))
+        self._check(turn)
+
+    def _check(self, turn):
+        if turn in self._localHashes and turn in self._remoteHashes:
+            local = self._localHashes.pop(turn)
+            remote = self._remoteHashes.pop(turn)
+            if local != remote:
+                self.desynced.callHandlers(turn, local, remote)
+
+    def receive(self, message):
+        """Handles a message from the other peer."""
+
+        kind, data = message[:1], message[1:]
+        if kind == ACTION:
+            self._applyingRemote = True
+            try:
+                for end, name, args in replay.decodeActions(data):
+                    # The turn is checked before every action, since a
+                    # message may end the turn and then carry on.
+                    if self.localTurn:
+                        raise ValueError('Remote action during the local turn')
+                    replay.applyAction(self.manager, name, args)
+            finally:
+                self._applyingRemote = False
+        elif kind == HASH:
+            turn, h = _HASH.unpack(data)
+            self._remoteHashes[turn] = h
+            self._check(turn)
+        else:
+            raise ValueError('Unknown lockstep message %r' % kind)
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Profiling Board.normalize, phase by phase.
+
+Setting board.profiler to a NormalizeProfiler makes every normalize on
+that board produce a record, which goes to the profiler's sinks:
+
+    profiler = NormalizeProfiler([HistogramSink(), JsonLinesSink('normalize.jsonl')])
+    board.profiler = profiler
+
+A record is a dict with the board's size, its column heights and number
+of pieces when normalize was called, the total time, the time spent in
+each phase ('times') and some counts ('counts'); see PHASES and COUNTS.
+If normalize raised, 'error' is the name of the exception.
+
+When board.profiler is None (the default), normalize goes through a
+NullProfiler, which does nothing.
+"""
+
+import bisect
+import heapq
+import json
+import timeit
+
+# The phases of normalize that are timed. The time of 'alignFatty' (the
+# fatty alignment tries at the end of _shiftByPriority) is also part of
+# the time of 'shiftByPriority'.
+PHASES = ('shiftByPriority', 'alignFatty', 'createFormations',
+          'mergeWalls', 'reportPieceUpdates')
+
+# The things that are counted: passes through the normalize loop, fatty
+# alignment tries, charging formations made, walls made and merges.
+COUNTS = ('passes', 'alignFattyTries', 'formations', 'walls', 'merges')
+
+class NullProfiler(object):
+    """A profiler that does nothing; Board.normalize uses it when the
+    board has no profiler, so that there is only one normalize loop."""
+
+    def begin(self, board):
+        pass
+
+    def time(self, phase, fn, *args):
+        return fn(*args)
+
+    def add(self, name, n=1):
+        pass
+
+    def end(self, error=None):
+        pass
+
+class NormalizeProfiler(object):
+    """Times the phases of Board.normalize, and passes a record of every
+    call to the sinks.
+
+    A sink is anything with a record(record) method. The same profiler
+    can be shared by several boards.
+    """
+
+    def __init__(self, sinks=None, clock=None):
+        self.sinks = list(sinks or [])
+        self.clock = clock or timeit.default_timer
+        # The records of the normalize calls in progress (normalize could
+        # be called again from an event handler).
+        self._records = []
+
+    def begin(self, board):
+        """Starts the record of a normalize call."""
+
+        record = {'height': board.height,
+                  'width': board.width,
+                  'columnHeights': [int(h) for h in board.boardHeight],
+                  'pieces': len(board.units),
+                  'times': dict.fromkeys(PHASES, 0.0),
+                  'counts': dict.fromkeys(COUNTS, 0),
+                  'start': self.clock()}
+        self._records.append(record)
+
+    def time(self, phase, fn, *args):
+        """Calls fn(*args), adds the time it took to the phase, and
+        returns what it returned."""
+
+        start = self.clock()
+        try:
+            return fn(*args)
+        finally:
+            if self._records:
+                self._records[-1]['times'][phase] += self.clock() - start
+
+    def add(self, name, n=1):
+        """Adds n to one of the counts (if a normalize call is in progress)."""
+
+        if self._records:
+            self._records[-1]['counts'][name] += n
+
+    def end(self, error=None):
+        """Ends the record of the current normalize call, and passes it to
+        the sinks."""
+
+        record = self._records.pop()
+        record['total'] = self.clock() - record.pop('start')
+        if error is not None:
+            record['error'] = error
+        for sink in self.sinks:
+            sink.record(record)
+
+class HistogramSink(object):
+    """Keeps histograms of the normalize times in memory, together with
+    the slowest records.
+
+    The histograms have one bucket per bound (in seconds): bucket k counts
+    the times up to bounds[k], and the last bucket the times above all the
+    bounds.
+    """
+
+    # 10us, 20us, 50us, ..., 5s.
+    DEFAULT_BOUNDS = [m * 10 ** e for e in range(-5, 1) for m in (1, 2, 5)]
+
+    def __init__(self, bounds=None, keepSlowest=10):
+        self.bounds = list(bounds or self.DEFAULT_BOUNDS)
+        self.keepSlowest = keepSlowest
+        self.calls = 0
+        # Histograms of the total time and of each phase.
+        self.histograms = dict((name, [0] * (len(self.bounds) + 1))
+                               for name in ('total',) + PHASES)
+        # The sum of each count over all the calls.
+        self.counts = dict.fromkeys(COUNTS, 0)
+        self.errors = 0
+        # A heap of (total time, call number, record).
+        self._slowest = []
+
+    def record(self, record):
+        self.calls += 1
+        self._add('total', record['total'])
+        for phase in PHASES:
+            self._add(phase, record['times'][phase])
+        for name in COUNTS:
+            self.counts[name] += record['counts'][name]
+        if 'error' in record:
+            self.errors += 1
+        entry = (record['total'], self.calls, record)
+        if len(self._slowest) < self.keepSlowest:
+            heapq.heappush(self._slowest, entry)
+        elif self.keepSlowest:
+            heapq.heappushpop(self._slowest, entry)
+
+    def _add(self, name, seconds):
+        self.histograms[name][bisect.bisect_left(self.bounds, seconds)] += 1
+
+    def slowest(self):
+        """Returns the records of the slowest calls, slowest first."""
+
+        return [record for total, n, record in sorted(self._slowest, reverse=True)]
+
+    def report(self):
+        """Returns the histograms, the counts and the slowest calls as text."""
+
+        lines = ['%d normalize calls, %d errors' % (self.calls, self.errors)]
+        labels = ['<=%gms' % (b * 1000) for b in self.bounds] + ['more']
+        for name in ('total',) + PHASES:
+            buckets = ['%s:%d' % (label, n)
+                       for label, n in zip(labels, self.histograms[name]) if n]
+            lines.append('%-20s %s' % (name, ' '.join(buckets)))
+        lines.append(' '.join('%s=%d' % (name, self.counts[name]) for name in COUNTS))
+        for record in self.slowest():
+            lines.append('%7.2f ms  %dx%d, %d pieces, %d passes, columns %s'
+                         % (record['total'] * 1000, record['height'],
+                            record['width'], record['pieces'],
+                            record['counts']['passes'], record['columnHeights']))
+        return '\n'.join(lines)
+
+class JsonLinesSink(object):
+    """Writes every record as a line of JSON, to a file or a file name
+    (which is appended to)."""
+
+    def __init__(self, f):
+        if isinstance(f, basestring):
+            f = open(f, 'a')
+            self._owned = True
+        else:
+            self._owned = False
+        self.file = f
+
+    def record(self, record):
+        self.file.write(json.dumps(record, sort_keys=True) + '\n')
+        self.file.flush()
+
+    def close(self):
+        if self._owned:
+            self.file.close()
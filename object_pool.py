@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+class KeyedPool(object):
+    """Keeps released objects around, so that they can be reused.
+
+    Objects are only reused for the same key; for example, piece layers
+    are keyed by the size and image of the piece, since those are the
+    parts that are expensive to change.
+    """
+
+    def __init__(self, maxPerKey=16):
+        """Creates an empty pool.
+
+        At most maxPerKey objects are kept for each key; any others that
+        are released are dropped.
+        """
+
+        self.maxPerKey = maxPerKey
+        self._free = {}
+        # Counters, for seeing how well the pool works.
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, key, create, reset=None):
+        """Returns a free object with the given key.
+
+        If there isn't one, a new one is made by calling create. If reset
+        is given, it is called with a reused object before it is returned.
+        """
+
+        free = self._free.get(key)
+        if free:
+            self.reused += 1
+            obj = free.pop()
+            if reset is not None:
+                reset(obj)
+            return obj
+        self.created += 1
+        return create()
+
+    def release(self, key, obj):
+        """Gives an object back to the pool.
+
+        Returns False if the pool is full, in which case the object should
+        be disposed of.
+        """
+
+        free = self._free.setdefault(key, [])
+        if len(free) >= self.maxPerKey:
+            return False
+        free.append(obj)
+        return True
+
+    def free(self, key=None):
+        """The free objects with the given key (or all of them)."""
+
+        if key is not None:
+            return list(self._free.get(key, []))
+        return [obj for objs in self._free.values() for obj in objs]
+
+    def clear(self):
+        self._free.clear()
+
+    def __len__(self):
+        return sum(len(objs) for objs in self._free.values())
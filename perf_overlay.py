@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+An on-screen performance overlay for the cocos client.
+
+F3 shows (and starts measuring) or hides (and stops measuring) the
+overlay: frame time, draw calls, the animation queue depth of each board
+layer, the time from a key release to the first animation stage that it
+started, and the slowest event handlers. F4 saves the frames and the
+handler times (as CSV files) to the current directory. While the overlay
+is hidden, nothing is measured.
+"""
+
+import logging
+import time
+
+import cocos
+import cocos.text
+import pyglet
+import pyglet.graphics.vertexdomain as vertexdomain
+
+from event_hook import EventHook
+from perf_stats import PerfStats
+
+class DrawCallCounter(object):
+    """Counts the glDrawArrays and glDrawElements calls that pyglet's
+    vertex lists make (which includes the batches)."""
+
+    NAMES = ('glDrawArrays', 'glDrawElements')
+
+    def __init__(self):
+        self.calls = 0
+        self._originals = {}
+
+    def install(self):
+        for name in self.NAMES:
+            original = getattr(vertexdomain, name, None)
+            if original is None or name in self._originals:
+                continue
+            self._originals[name] = original
+            setattr(vertexdomain, name, self._counting(original))
+
+    def uninstall(self):
+        for name, original in self._originals.items():
+            setattr(vertexdomain, name, original)
+        self._originals.clear()
+
+    def _counting(self, fn):
+        def counted(*args):
+            self.calls += 1
+            return fn(*args)
+        return counted
+
+    def reset(self):
+        calls = self.calls
+        self.calls = 0
+        return calls
+
+class PerfOverlay(cocos.layer.Layer):
+    """Shows the PerfStats of a GameLayer in the corner of the window."""
+
+    is_event_handler = True
+
+    def __init__(self, gameLayer, stats=None, toggleKey='F3', exportKey='F4'):
+        super(PerfOverlay, self).__init__()
+        self.gameLayer = gameLayer
+        self.stats = stats or PerfStats()
+        self.toggleKey = toggleKey
+        self.exportKey = exportKey
+        self.boardLayers = [gameLayer.bottomBoard, gameLayer.topBoard]
+        self.drawCalls = DrawCallCounter()
+        self.enabled = False
+
+        self._label = cocos.text.Label('', multiline=True, width=600,
+                                       font_size=10, color=(255, 255, 0, 255),
+                                       anchor_x='left', anchor_y='top')
+        self._label.position = (8, 760)
+        self._label.visible = False
+        self.add(self._label)
+
+    def enable(self):
+        if self.enabled:
+            return
+        self.enabled = True
+        self._label.visible = True
+        EventHook.profiler = self.stats
+        self.drawCalls.install()
+        self.gameLayer.keyReleased.addHandler(self.stats.inputStarted)
+        for layer in self.boardLayers:
+            layer.stageStarted.addHandler(self.stats.stageStarted)
+        # The time between clock ticks is the frame time, since cocos
+        # draws once per tick.
+        pyglet.clock.schedule(self._tick)
+        pyglet.clock.schedule_interval(self._refresh, 0.25)
+
+    def disable(self):
+        if not self.enabled:
+            return
+        self.enabled = False
+        self._label.visible = False
+        if EventHook.profiler is self.stats:
+            EventHook.profiler = None
+        self.drawCalls.uninstall()
+        self.gameLayer.keyReleased.removeHandler(self.stats.inputStarted)
+        for layer in self.boardLayers:
+            layer.stageStarted.removeHandler(self.stats.stageStarted)
+        pyglet.clock.unschedule(self._tick)
+        pyglet.clock.unschedule(self._refresh)
+
+    def _tick(self, dt):
+        self.stats.frame(dt, self.drawCalls.reset(),
+                         [len(layer.animationQueue) for layer in self.boardLayers])
+
+    def _refresh(self, dt):
+        self._label.element.text = '\n'.join(self.stats.lines())
+
+    def export(self, prefix=None):
+        """Saves the statistics to <prefix>-frames.csv and
+        <prefix>-handlers.csv, and returns the file names."""
+
+        prefix = prefix or time.strftime('perf-%Y%m%d-%H%M%S')
+        names = (prefix + '-frames.csv', prefix + '-handlers.csv')
+        with open(names[0], 'wb') as f:
+            self.stats.writeFramesCSV(f)
+        with open(names[1], 'wb') as f:
+            self.stats.writeHandlersCSV(f)
+        return names
+
+    def on_key_release(self, key, modifiers):
+        keyName = pyglet.window.key.symbol_string(key)
+        if keyName == self.toggleKey:
+            if self.enabled:
+                self.disable()
+            else:
+                self.enable()
+        elif keyName == self.exportKey:
+            logging.info('Saved %s and %s' % self.export())
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Client performance statistics: frame times, draw calls, animation queue
+depths, input latency and the slowest event handlers.
+
+PerfStats only collects and reports the numbers; perf_overlay.PerfOverlay
+feeds it from the cocos client and shows it on the screen. Frames that
+take longer than slowFrame are logged (as warnings), together with what
+else happened during them, so that a laggy moment can be told apart as
+slow event handlers (the engine and the event fan-out), a long animation
+queue, or slow drawing.
+"""
+
+import collections
+import csv
+import logging
+import timeit
+
+import numpy as np
+
+Frame = collections.namedtuple('Frame',
+        'time seconds drawCalls queueDepths handlerSeconds latency')
+
+def handlerName(handler):
+    """A readable name for an event handler."""
+
+    owner = getattr(handler, 'im_self', None)
+    if owner is not None:
+        return '%s.%s' % (type(owner).__name__, handler.__name__)
+    code = getattr(handler, 'func_code', None)
+    if code is not None and handler.__name__ == '<lambda>':
+        return 'lambda at %s:%d' % (code.co_filename.split('/')[-1], code.co_firstlineno)
+    return getattr(handler, '__name__', repr(handler))
+
+class HandlerStats(object):
+    """The number of calls and the total and longest time of a handler."""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.total = 0.0
+        self.longest = 0.0
+
+    def add(self, seconds):
+        self.calls += 1
+        self.total += seconds
+        self.longest = max(self.longest, seconds)
+
+class PerfStats(object):
+    """Collects the statistics of the latest frames."""
+
+    def __init__(self, keepFrames=600, slowFrame=0.05, clock=None):
+        """keepFrames is the number of frames that are kept (for the
+        summaries and the CSV export). Frames longer than slowFrame
+        seconds are logged."""
+
+        self.frames = collections.deque(maxlen=keepFrames)
+        self.slowFrame = slowFrame
+        self.clock = clock or timeit.default_timer
+        # HandlerStats, by handler name.
+        self.handlers = {}
+        # Input latencies, as (label, seconds) pairs.
+        self.latencies = collections.deque(maxlen=keepFrames)
+        self._pendingInput = None
+        # The number of handlers that are running (a handler may trigger
+        # more handlers).
+        self._handlerDepth = 0
+        self._frameHandlerSeconds = 0.0
+        self._frameLatency = None
+
+    def handlerStarted(self, handler):
+        """Called before an event handler runs; see EventHook.profiler."""
+
+        self._handlerDepth += 1
+
+    def handlerCalled(self, handler, seconds):
+        """Records an event handler call; see EventHook.profiler."""
+
+        name = handlerName(handler)
+        stats = self.handlers.get(name)
+        if stats is None:
+            stats = self.handlers[name] = HandlerStats(name)
+        stats.add(seconds)
+        self._handlerDepth = max(0, self._handlerDepth - 1)
+        # The time of a handler includes the handlers that it triggered,
+        # so only the outermost ones count towards the frame.
+        if self._handlerDepth == 0:
+            self._frameHandlerSeconds += seconds
+
+    def inputStarted(self, label):
+        """Starts timing the latency of an input (eg. a key release)."""
+
+        self._pendingInput = (label, self.clock())
+
+    def stageStarted(self, *args):
+        """Called when an animation stage starts; ends the latency of the
+        pending input, if there is one."""
+
+        if self._pendingInput is not None:
+            label, start = self._pendingInput
+            self._pendingInput = None
+            latency = self.clock() - start
+            self.latencies.append((label, latency))
+            self._frameLatency = latency
+
+    def frame(self, seconds, drawCalls=0, queueDepths=()):
+        """Records a frame that took seconds, made drawCalls draw calls,
+        and left the animation queues with queueDepths stages."""
+
+        frame = Frame(self.clock(), seconds, drawCalls, tuple(queueDepths),
+                      self._frameHandlerSeconds, self._frameLatency)
+        self.frames.append(frame)
+        self._frameHandlerSeconds = 0.0
+        self._frameLatency = None
+        if seconds > self.slowFrame:
+            logging.warning('slow frame: %.1f ms (%.1f ms in event handlers, '
+                            '%d draw calls, animation queues %s)'
+                            % (seconds * 1000, frame.handlerSeconds * 1000,
+                               drawCalls, list(queueDepths)))
+        return frame
+
+    def slowestHandlers(self, n=5):
+        """Returns the HandlerStats of the n handlers with the longest
+        total time."""
+
+        return sorted(self.handlers.values(), key=lambda s: s.total, reverse=True)[:n]
+
+    def summary(self):
+        """Returns a dict with the frame time statistics (in ms), the
+        latest draw call count and queue depths, and the latest input
+        latency (in ms)."""
+
+        if not self.frames:
+            return {}
+        times = np.array([f.seconds for f in self.frames]) * 1000
+        last = self.frames[-1]
+        return {'frames': len(times),
+                'meanFrame': float(times.mean()),
+                'p95Frame': float(np.percentile(times, 95)),
+                'maxFrame': float(times.max()),
+                'drawCalls': last.drawCalls,
+                'queueDepths': list(last.queueDepths),
+                'latency': self.latencies[-1][1] * 1000 if self.latencies else None}
+
+    def lines(self, handlers=5):
+        """Returns the summary as lines of text (for the overlay)."""
+
+        s = self.summary()
+        if not s:
+            return ['no frames yet']
+        lines = ['frame %.1f ms (p95 %.1f, max %.1f), %d draw calls'
+                 % (s['meanFrame'], s['p95Frame'], s['maxFrame'], s['drawCalls']),
+                 'animation queues %s' % s['queueDepths']]
+        if s['latency'] is not None:
+            lines.append('input to animation %.1f ms' % s['latency'])
+        for h in self.slowestHandlers(handlers):
+            lines.append('%6.1f ms %5d calls (max %.1f ms) %s'
+                         % (h.total * 1000, h.calls, h.longest * 1000, h.name))
+        return lines
+
+    def writeFramesCSV(self, f):
+        """Writes one row per frame (times in ms)."""
+
+        depths = max([len(fr.queueDepths) for fr in self.frames] or [0])
+        writer = csv.writer(f)
+        writer.writerow(['time', 'frame_ms', 'draw_calls', 'handler_ms', 'latency_ms'] +
+                        ['queue%d' % k for k in range(depths)])
+        for fr in self.frames:
+            writer.writerow(['%.6f' % fr.time, '%.3f' % (fr.seconds * 1000), fr.drawCalls,
+                             '%.3f' % (fr.handlerSeconds * 1000),
+                             '' if fr.latency is None else '%.3f' % (fr.latency * 1000)] +
+                            list(fr.queueDepths))
+
+    def writeHandlersCSV(self, f):
+        """Writes one row per event handler (times in ms), slowest first."""
+
+        writer = csv.writer(f)
+        writer.writerow(['handler', 'calls', 'total_ms', 'max_ms'])
+        for h in self.slowestHandlers(len(self.handlers)):
+            writer.writerow([h.name, h.calls, '%.3f' % (h.total * 1000),
+                             '%.3f' % (h.longest * 1000)])
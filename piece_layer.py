@@ -1,8 +1,9 @@
 import cocos
-from cocos.sprite import Sprite
-from cocos.layer.util_layers import ColorLayer
-from cocos.text import Label
-from meter_layer import MeterLayer
+import pyglet
+from pyglet.gl import *
+from pyglet.graphics import Batch, OrderedGroup
+
+import image_atlas
 
 import logging
 
@@ -12,83 +13,126 @@ colors = {
     'white' : (255, 255, 255)
 }
 
-class TurnIndicator(cocos.layer.Layer):
-    """Displays the number of turns before a unit charges.
-
-    The anchor point of this layer is the center of the text.
+# The drawing order of the parts of a piece. Since all the pieces of a
+# board share a batch, all the backgrounds are drawn first, then all the
+# images, etc.
+BACKGROUND_GROUP = OrderedGroup(0)
+IMAGE_GROUP = OrderedGroup(1)
+METER_GROUP = OrderedGroup(2)
+OUTLINE_GROUP = OrderedGroup(3)
+TEXT_GROUP = OrderedGroup(4)
+
+# The size of the turn indicator, and of the number next to the charge
+# indicator.
+TURN_FONT_SIZE = 36
+METER_FONT_SIZE = 24
+METER_WIDTH = 8
+
+def _rectangle(x, y, width, height):
+    return (x, y, x, y + height, x + width, y + height, x + width, y)
+
+_HIDDEN = (0,) * 8
+
+class PieceLayer(cocos.cocosnode.CocosNode):
+    """The visual representation of a piece.
+
+    The piece is drawn with sprites from the shared image and glyph
+    atlases, and with colored quads, all of which live in a pyglet Batch.
+    A BoardLayer puts all its pieces into one batch (see setBatch), and
+    draws them together; a PieceLayer without a shared batch draws itself.
     """
 
-    def __init__(self, fontSize):
-        super(TurnIndicator, self).__init__()
-
-        # For better contrast, we do a larger label in white
-        # and a smaller label in black.
-        self._white = Label(font_name='Arial', font_size=fontSize*1.1,
-                            bold=True,
-                            color=(255, 255, 255, 255))
-        self._black = Label(font_name='Arial', font_size=fontSize,
-                            bold=True,
-                            color=(0, 0, 0, 255))
-
-        self._text = ''
-        self.add(self._white)
-        self.add(self._black, z=1)
-
-    @property
-    def text(self):
-        return self._text
-
-    @text.setter
-    def text(self, t):
-        self._text = t
-        self._white.element.text = t
-        self._black.element.text = t
-        self._reposition(self._white)
-        self._reposition(self._black)
-
-    def _reposition(self, label):
-        w = label.element.content_width
-        h = label.element.content_height
-
-        # It seems like this should be h/2, but for some reason that
-        # doesn't line up well...
-        label.position = (-w/2, -h/3)
-
-class PieceLayer(cocos.layer.Layer):
-    def __init__(self, piece, width, height):
+    def __init__(self, piece, width, height, batch=None):
         super(PieceLayer, self).__init__()
-        
+
         self._width = width
         self._height = height
         self._piece = piece
-        #logging.debug('New piece layer %d x %d, image name %s' % (width, height, piece.imageName()))
-
-        # Pieces with the 'color' property get a background.
-        if hasattr(piece, 'color'):
-            #logging.debug('color ' + str(piece.color))
-            c = colors[piece.color]
-            bg = ColorLayer(c[0], c[1], c[2], 192, width=width, height=height)
-            self.add(bg)
-            self._background = bg
-
-        pieceSprite = Sprite(piece.imageName())
-        pieceSprite.image_anchor_x = 0
-        pieceSprite.image_anchor_y = 0
-
+        self._opacity = 255
+        atlas = image_atlas.sharedAtlas()
+        glyphs = image_atlas.sharedGlyphs()
+
+        # Everything is created in a batch of our own, and moved to the
+        # shared batch (if there is one) afterwards.
+        self._batch = Batch()
+        self._ownBatch = True
+        # The (x, y, visible, opacity) that the vertices were last
+        # updated for.
+        self._drawnState = None
+
+        self._background = None
+        self._updateBackground()
+
+        pieceSprite = pyglet.sprite.Sprite(atlas.region(piece.imageName()),
+                                           batch=self._batch, group=IMAGE_GROUP)
         # Scale the sprite to the correct size.
-        rect = pieceSprite.get_rect()
-        scale = min(float(width) / rect.width,
-                    float(height) / rect.height)
-        pieceSprite.scale = scale
+        image = pieceSprite.image
+        pieceSprite.scale = min(float(width) / image.width,
+                                float(height) / image.height)
         self._pieceSprite = pieceSprite
 
-        self.add(pieceSprite)
+        # For better contrast, the turn indicator is a larger number in
+        # white behind a smaller one in black.
+        self._turnOutline = image_atlas.BatchedText(
+                glyphs.font(int(TURN_FONT_SIZE * 1.1), bold=True),
+                (255, 255, 255), self._batch, OUTLINE_GROUP)
+        self._turnText = image_atlas.BatchedText(
+                glyphs.font(TURN_FONT_SIZE, bold=True),
+                (0, 0, 0), self._batch, TEXT_GROUP)
+
+        # The charge indicator is a vertical bar on the right, with the
+        # charge written next to it.
+        self._meter = None
+        self._meterColor = None
+        self._meterHeight = 0
+        self._meterText = image_atlas.BatchedText(
+                glyphs.font(METER_FONT_SIZE), (255, 255, 255),
+                self._batch, TEXT_GROUP)
+
+        self.refresh()
+        if batch is not None:
+            self.setBatch(batch)
+
+    def setBatch(self, batch):
+        """Moves the piece to a shared batch.
+
+        The owner of the batch is responsible for drawing it (under its
+        own transformation), and for calling sync before doing so. If
+        batch is None, the piece gets a batch of its own again, and draws
+        itself.
+        """
+
+        ownBatch = batch is None
+        if ownBatch:
+            batch = Batch()
+        if batch is self._batch:
+            return
+
+        for vertices, group in ((self._background, BACKGROUND_GROUP),
+                                (self._meter, METER_GROUP)):
+            if vertices is not None:
+                self._batch.migrate(vertices, GL_QUADS, group, batch)
+        self._pieceSprite.batch = batch
+        for text in (self._turnOutline, self._turnText, self._meterText):
+            text.migrate(batch)
+
+        self._batch = batch
+        self._ownBatch = ownBatch
+        self._drawnState = None
+
+    def rebind(self, piece):
+        """Makes the layer display a different piece.
+
+        The new piece should have the same size and image as the old one;
+        this is used for reusing layers instead of creating new ones.
+        """
+
+        self.stop()
+        self._piece = piece
         self._opacity = 255
-
-        self._turnIndicator = None
-        self._updateTurnIndicator()
-        self._chargeIndicator = None
-        self._updateChargeIndicator()
+        self.visible = True
+        self._updateBackground()
+        self.refresh()
 
     @property
     def opacity(self):
@@ -96,12 +140,12 @@ class PieceLayer(cocos.layer.Layer):
 
     @opacity.setter
     def opacity(self, op):
-        # This is a cheap version of transparency: just set the children
-        # to be transparent.
-        self._background.opacity = op
-        self._pieceSprite.opacity = op
         self._opacity = op
 
+    @property
+    def piece(self):
+        return self._piece
+
     @property
     def width(self):
         return self._width
@@ -110,20 +154,76 @@ class PieceLayer(cocos.layer.Layer):
     def height(self):
         return self._height
 
+    def sync(self):
+        """Updates the vertices after the piece has moved or changed."""
+
+        # In a shared batch, the vertices are relative to the owner of the
+        # batch. Otherwise, draw applies our own transformation.
+        x, y = (0, 0) if self._ownBatch else (int(self.x), int(self.y))
+        state = (x, y, self.visible, self._opacity)
+        if state == self._drawnState:
+            return
+        self._drawnState = state
+
+        visible = self.visible
+        op = self._opacity
+        if self._background is not None:
+            c = self._backgroundColor
+            self._background.colors[:] = (c[0], c[1], c[2], 192 * op // 255) * 4
+            self._background.vertices[:] = (
+                    _rectangle(x, y, self.width, self.height) if visible else _HIDDEN)
+
+        self._pieceSprite.set_position(x, y)
+        self._pieceSprite.visible = visible
+        self._pieceSprite.opacity = op
+
+        if self._meter is not None:
+            c = self._meterColor
+            self._meter.colors[:] = c * 4
+            self._meter.vertices[:] = (
+                    _rectangle(x + self.width - METER_WIDTH, y,
+                               METER_WIDTH, self._meterHeight) if visible else _HIDDEN)
+
+        # The turn indicator is centered. (It seems like the text should go
+        # h/2 below the center, but that doesn't line up well...)
+        for text in (self._turnOutline, self._turnText):
+            text.update(x + self.width / 2 - text.width / 2,
+                        y + self.height / 2 - text.height / 3, visible, op)
+        # The charge is written to the left of the bar.
+        self._meterText.update(x + self.width - METER_WIDTH - self._meterText.width,
+                               y, visible, op)
+
+    def draw(self):
+        if not self._ownBatch:
+            return
+        self.sync()
+        glPushMatrix()
+        self.transform()
+        self._batch.draw()
+        glPopMatrix()
+
+    def _updateBackground(self):
+        """Pieces with the 'color' property get a background."""
+
+        if hasattr(self._piece, 'color'):
+            self._backgroundColor = colors[self._piece.color]
+            if self._background is None:
+                self._background = self._batch.add(4, GL_QUADS, BACKGROUND_GROUP,
+                                                   'v2i', 'c4B')
+        elif self._background is not None:
+            self._background.delete()
+            self._background = None
+        self._drawnState = None
+
     def _updateTurnIndicator(self):
         """Displays text indicating how many turns are left before attacking."""
 
         if hasattr(self._piece, 'turn'):
-            if self._turnIndicator is None:
-                self._turnIndicator = TurnIndicator(36)
-                self.add(self._turnIndicator)
-
-            self._turnIndicator.text = str(self._piece.turn)
-            self._turnIndicator.position = (self.width / 2, self.height / 2)
+            self._turnOutline.setText(str(self._piece.turn))
+            self._turnText.setText(str(self._piece.turn))
         else:
-            if self._turnIndicator is not None:
-                self.remove(self._turnIndicator)
-                self._turnIndicator = None
+            self._turnOutline.delete()
+            self._turnText.delete()
 
     def _updateChargeIndicator(self):
         """Displays a bar indicating how charged the unit is."""
@@ -131,22 +231,22 @@ class PieceLayer(cocos.layer.Layer):
         if hasattr(self._piece, 'chargeAtTurn') and hasattr(self._piece, 'turn'):
             maxValue = self._piece.chargeAtTurn(0)
             value = self._piece.toughness
-            if self._chargeIndicator is None:
-                bgColor = (255, 255, 255, 0)
-                emptyColor = (255, 0, 0, 255)
-                fullColor = (0, 255, 0, 255)
-                self._chargeIndicator = MeterLayer(8, self.height, maxValue, bgColor, emptyColor, fullColor, horizontal=False)
-                self.add(self._chargeIndicator)
-
-            self._chargeIndicator.setValueAndMax(value, maxValue)
-            self._chargeIndicator.position = (self.width-8, 0)
+            if self._meter is None:
+                self._meter = self._batch.add(4, GL_QUADS, METER_GROUP, 'v2i', 'c4B')
+
+            # Interpolate between red (empty) and green (full).
+            fraction = float(value) / maxValue
+            self._meterColor = (int(round(255 * (1 - fraction))),
+                                int(round(255 * fraction)), 0, 255)
+            self._meterHeight = int(round(self.height * fraction))
+            self._meterText.setText(str(value))
         else:
-            if self._chargeIndicator is not None:
-                self.remove(self._chargeIndicator)
-                self._chargeIndicator = None
+            if self._meter is not None:
+                self._meter.delete()
+                self._meter = None
+            self._meterText.delete()
 
     def refresh(self):
         self._updateTurnIndicator()
         self._updateChargeIndicator()
-
-
+        self._drawnState = None
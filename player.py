@@ -61,6 +61,10 @@ class Player(object):
 
         self.unitFactory = unitFactory
 
+        # The random number generator used for choosing units. This is
+        # numpy's global one unless the GameManager gives us our own.
+        self.random = np.random
+
         #set effective params
         self._mana = 0
         self._life = self.maxLife
@@ -135,9 +139,9 @@ class Player(object):
             proportionally to baseWeight
         """
         effOdds = self.specialRarity * self.effWeights
-        weights = [np.random.uniform()*x for x in effOdds]
+        weights = [self.random.uniform()*x for x in effOdds]
         unitName = self.specialNames[np.argmax(weights)]
-        colorweights = [np.random.uniform()*x for x in self.baseWeights]
+        colorweights = [self.random.uniform()*x for x in self.baseWeights]
         unit = self.unitFactory.create(unitName, self.baseColor[np.argmax(colorweights)], player=self)
         return unit
 
@@ -145,7 +149,7 @@ class Player(object):
         """ Return a base unit. Relative probability of specific types is
         baseWeights
         """
-        weights = [np.random.uniform()*x for x in self.baseWeights]
+        weights = [self.random.uniform()*x for x in self.baseWeights]
         i = np.argmax(weights)
         unitName = self.baseNames[i]
         unit = self.unitFactory.create(unitName, self.baseColor[i], player = self)
@@ -161,7 +165,7 @@ class Player(object):
         """
         specialOdds = self.specialRarity * self.effWeights
         fattyBoost = max((1. + enemyFatties)/(1 + self._calledFatties), 1.)
-        if np.random.uniform() < 0.1*specialOdds/100*fattyBoost:
+        if self.random.uniform() < 0.1*specialOdds/100*fattyBoost:
             unit = self.getSpecialUnit()
         else:
             unit = self.getBaseUnit()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Redrawing the window only when something has changed.
+
+By default, pyglet redraws every window on every pass through its event
+loop, even if nothing on the screen has changed. A RedrawGate clears the
+window's 'invalid' flag after each frame, and sets it again when the
+scene might have changed: on input, on window events, when one of the
+watched game events fires, and on every frame in which something is
+scheduled to run every frame (which is how cocos runs its actions).
+When the scene is idle, pyglet then sleeps until the next event.
+"""
+
+import pyglet
+from pyglet import clock
+
+class RedrawGate(object):
+    """Only lets the window redraw when the scene has been invalidated."""
+
+    # Window events after which the scene needs redrawing.
+    WINDOW_EVENTS = ('on_key_press', 'on_key_release', 'on_text',
+                     'on_mouse_press', 'on_mouse_release', 'on_mouse_drag',
+                     'on_mouse_motion', 'on_resize', 'on_expose', 'on_show',
+                     'on_activate')
+
+    def __init__(self, window, eventLoop=None):
+        """Starts gating the redraws of window.
+
+        eventLoop defaults to pyglet's event loop.
+        """
+
+        self.window = window
+        self.eventLoop = eventLoop or pyglet.app.event_loop
+        # The number of frames that were actually drawn.
+        self.frames = 0
+        self._hooks = []
+
+        window.push_handlers(on_draw=self._drew)
+        window.push_handlers(**dict((name, self.invalidate)
+                                    for name in self.WINDOW_EVENTS))
+
+        self._idle = self.eventLoop.idle
+        self.eventLoop.idle = self._checkIdle
+        self.invalidate()
+
+    def invalidate(self, *args):
+        """Makes sure the window is redrawn on the next frame.
+
+        This can be used directly as an event handler.
+        """
+        self.window.invalid = True
+
+    def watch(self, hook):
+        """Invalidates the scene whenever an EventHook fires."""
+
+        hook.addHandler(self.invalidate)
+        self._hooks.append(hook)
+
+    def watchGame(self, manager):
+        """Watches everything in a game that changes what is displayed."""
+
+        self.watch(manager.switchTurn)
+        for board in manager.boards:
+            self.watch(board.pieceUpdated)
+            self.watch(board.turnBegun)
+            self.watch(board.attackReceived)
+        for player in manager.players:
+            self.watch(player.lifeChanged)
+            self.watch(player.manaChanged)
+            self.watch(player.moveChanged)
+            self.watch(player.unitChanged)
+
+    def close(self):
+        """Stops gating; the window is redrawn on every frame again."""
+
+        for hook in self._hooks:
+            hook.removeHandler(self.invalidate)
+        self._hooks = []
+        self.window.remove_handlers(on_draw=self._drew)
+        self.window.remove_handlers(**dict((name, self.invalidate)
+                                           for name in self.WINDOW_EVENTS))
+        self.eventLoop.idle = self._idle
+        self.invalidate()
+
+    def _checkIdle(self):
+        # If something is scheduled to run every frame (eg. a cocos action
+        # that is moving a piece), there is no sleep time: the scene is
+        # animating.
+        if clock.get_sleep_time(True) == 0:
+            self.invalidate()
+        return self._idle()
+
+    def _drew(self):
+        self.frames += 1
+        self.window.invalid = False
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Recording and replaying games.
+
+A ReplayLog records the seed of a game and every action that the players
+took, using a few bytes per action. Since the game is deterministic given
+the seed, replaying the actions on a new game reproduces the original one.
+The log can also hold periodic snapshots (see snapshot.py), which allow
+jumping to a given turn without replaying the whole game.
+"""
+
+import struct
+
+import snapshot
+
+MAGIC = 'CDRP'
+VERSION = 1
+
+# The action codes, and the format of their arguments.
+MOVE_PIECE = 1
+DELETE_PIECE = 2
+CALL_PIECES = 3
+USE_MANA = 4
+END_TURN = 5
+
+ACTIONS = {
+    'movePiece': (MOVE_PIECE, struct.Struct('<BBB')), # row, column, new column
+    'deletePiece': (DELETE_PIECE, struct.Struct('<BB')), # row, column
+    'callPieces': (CALL_PIECES, struct.Struct('')),
+    'useMana': (USE_MANA, struct.Struct('')),
+    'endTurn': (END_TURN, struct.Struct('')),
+}
+_NAMES = dict((code, (name, fmt)) for name, (code, fmt) in ACTIONS.items())
+
+# magic, version, seed, snapshot interval, length of the actions,
+# number of snapshots
+_HEADER = struct.Struct('<4sBIiIi')
+# turn, offset of the next action, length of the snapshot
+_SNAPSHOT_HEADER = struct.Struct('<iII')
+
+def encodeAction(name, args):
+    """Returns the binary encoding of an action."""
+    code, fmt = ACTIONS[name]
+    return chr(code) + fmt.pack(*args)
+
+def decodeActions(data, offset=0):
+    """Yields (offset, name, args) for each action encoded in data.
+
+    offset is the position just after the action.
+    """
+    while offset < len(data):
+        name, fmt = _NAMES[ord(data[offset])]
+        args = fmt.unpack_from(data, offset + 1)
+        offset += 1 + fmt.size
+        yield offset, name, args
+
+def applyAction(manager, name, args):
+    """Performs an action (as recorded in a ReplayLog) on a game.
+
+    Raises ValueError if the action is a move that isn't allowed.
+    """
+
+    if name == 'movePiece':
+        row, col, newCol = args
+        if not manager.movePiece(manager.currentBoard[row, col], newCol):
+            raise ValueError('Illegal move', args)
+    elif name == 'deletePiece':
+        manager.deletePiece(list(args))
+    else:
+        getattr(manager, name)()
+
+class ReplayLog(object):
+    """An append-only log of the actions taken in a game."""
+
+    def __init__(self, seed, snapshotInterval=0, table=None):
+        """Creates an empty log.
+
+        seed is the seed of the game's random number generator. If
+        snapshotInterval is positive, a snapshot of the game is stored
+        every snapshotInterval turns; table is the TypeTable to use for
+        the snapshots.
+        """
+
+        self.seed = seed
+        self.snapshotInterval = snapshotInterval
+        self.table = table
+        self.actions = bytearray()
+        # A list of (turn, offset, data) triples, where offset is the
+        # position in self.actions of the first action after the snapshot.
+        self.snapshots = []
+        self._manager = None
+
+    def attach(self, manager):
+        """Starts recording the actions taken in a game."""
+
+        self._manager = manager
+        manager.actionTaken.addHandler(self._actionTaken)
+
+    def detach(self):
+        """Stops recording."""
+
+        if self._manager is not None:
+            self._manager.actionTaken.removeHandler(self._actionTaken)
+            self._manager = None
+
+    def _actionTaken(self, name, args):
+        self.actions.extend(encodeAction(name, args))
+
+        manager = self._manager
+        if self.snapshotInterval > 0 and manager.turn > 0:
+            lastTurn = self.snapshots[-1][0] if self.snapshots else 0
+            if manager.turn >= lastTurn + self.snapshotInterval:
+                self.snapshots.append((manager.turn, len(self.actions),
+                                       snapshot.packGame(manager, self.table)))
+
+    def tostring(self):
+        """Returns the binary encoding of the log."""
+
+        parts = [_HEADER.pack(MAGIC, VERSION, self.seed, self.snapshotInterval,
+                              len(self.actions), len(self.snapshots)),
+                 str(self.actions)]
+        for turn, offset, data in self.snapshots:
+            parts.append(_SNAPSHOT_HEADER.pack(turn, offset, len(data)))
+            parts.append(data)
+        return ''.join(parts)
+
+    @staticmethod
+    def fromstring(data, table=None):
+        """Reads a log that was encoded with tostring."""
+
+        (magic, version, seed, interval,
+         length, count) = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError('Not a replay log')
+        if version != VERSION:
+            raise ValueError('Unknown replay log version %d' % version)
+        log = ReplayLog(seed, interval, table)
+        offset = _HEADER.size
+        log.actions = bytearray(data[offset:(offset + length)])
+        offset += length
+        for i in range(count):
+            turn, actionOffset, size = _SNAPSHOT_HEADER.unpack_from(data, offset)
+            offset += _SNAPSHOT_HEADER.size
+            log.snapshots.append((turn, actionOffset, data[offset:(offset + size)]))
+            offset += size
+        return log
+
+def replay(log, newGame, turn=None):
+    """Replays a game, without any graphics.
+
+    newGame is a function that takes no arguments and returns a
+    GameManager for a new game, set up in the same way as the original.
+    If turn is given, the replay stops at the beginning of that turn,
+    starting from the latest snapshot before it (if there is one).
+
+    Returns the GameManager.
+    """
+
+    offset = 0
+    manager = newGame()
+    manager.random.seed(log.seed)
+
+    if turn is not None:
+        earlier = [s for s in log.snapshots if s[0] <= turn]
+        if earlier:
+            snapTurn, offset, data = earlier[-1]
+            snapshot.unpackGame(data, manager, log.table)
+
+    actions = str(log.actions)
+    for end, name, args in decodeActions(actions, offset):
+        if turn is not None and manager.turn >= turn:
+            break
+        applyAction(manager, name, args)
+    return manager
@@ -1,33 +1,162 @@
-import cocos
+import argparse
 import logging
-from described_object_factory import UnitFactory
-from described_object_factory import PlayerFactory
-from player import Player
-from game_manager import GameManager
-from game_layer import GameLayer
-from board import Board
-from board_layer import BoardLayer
+import sys
+import time
 
-logging.basicConfig(level=logging.DEBUG)
+# Only the light modules are imported up front; numpy, cocos and the layers
+# are imported in main, so that their cost shows up in --profile-startup.
 
-cocos.director.director.init(width=1024, height=768)
-unitFac = UnitFactory('unit_descriptions.xml')
-playerFac = PlayerFactory('player_descriptions.xml')
+# The default startup budget for --profile-startup, in milliseconds: the
+# time from starting the script until the first frame has been drawn.
+STARTUP_BUDGET = 1500
 
-player1 = playerFac.create('Camel',
-        unitFac, baseWeights=[1,1,1], baseNames=['Archer', 'Swordsman','Swordsman'],
-        specialWeights=[10], specialNames=['Angel'], specialRarity=[3])
-        
-player2 = playerFac.create('Camel',
-        unitFac, baseWeights=[2,1,1], baseNames=['Archer', 'Swordsman', 'Archer'],
-        specialWeights=[10], specialNames=['Angel'], specialRarity=[3])
+_processStart = time.time()
 
-board1 = Board(6, 8)
-board2 = Board(6, 8)
+class StartupProfile(object):
+    """Records how long each phase of the startup takes."""
 
-manager = GameManager(player1, board1, player2, board2)
-game_layer = GameLayer(player1, board1, player2, board2, manager)
+    def __init__(self, start):
+        self.start = start
+        self._last = start
+        # A list of (phase name, seconds) pairs.
+        self.phases = []
 
-main_scene = cocos.scene.Scene(game_layer)
-cocos.director.director.run(main_scene)
+    def mark(self, phase):
+        """Ends a phase."""
 
+        now = time.time()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    @property
+    def total(self):
+        return self._last - self.start
+
+    def report(self, budget):
+        """Logs the phases, and returns False if they took longer than
+        budget (in milliseconds)."""
+
+        for phase, seconds in self.phases:
+            logging.info('%-20s %7.1f ms' % (phase, seconds * 1000))
+        ok = self.total * 1000 <= budget
+        logging.info('%-20s %7.1f ms (budget %d ms%s)'
+                        % ('total', self.total * 1000, budget,
+                           '' if ok else ', EXCEEDED'))
+        return ok
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description='Play a game of Clashadash.')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='report how long each phase of the startup '
+                        'takes, and quit after the first frame (with '
+                        'exit status 1 if it was over budget)')
+    parser.add_argument('--startup-budget', type=int, default=STARTUP_BUDGET,
+                        help='the startup budget in milliseconds '
+                        '(default: %(default)s)')
+    parser.add_argument('--debug', action='store_true',
+                        help='log debugging information')
+    parser.add_argument('--trace', type=lambda s: s.split(','), default=[],
+                        help='log the trace events of these subsystems '
+                        '(comma-separated, eg. board.fatty,game_manager; '
+                        'see tracing.py)')
+    parser.add_argument('--time-scale', type=float, default=1.0,
+                        help='how fast the animations run, compared to '
+                        'real time (default: %(default)s)')
+    parser.add_argument('--fast-forward', action='store_true',
+                        help="don't wait for the animations")
+    args = parser.parse_args(argv)
+    if args.time_scale <= 0:
+        parser.error('--time-scale must be positive')
+    return args
+
+def main(argv=None):
+    args = parseArgs(argv)
+    logging.basicConfig(level=logging.DEBUG if args.debug or args.trace else logging.INFO)
+    if args.trace:
+        import tracing
+        tracing.enable(*args.trace)
+        tracing.addSink(tracing.logSink)
+    profile = StartupProfile(_processStart)
+
+    from described_object_factory import UnitFactory
+    from described_object_factory import PlayerFactory
+    unitFac = UnitFactory('unit_descriptions.xml')
+    playerFac = PlayerFactory('player_descriptions.xml')
+    profile.mark('descriptions')
+
+    # Start decoding the piece images (scaled to the size of the board
+    # squares) while everything else is set up.
+    from asset_manifest import buildManifest, AssetPreloader
+    from layout import BOARD_HEIGHT, BOARD_WIDTH
+    pieceSize = (BOARD_HEIGHT / 6, BOARD_WIDTH / 8)
+    preloader = AssetPreloader(buildManifest(unitFac, playerFac, pieceSize))
+    preloader.start()
+    profile.mark('start preloading')
+
+    from game_manager import GameManager
+    from board import Board
+    player1 = playerFac.create('Camel',
+            unitFac, baseWeights=[1,1,1], baseNames=['Archer', 'Swordsman','Swordsman'],
+            specialWeights=[10], specialNames=['Angel'], specialRarity=[3])
+
+    player2 = playerFac.create('Camel',
+            unitFac, baseWeights=[2,1,1], baseNames=['Archer', 'Swordsman', 'Archer'],
+            specialWeights=[10], specialNames=['Angel'], specialRarity=[3])
+
+    board1 = Board(6, 8)
+    board2 = Board(6, 8)
+
+    manager = GameManager(player1, board1, player2, board2)
+    profile.mark('game setup')
+
+    import cocos
+    import pyglet
+    from game_layer import GameLayer
+    import image_atlas
+    from redraw_gate import RedrawGate
+    from perf_overlay import PerfOverlay
+    profile.mark('import ui')
+
+    cocos.director.director.init(width=1024, height=768)
+    profile.mark('director init')
+
+    game_layer = GameLayer(player1, board1, player2, board2, manager)
+    game_layer.timeline.timeScale = args.time_scale
+    game_layer.timeline.fastForward = args.fast_forward
+
+    # Only redraw when something changes, so that idle clients don't use
+    # any CPU.
+    redraw_gate = RedrawGate(cocos.director.director.window)
+    redraw_gate.watchGame(manager)
+    profile.mark('build scene')
+
+    # Pack the piece images now, rather than when the first piece appears.
+    image_atlas.loadSharedAtlas(preloader)
+    logging.info('Preloaded %d images (%d from the texture cache)'
+                 % (len(preloader.images), preloader.cacheHits))
+    profile.mark('load atlas')
+
+    # F3 shows the performance overlay, F4 saves its numbers.
+    main_scene = cocos.scene.Scene(game_layer, PerfOverlay(game_layer))
+
+    withinBudget = []
+    if args.profile_startup:
+        window = cocos.director.director.window
+        def frameDrawn():
+            # The frame is on the screen by the time the clock runs again.
+            window.remove_handler('on_draw', frameDrawn)
+            pyglet.clock.schedule_once(firstFrame, 0)
+        def firstFrame(dt):
+            profile.mark('first frame')
+            withinBudget.append(profile.report(args.startup_budget))
+            pyglet.app.exit()
+        window.push_handlers(on_draw=frameDrawn)
+
+    cocos.director.director.run(main_scene)
+
+    if args.profile_startup and withinBudget != [True]:
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -38,6 +38,12 @@ class SelectorLayer(BoardPositionLayer):
         # True if we are currently the active player.
         self.active = False
 
+        # The landing rows of pieces, as computed by Board.dropRows, keyed
+        # by (width, ignored piece). They are only valid for the board
+        # version in _dropRowsVersion.
+        self._dropRows = {}
+        self._dropRowsVersion = None
+
         self._holder = None
         self._setupHolder()
 
@@ -138,17 +144,38 @@ class SelectorLayer(BoardPositionLayer):
         # Move the indicator to the correct place.
         col = self.currentCol
         if self.heldPiece is not None:
-            row = self.board.rowToAdd(self.heldPiece, self.currentCol)            
+            row = self.dropRow(self.heldPiece, self.currentCol)
             position = (self.xAt(col), self.yAt(row, self.heldPiece.height))            
         else:
             position = (self.xAt(col), self.yAt(self.topRow))            
         self._moveIndicator.position = position
             
 
+    def _cachedDropRows(self, width, ignore=None):
+        """Board.dropRows, computed only once per version of the board."""
+
+        if self._dropRowsVersion != self.board.version:
+            self._dropRows = {}
+            self._dropRowsVersion = self.board.version
+        key = (width, ignore)
+        rows = self._dropRows.get(key)
+        if rows is None:
+            rows = self.board.dropRows(width, ignore)
+            self._dropRows[key] = rows
+        return rows
+
+    def dropRow(self, piece, col):
+        """The row that piece would land on in the given column.
+
+        This is the same as Board.rowToAdd, but it doesn't touch the board
+        unless the board has changed.
+        """
+        return int(self._cachedDropRows(piece.width, piece)[col])
+
     @property
     def topRow(self):
         """Returns the square on top of the current column"""
-        return max(self.board.boardHeight[self.currentCol] - 1, 0)
+        return max(int(self._cachedDropRows(1)[self.currentCol]) - 1, 0)
 
     def moveHolder(self, direction):
         """Move holder left, right, up or down."""
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Compact binary snapshots of boards, players and whole games.
+
+A board snapshot is a header, followed by a table of packed piece records
+and then the grid, stored as an array of indices into the piece table.
+Pieces are identified by their TypeTable ids, so both sides of a snapshot
+need to use the same description files.
+
+Loading a snapshot creates one object per piece, and then fills in the
+whole grid with a single numpy indexing operation.
+"""
+
+import struct
+import numpy as np
+
+from board import Board
+from unit import Unit
+from charging_unit import ChargingUnit
+from wall import Wall
+import type_table
+
+VERSION = 1
+
+BOARD_MAGIC = 'CDBD'
+PLAYER_MAGIC = 'CDPL'
+GAME_MAGIC = 'CDGM'
+
+# magic, version, height, width, number of pieces
+_BOARD_HEADER = struct.Struct('<4sBBBH')
+# mana, life, usedMoves, calledUnit, calledFatties, number of weights
+_PLAYER_HEADER = struct.Struct('<4siiiiiB')
+# magic, version, index of current player, turn,
+# numWall, numAttack, numLink, numFusion
+_GAME_HEADER = struct.Struct('<4sBBiiiii')
+# The position, has_gauss and cached_gaussian fields of numpy's RNG state.
+_RNG_STATE = struct.Struct('<iid')
+_RNG_KEYS = 624
+
+# Flags in the piece records.
+ATTACKING = 1
+
+PIECE_RECORD = np.dtype([('type', 'u1'),
+                         ('color', 'u1'),
+                         ('flags', 'u1'),
+                         ('row', 'u1'),
+                         ('col', 'u1'),
+                         ('height', 'u1'),
+                         ('width', 'u1'),
+                         ('baseHeight', 'u1'),
+                         ('baseWidth', 'u1'),
+                         ('turn', 'i1'),
+                         ('toughness', '<i4'),
+                         ('maxPower', '<i4')])
+
+def _checkMagic(magic, expected):
+    if magic != expected:
+        raise ValueError('Not a %s snapshot' % expected)
+
+def _packBoard(board, table):
+    # Sort the pieces by position so that equal boards give equal snapshots.
+    pieces = sorted(board.units, key=lambda p: (p.position[1], p.position[0]))
+    records = np.zeros(len(pieces), dtype=PIECE_RECORD)
+    pieceIds = np.zeros((board.height, board.width), dtype='<i2')
+    for i, p in enumerate(pieces):
+        r = records[i]
+        r['type'], r['color'] = table.encode(p)
+        r['row'], r['col'] = p.position
+        r['height'], r['width'] = p.size
+        r['toughness'] = p.toughness
+        if p in board.currentAttacks:
+            r['flags'] |= ATTACKING
+        if isinstance(p, ChargingUnit):
+            r['baseHeight'], r['baseWidth'] = p.base_size
+            r['turn'] = p.turn
+            r['maxPower'] = p.maxPower
+        if isinstance(p, Wall):
+            r['maxPower'] = p.maxToughness
+        row, col = p.position
+        pieceIds[row:(row + p.height), col:(col + p.width)] = i + 1
+
+    header = _BOARD_HEADER.pack(BOARD_MAGIC, VERSION,
+                                board.height, board.width, len(pieces))
+    return header + records.tostring() + pieceIds.tostring()
+
+def _createPiece(record, table, player):
+    kind = table.kinds[record['type']]
+    desc = table.descriptions[record['type']]
+    color = table.colors[record['color']]
+    position = [int(record['row']), int(record['col'])]
+    if kind == type_table.UNIT:
+        piece = Unit(desc, color, player)
+    elif kind == type_table.CHARGING_UNIT:
+        piece = ChargingUnit(desc, (int(record['baseHeight']), int(record['baseWidth'])),
+                             position, color)
+        piece.turn = int(record['turn'])
+        piece.maxPower = int(record['maxPower'])
+    elif kind == type_table.WALL:
+        piece = Wall(desc, position)
+        piece.maxToughness = int(record['maxPower'])
+    else:
+        raise ValueError('Unknown piece type %d in snapshot' % record['type'])
+
+    piece.position = position
+    piece.size = (int(record['height']), int(record['width']))
+    piece.toughness = int(record['toughness'])
+    return piece
+
+def _unpackBoard(data, offset, table, player, board):
+    magic, version, height, width, count = _BOARD_HEADER.unpack_from(data, offset)
+    _checkMagic(magic, BOARD_MAGIC)
+    offset += _BOARD_HEADER.size
+
+    records = np.frombuffer(data, dtype=PIECE_RECORD, count=count, offset=offset)
+    offset += records.nbytes
+    pieceIds = np.frombuffer(data, dtype='<i2', count=height * width,
+                             offset=offset).reshape((height, width))
+    offset += pieceIds.nbytes
+
+    if board is None:
+        board = Board(height, width)
+    elif (board.height, board.width) != (height, width):
+        raise ValueError('Snapshot is for a %dx%d board' % (height, width))
+
+    pieces = [_createPiece(r, table, player) for r in records]
+    attacks = [p for p, r in zip(pieces, records) if r['flags'] & ATTACKING]
+    board._loadPieces(pieces, pieceIds, attacks)
+    return board, offset
+
+def packBoard(board, table):
+    """Returns a binary snapshot of board.
+
+    table is the TypeTable used to encode the pieces.
+    """
+    return _packBoard(board, table)
+
+def unpackBoard(data, table, player, board=None):
+    """Restores a board from a snapshot.
+
+    player is the owner of the units on the board. If board is given, its
+    contents are replaced by the snapshot (and its pieceUpdated handlers
+    are notified); otherwise, a new Board is returned.
+    """
+    return _unpackBoard(data, 0, table, player, board)[0]
+
+def _packPlayer(player):
+    weights = np.asarray(player.effWeights, dtype='<f8')
+    header = _PLAYER_HEADER.pack(PLAYER_MAGIC, player.mana, player.life,
+                                 player.usedMoves, player.calledUnit,
+                                 player._calledFatties, len(weights))
+    return header + weights.tostring()
+
+def _unpackPlayer(data, offset, player):
+    (magic, mana, life, usedMoves, calledUnit,
+     calledFatties, count) = _PLAYER_HEADER.unpack_from(data, offset)
+    _checkMagic(magic, PLAYER_MAGIC)
+    offset += _PLAYER_HEADER.size
+    weights = np.frombuffer(data, dtype='<f8', count=count, offset=offset)
+    offset += weights.nbytes
+
+    # Set the fields directly, because the property setters have side
+    # effects (eg. losing life increases mana). Then let the listeners know.
+    player._mana = mana
+    player._life = life
+    player._usedMoves = usedMoves
+    player._calledUnit = calledUnit
+    player._calledFatties = calledFatties
+    player.effWeights = weights.copy()
+    player.manaChanged.callHandlers(mana)
+    player.lifeChanged.callHandlers(life)
+    player.moveChanged.callHandlers(usedMoves)
+    player.unitChanged.callHandlers(calledUnit)
+    return offset
+
+def packPlayer(player):
+    """Returns a binary snapshot of the state of player.
+
+    Only the state that changes during a game (mana, life, etc.) is
+    included; the player's description and unit weights are not.
+    """
+    return _packPlayer(player)
+
+def unpackPlayer(data, player):
+    """Restores the state of player from a snapshot."""
+    _unpackPlayer(data, 0, player)
+
+def _packRandomState(random):
+    name, keys, pos, hasGauss, cachedGaussian = random.get_state()
+    return (np.asarray(keys, dtype='<u4').tostring() +
+            _RNG_STATE.pack(pos, hasGauss, cachedGaussian))
+
+def _unpackRandomState(data, offset, random):
+    keys = np.frombuffer(data, dtype='<u4', count=_RNG_KEYS, offset=offset)
+    offset += keys.nbytes
+    pos, hasGauss, cachedGaussian = _RNG_STATE.unpack_from(data, offset)
+    random.set_state(('MT19937', keys.copy(), pos, hasGauss, cachedGaussian))
+    return offset + _RNG_STATE.size
+
+def packGame(manager, table):
+    """Returns a binary snapshot of a game.
+
+    The snapshot contains both players and boards, whose turn it is, and
+    the state of the game's random number generator.
+    """
+
+    current = manager.players.index(manager.currentPlayer)
+    parts = [_GAME_HEADER.pack(GAME_MAGIC, VERSION, current, manager.turn,
+                               manager.numWall, manager.numAttack,
+                               manager.numLink, manager.numFusion),
+             _packRandomState(manager.random)]
+    for player, board in zip(manager.players, manager.boards):
+        parts.append(_packPlayer(player))
+        parts.append(_packBoard(board, table))
+    return ''.join(parts)
+
+def unpackGame(data, manager, table):
+    """Restores a game from a snapshot.
+
+    manager should be a GameManager for the same players and boards (or
+    ones created from the same descriptions) as the one in the snapshot.
+    """
+
+    (magic, version, current, turn, numWall, numAttack,
+     numLink, numFusion) = _GAME_HEADER.unpack_from(data, 0)
+    _checkMagic(magic, GAME_MAGIC)
+    offset = _unpackRandomState(data, _GAME_HEADER.size, manager.random)
+
+    for player, board in zip(manager.players, manager.boards):
+        offset = _unpackPlayer(data, offset, player)
+        board, offset = _unpackBoard(data, offset, table, player, board)
+
+    pairs = zip(manager.players, manager.boards)
+    manager._currentPlayerBoard = pairs[current]
+    manager._otherPlayerBoard = pairs[1 - current]
+    manager.turn = turn
+    manager.numWall = numWall
+    manager.numAttack = numAttack
+    manager.numLink = numLink
+    manager.numFusion = numFusion
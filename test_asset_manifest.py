@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from described_object_factory import UnitFactory, PlayerFactory
+from asset_manifest import buildManifest, scaleImage, AssetPreloader
+
+class TestAssetManifest(unittest.TestCase):
+    def setUp(self):
+        self.unitFac = UnitFactory('unit_descriptions.xml')
+        self.playerFac = PlayerFactory('player_descriptions.xml')
+        self.cacheDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cacheDir)
+
+    def testManifest(self):
+        manifest = dict(buildManifest(self.unitFac, self.playerFac, (48, 64)))
+        self.assertEqual(manifest['images/human/swordsman.png'], (48, 64))
+        self.assertEqual(manifest['images/human/swordCharging.png'], (144, 64))
+        self.assertEqual(manifest['images/human/angel.png'], (96, 128))
+        self.assertEqual(manifest['wall.png'], (48, 64))
+        for name in manifest:
+            self.assertTrue(os.path.exists(name))
+
+    def testSharedImage(self):
+        # An image that is shown at several shapes fits the largest of
+        # each dimension.
+        class Factory(object):
+            pass
+        units, players = Factory(), Factory()
+        charge = {'imageBase': 'charge', 'height': '1', 'width': '1'}
+        units.descriptions = {
+            'tall': {'imageBase': 'a', 'height': '4', 'width': '1', 'charge': charge},
+            'wide': {'imageBase': 'a', 'height': '1', 'width': '3', 'charge': charge}}
+        players.descriptions = {}
+        manifest = dict(buildManifest(units, players, (10, 20)))
+        self.assertEqual(manifest['a.png'], (40, 60))
+
+    def testScale(self):
+        pixels = np.zeros((4, 6, 4), dtype='uint8')
+        pixels[:, :3] = (255, 0, 0, 255)
+        scaled = scaleImage(pixels, (2, 10))
+        self.assertEqual(scaled.shape, (2, 3, 4))
+        # Transparent pixels don't darken the colored ones.
+        self.assertEqual(list(scaled[0, 0]), [255, 0, 0, 255])
+        self.assertEqual(list(scaled[0, 1]), [255, 0, 0, 128])
+        self.assertEqual(list(scaled[0, 2]), [0, 0, 0, 0])
+        self.assertTrue(scaleImage(pixels, (8, 8)) is pixels)
+
+    def testCache(self):
+        decoded = []
+        def decode(name):
+            decoded.append(name)
+            return np.full((96, 96, 4), len(decoded), dtype='uint8')
+        manifest = [('wall.png', (48, 64)), ('images/human/archer.png', (48, 64))]
+
+        first = AssetPreloader(manifest, self.cacheDir, decode)
+        first.start()
+        self.assertTrue(first.wait(10))
+        self.assertEqual(first.get('wall.png').shape, (48, 48, 4))
+        self.assertEqual(first.decoded, 2)
+
+        second = AssetPreloader(manifest, self.cacheDir, decode)
+        second.start()
+        self.assertEqual(second.get('images/human/archer.png')[0, 0, 0], 2)
+        self.assertEqual((second.decoded, second.cacheHits), (0, 2))
+        self.assertEqual(len(decoded), 2)
+        self.assertEqual(second.get('missing.png'), None)
+
+if __name__ == '__main__':
+    unittest.main()
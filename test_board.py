@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
 
+import Queue
+import sys
+import threading
 import unittest
 import logging
+import board
 from board import Board
 from piece import Piece
 
@@ -168,6 +172,22 @@ class TestBoard(unittest.TestCase):
         self.assertEqual(fat1.position, [2,1])
         self.assertTrue(b.selfConsistent)
         
+    def testFattyOrder(self):
+        # The fatties are realigned in order of column, then row.
+        b = Board(4, 4)
+        fatties = [DummyPiece(2, 2, chargeable=False) for i in range(3)]
+        b.addPiece(fatties[0], 2)
+        b.addPiece(fatties[1], 0)
+        b.addPiece(fatties[2], 0)
+        orders = []
+        align = b._alignFatties
+        def alignFatties(fatty):
+            orders.append(list(fatty))
+            return align(fatty)
+        b._alignFatties = alignFatties
+        b.normalize()
+        self.assertEqual(orders[0], [fatties[1], fatties[2], fatties[0]])
+
     def testColToAdd(self):
         # We create a variety of boards in which there is only one place
         # to add a new piece. Then we check that colToAdd puts the piece
@@ -188,6 +208,168 @@ class TestBoard(unittest.TestCase):
         b.addPiece(DummyPiece(1, 1), 1)
         self.assertEqual(b.colToAdd(DummyPiece(2, 2)), None)
 
+    def testDropRows(self):
+        b = Board(6, 5)
+        b.addPiece(DummyPiece(1, 1), 0)
+        b.addPiece(DummyPiece(2, 2), 1)
+        b.addPiece(DummyPiece(1, 1), 1)
+        b.addPiece(DummyPiece(3, 1), 4)
+        held = DummyPiece(1, 2)
+        b.addPiece(held, 2)
+        for size in [(1, 1), (2, 1), (2, 2), (1, 3)]:
+            rows = b.dropRows(size[1])
+            for col in range(b.width):
+                self.assertEqual(rows[col], b.rowToAdd(DummyPiece(*size), col))
+
+        # A piece that is on the board is ignored when it is moved.
+        rows = b.dropRows(held.width, ignore=held)
+        for col in range(b.width):
+            self.assertEqual(rows[col], b.rowToAdd(held, col))
+        self.assertNotEqual(list(rows), list(b.dropRows(held.width)))
+
+    def testReset(self):
+        b = Board(3, 3)
+        pieces = [DummyPiece(1, 1), DummyPiece(2, 2)]
+        b.addPiece(pieces[0], 0)
+        b.addPiece(pieces[1], 1)
+        b.currentAttacks.add(pieces[1])
+        b.pieceUpdated.addHandler(lambda pieces: None)
+        b.normalize()
+        grid = b.grid
+        version = b.version
+
+        self.assertEqual(set(b.reset()), set(pieces))
+        self.assertTrue(b.grid is grid)
+        self.assertEqual(list(b.grid.flat), [None] * 9)
+        self.assertEqual((b.units, b.currentAttacks), (set(), set()))
+        self.assertEqual(b.pieceUpdated._handlers, [])
+
+        # The board works like a new one, but its version doesn't repeat.
+        b.addPiece(DummyPiece(1, 1), 2)
+        b.normalize()
+        self.assertTrue(b.selfConsistent())
+        self.assertEqual(len(b.units), 1)
+        self.assertTrue(b.version > version + 1)
+
+    def testColToAddReusesGhosts(self):
+        b = Board(2, 4)
+        b.addPiece(DummyPiece(1, 1), 1)
+        piece = DummyPiece(2, 2)
+        self.assertEqual(b.colToAdd(piece), 2)
+        # The pooled ghosts don't keep the pieces alive.
+        pool = board._ghostPools.pieces
+        for ghost in pool.free():
+            self.assertEqual(ghost.__dict__, {})
+            with self.assertRaises(AttributeError):
+                ghost.size
+        reused = pool.reused
+        self.assertEqual(b.colToAdd(piece), 2)
+        self.assertTrue(pool.reused > reused)
+
+        # Other threads have their own pools.
+        pools = []
+        def probe():
+            self.assertEqual(b.colToAdd(piece), 2)
+            pools.append(board._ghostPools.pieces)
+        thread = threading.Thread(target=probe)
+        thread.start()
+        thread.join()
+        self.assertEqual(len(pools), 1)
+        self.assertTrue(pools[0] is not pool)
+        self.assertTrue(len(pools[0]) > 0)
+
+    def testVersion(self):
+        b = Board(3, 3)
+        version = b.version
+        b.addPiece(DummyPiece(1, 1), 0)
+        b.normalize()
+        self.assertTrue(b.version > version)
+        version = b.version
+        b.normalize()
+        self.assertEqual(b.version, version)
+
+    def testSnapshot(self):
+        b = Board(4, 4)
+        pieces = [DummyPiece(1, 1, chargeable=False), DummyPiece(2, 2, chargeable=False)]
+        b.addPiece(pieces[0], 0)
+        b.addPiece(pieces[1], 2)
+        b.normalize()
+
+        # Taking a snapshot copies nothing.
+        snap = b.snapshot()
+        self.assertEqual((snap._columns, snap._units), ({}, None))
+        self.assertEqual(list(snap.boardHeight), [1, 0, 2, 2])
+        self.assertEqual(snap.units, frozenset(pieces))
+
+        # Changing a column copies only that column (and the units).
+        piece = DummyPiece(1, 1, chargeable=False)
+        b.addPiece(piece, 1)
+        b.normalize()
+        self.assertEqual(snap._columns.keys(), [1])
+        self.assertEqual(snap[0, 1], None)
+        self.assertTrue(snap[0, 0] is pieces[0])
+        self.assertEqual(list(snap[range(2), 3]), [pieces[1]] * 2)
+        self.assertEqual(snap[4, 0], None)
+        self.assertEqual(snap.units, frozenset(pieces))
+        self.assertEqual(snap.position(pieces[1]), [0, 2])
+        self.assertEqual(snap.position(piece), None)
+
+        # The snapshot doesn't see the board being emptied either, and
+        # the board stops tracking it once nothing is shared.
+        b.deletePiece(pieces[0])
+        b.reset()
+        self.assertEqual(list(snap.boardHeight), [1, 0, 2, 2])
+        fresh = b.snapshot()
+        self.assertEqual(list(fresh.boardHeight), [0, 0, 0, 0])
+        self.assertEqual([ref() for ref in b._snapshots], [fresh])
+
+    def testSnapshotReaderThread(self):
+        # The game thread keeps changing the board and publishes a
+        # snapshot after every change; a reader thread reads them while
+        # the board changes, and always sees the board as it was.
+        b = Board(6, 8)
+        published = Queue.Queue()
+        errors = []
+        def read():
+            while True:
+                item = published.get()
+                if item is None:
+                    return
+                snap, grid, units, heights = item
+                for k in range(10):
+                    if ([[snap[i, j] for j in range(b.width)] for i in range(b.height)] != grid or
+                            snap.units != units or list(snap.boardHeight) != heights):
+                        errors.append(snap.version)
+                        break
+            # Snapshots can't be taken while the board may be changing.
+            try:
+                b.snapshot()
+            except RuntimeError:
+                pass
+            else:
+                errors.append('snapshot on the reader thread')
+
+        reader = threading.Thread(target=read)
+        interval = sys.getcheckinterval()
+        sys.setcheckinterval(1)
+        reader.start()
+        try:
+            for step in range(80):
+                col = step * 3 % b.width
+                piece = DummyPiece(1 + step % 2, 1, chargeable=False)
+                if b.canAddPiece(piece, col):
+                    b.addPiece(piece, col)
+                    b.normalize()
+                else:
+                    b.deletePiece(b[0, col])
+                published.put((b.snapshot(), b.grid.tolist(), frozenset(b.units),
+                               list(b.boardHeight)))
+        finally:
+            published.put(None)
+            reader.join()
+            sys.setcheckinterval(interval)
+        self.assertEqual(errors, [])
+
 if __name__ == '__main__':
     unittest.main()
 
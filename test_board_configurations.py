@@ -4,9 +4,7 @@ import json
 from board import Board
 from piece import Piece
 from described_object_factory import UnitFactory, PlayerFactory
-import logging
-
-logging.basicConfig(level=logging.DEBUG)
+import fuzz_board
 
 class TestBoardConfigurations(unittest.TestCase):
     def setUp(self):
@@ -105,20 +103,7 @@ class TestBoardConfigurations(unittest.TestCase):
         """Create a piece from a JSON description and add it to the
         board."""
 
-        position = pieceDesc['position']
-        color = pieceDesc.get('color', 'blue')
-        name = pieceDesc.get('name', 'Swordsman')
-        piece = self.unitFac.create(name, color, self.player)
-
-        for key, val in pieceDesc.items():
-            if key == 'position': continue
-            #we want size to be a tuple
-            if key == 'size': 
-                piece.size = tuple(val)
-            else:
-                setattr(piece, key, val)
-
-        board.addPieceAtPosition(piece, position[0], position[1])
+        fuzz_board.addJSONPiece(board, pieceDesc, self.unitFac, self.player)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from board import Board
+from described_object_factory import UnitFactory, PlayerFactory
+from type_table import TypeTable
+from board_delta import BoardDeltaEncoder, decodeDelta, APPEAR, DISAPPEAR, REPLACE
+
+class TestBoardDelta(unittest.TestCase):
+    def setUp(self):
+        self.unitFac = UnitFactory('unit_descriptions.xml')
+        self.playerFac = PlayerFactory('player_descriptions.xml')
+        self.table = TypeTable(self.unitFac, self.playerFac)
+        self.player = self.playerFac.create('Camel', self.unitFac,
+                baseWeights=[3], baseNames=['Swordsman'],
+                specialWeights=[10], specialNames=['Swordsman'],
+                specialRarity=[10])
+
+    def unit(self, color):
+        return self.unitFac.create('Swordsman', color, self.player)
+
+    def applyDeltas(self, encoder, view):
+        """Apply all pending deltas to view, a dict from piece ids to
+        (position, typeId, colorId). Returns the flags of all the records."""
+        allFlags = []
+        while encoder.hasDelta():
+            seq, records = decodeDelta(encoder.popDelta())
+            allFlags.extend(self.applyRecords(records, view))
+        return allFlags
+
+    def applyRecords(self, records, view):
+        for pid, flags, old, new, typeId, colorId in records:
+            if flags & DISAPPEAR:
+                del view[pid]
+            else:
+                view[pid] = (new, typeId, colorId)
+        return [r[1] for r in records]
+
+    def boardView(self, board):
+        return sorted((tuple(p.position),) + self.table.encode(p) for p in board.units)
+
+    def checkView(self, view, board):
+        self.assertEqual(sorted(view.values()), self.boardView(board))
+
+    def testDeltas(self):
+        b = Board(4, 4)
+        b.addPiece(self.unit('red'), 0)
+        b.normalize()
+        encoder = BoardDeltaEncoder(b, self.table)
+        view = {}
+        self.applyDeltas(encoder, view)
+        self.checkView(view, b)
+
+        # Charging replaces the front piece with a charged unit.
+        b.addPiece(self.unit('red'), 0)
+        b.addPiece(self.unit('red'), 0)
+        b.addPiece(self.unit('blue'), 1)
+        b.normalize()
+        flags = self.applyDeltas(encoder, view)
+        self.assertIn(APPEAR | REPLACE, flags)
+        self.checkView(view, b)
+
+    def testCoalesce(self):
+        b = Board(4, 4)
+        encoder = BoardDeltaEncoder(b, self.table, maxPending=1)
+        view = {}
+        self.applyDeltas(encoder, view)
+        for i in range(3):
+            b.addPiece(self.unit('white'), 2)
+            b.normalize()
+        self.assertTrue(len(encoder.pending) <= 2)
+
+        # The three pieces that appeared were charged before the consumer
+        # saw them, so they shouldn't be sent at all.
+        seq, records = decodeDelta(encoder.popAll())
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0][1], APPEAR)
+        self.applyRecords(records, view)
+        self.checkView(view, b)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from described_object_factory import UnitFactory, PlayerFactory
+from board_generator import generateBoard
+
+class TestBoardGenerator(unittest.TestCase):
+    def setUp(self):
+        self.unitFac = UnitFactory('unit_descriptions.xml')
+        self.playerFac = PlayerFactory('player_descriptions.xml')
+        self.player = self.playerFac.create('Camel', self.unitFac,
+                baseWeights=[1, 1, 1], baseNames=['Archer', 'Swordsman', 'Swordsman'],
+                specialWeights=[10], specialNames=['Angel'], specialRarity=[3])
+
+    def describe(self, board):
+        return sorted((tuple(p.position), p.name, getattr(p, 'color', None), p.toughness)
+                      for p in board.units)
+
+    def testNormalized(self):
+        params = [{},
+                  {'density': 0.9, 'fattyRatio': 0.5},
+                  {'chargedRatio': 0.4, 'wallDensity': 0.8},
+                  {'height': 12, 'width': 10, 'density': 0.8}]
+        for kwargs in params:
+            for seed in range(30):
+                board = generateBoard(self.player, seed, **kwargs)
+                self.assertTrue(board.selfConsistent())
+                before = self.describe(board)
+
+                events = []
+                board.pieceUpdated.addHandler(events.append)
+                board.attackMade.addHandler(events.append)
+                board.wallMade.addHandler(events.append)
+                board.normalize()
+                self.assertEqual(events, [], 'seed %d, %s' % (seed, kwargs))
+                self.assertEqual(self.describe(board), before)
+
+    def testSeeds(self):
+        a = generateBoard(self.player, 3)
+        b = generateBoard(self.player, 3)
+        c = generateBoard(self.player, 4)
+        self.assertEqual(self.describe(a), self.describe(b))
+        self.assertNotEqual(self.describe(a), self.describe(c))
+
+    def testParameters(self):
+        board = generateBoard(self.player, 0, 8, 8, density=0.5, fattyRatio=0,
+                              chargedRatio=0, wallDensity=1)
+        filled = sum(p.height * p.width for p in board.units)
+        self.assertTrue(32 <= filled <= 40)
+        self.assertEqual(board.currentAttacks, set())
+        self.assertEqual([board[0, j].name for j in range(8)], ['Wall'] * 8)
+        self.assertTrue(all(p.size == (1, 1) for p in board.units))
+
+        board = generateBoard(self.player, 0, chargedRatio=0.5, unitNames=['Archer'])
+        self.assertTrue(board.currentAttacks)
+        self.assertEqual(set(p.name for p in board.units) - set(['Wall']),
+                         set(['Archer', 'Archer Charged']))
+
+if __name__ == '__main__':
+    unittest.main()
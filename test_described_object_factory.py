@@ -1,6 +1,13 @@
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
 
-from described_object_factory import UnitFactory
+import described_object_factory
+from described_object_factory import UnitFactory, loadDescriptions
 from unit import Unit
 
 class TestDescribedObjectFactory(unittest.TestCase):
@@ -14,6 +21,73 @@ class TestDescribedObjectFactory(unittest.TestCase):
         with self.assertRaises(ValueError):
             uf.create('Swordsmanblah', 'foobar', player=None)
 
+    def testRelease(self):
+        uf = UnitFactory('unit_descriptions.xml')
+        s = uf.create('Swordsman', 'red', player=None)
+        s.position = [1, 2]
+        s.toughness = 1
+        self.assertTrue(uf.release(s))
+        self.assertFalse(uf.release(object()))
+
+        t = uf.create('Swordsman', 'blue', player=None)
+        self.assertTrue(t is s)
+        self.assertEqual((t.color, t.toughness, t.position), ('blue', 3, None))
+        self.assertTrue(uf.create('Archer', 'red', player=None) is not s)
+
+        charged = t.charge()
+        self.assertFalse(uf.release(charged))
+
+class TestDescriptionCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.xml = os.path.join(self.dir, 'units.xml')
+        shutil.copy('unit_descriptions.xml', self.xml)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        described_object_factory._loaded.clear()
+
+    def testNumbersConverted(self):
+        desc = loadDescriptions(self.xml)
+        self.assertEqual(desc['Swordsman']['toughness'], 3)
+        self.assertEqual(desc['Swordsman']['charge']['maxPower'], 11)
+        self.assertEqual(desc['Swordsman']['imageBase'], 'images/human/swordsman')
+
+    def testCacheReused(self):
+        desc = loadDescriptions(self.xml)
+        self.assertTrue(os.path.exists(self.xml + described_object_factory.CACHE_SUFFIX))
+
+        # Loading from the on-disk cache shouldn't need to parse the XML.
+        described_object_factory._loaded.clear()
+        compile = described_object_factory.compileDescriptions
+        def fail(f): self.fail('recompiled an up-to-date description file')
+        described_object_factory.compileDescriptions = fail
+        try:
+            self.assertEqual(loadDescriptions(self.xml), desc)
+        finally:
+            described_object_factory.compileDescriptions = compile
+
+    def testCacheInvalidated(self):
+        loadDescriptions(self.xml)
+        with open(self.xml) as f:
+            text = f.read()
+        with open(self.xml, 'w') as f:
+            f.write(text.replace('<toughness>3</toughness>', '<toughness>4</toughness>', 1))
+        mtime = os.path.getmtime(self.xml)
+        os.utime(self.xml, (mtime + 10, mtime + 10))
+
+        self.assertEqual(loadDescriptions(self.xml)['Swordsman']['toughness'], 4)
+
+    def testLightImport(self):
+        # Reading descriptions shouldn't pull in numpy or the XML parser
+        # (once they are cached).
+        loadDescriptions('unit_descriptions.xml')
+        code = ('import sys, described_object_factory as d; '
+                'd.UnitFactory("unit_descriptions.xml"); '
+                'print(sorted(m for m in ("numpy", "xml.etree.ElementTree") '
+                'if m in sys.modules))')
+        out = subprocess.check_output([sys.executable, '-c', code])
+        self.assertEqual(out.strip(), '[]')
+
 if __name__ == '__main__':
     unittest.main()
-
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import json
+import unittest
+
+import numpy as np
+
+from board import Board
+import fuzz_board
+
+class NoWallsBoard(Board):
+    """A broken engine, where units never turn into walls."""
+
+    def _transformFull(self, piece):
+        return False
+
+class TestFuzzBoard(unittest.TestCase):
+    def testSameEngine(self):
+        fuzzer = fuzz_board.Fuzzer(Board)
+        for seed in range(5):
+            self.assertEqual(fuzzer.trial(seed, 30), None)
+
+    def testShrink(self):
+        fuzzer = fuzz_board.Fuzzer(NoWallsBoard)
+        for seed in range(50):
+            case = fuzzer.trial(seed, 30)
+            if case is not None:
+                break
+        self.assertNotEqual(case, None)
+
+        shrunk = fuzzer.shrink(case)
+        self.assertEqual(shrunk['actions'], [('normalize',)])
+        # Every piece that is left is needed.
+        pieces = shrunk['startConfig']
+        for i in range(len(pieces)):
+            smaller = dict(shrunk, startConfig=pieces[:i] + pieces[i + 1:])
+            self.assertEqual(fuzzer.diverges(smaller), None)
+
+        config = fuzzer.testConfig(shrunk)
+        self.assertTrue('actions' not in config)
+        self.assertTrue(len(config['startConfig']) < len(case['startConfig']))
+
+        # The result is in the format of test_board_configurations.json.
+        config = json.loads(json.dumps(config))
+        for boardClass, same in [(Board, True), (NoWallsBoard, False)]:
+            board = boardClass(*config['dimensions'])
+            for pieceDesc in config['startConfig']:
+                fuzz_board.addJSONPiece(board, pieceDesc, fuzzer.unitFac, fuzzer.player)
+            board.normalize()
+            self.assertEqual(fuzz_board.boardToJSON(board) == config['endConfig'], same)
+
+    def testShrinkUnreproducible(self):
+        # The engines agree, as if the failure had gone away.
+        fuzzer = fuzz_board.Fuzzer(Board)
+        case = dict(fuzzer.randomConfig(np.random.RandomState(0)), seed=0,
+                    actions=[('beginTurn',), ('normalize',)])
+        self.assertEqual(fuzzer.shrink(case), case)
+        self.assertTrue('actions' in fuzzer.testConfig(case))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+import socket
+import unittest
+
+from board import Board
+from game_manager import GameManager
+from described_object_factory import UnitFactory, PlayerFactory
+from type_table import TypeTable
+from board_delta import decodeDelta
+from game_server import GameServer, encodeFrame, decodeFrames
+from replay import encodeAction
+
+class TestGameServer(unittest.TestCase):
+    def setUp(self):
+        self.unitFac = UnitFactory('unit_descriptions.xml')
+        self.playerFac = PlayerFactory('player_descriptions.xml')
+        self.table = TypeTable(self.unitFac, self.playerFac)
+        self.server = GameServer(('127.0.0.1', 0), self.newGame, self.table)
+        self.clients = []
+
+    def tearDown(self):
+        for c in self.clients:
+            c.close()
+        self.server.close()
+
+    def newGame(self):
+        players = [self.playerFac.create('Camel', self.unitFac,
+                       baseWeights=[1, 1, 1], baseNames=['Archer', 'Swordsman', 'Swordsman'],
+                       specialWeights=[10], specialNames=['Angel'], specialRarity=[3])
+                   for i in range(2)]
+        return GameManager(players[0], Board(6, 8), players[1], Board(6, 8))
+
+    def connect(self, session):
+        sock = socket.create_connection(self.server.address)
+        sock.setblocking(False)
+        sock.sendall(encodeFrame('J' + session))
+        self.clients.append(sock)
+        return [sock, '']
+
+    def receive(self, client):
+        """Runs the server for a bit, and returns the frames that the
+        client received."""
+        for i in range(20):
+            self.server.poll(0.01)
+        try:
+            client[1] += client[0].recv(1 << 20)
+        except socket.error:
+            pass
+        frames, client[1] = decodeFrames(client[1])
+        return frames
+
+    def testSession(self):
+        a = self.connect('game')
+        b = self.connect('game')
+        framesA = self.receive(a)
+        framesB = self.receive(b)
+        self.assertEqual(framesA[0], 'S\x00')
+        self.assertEqual(framesB[0], 'S\x01')
+        self.assertEqual(len(self.server.sessions), 1)
+        session = self.server.sessions['game']
+
+        # Only the first player can move.
+        b[0].sendall(encodeFrame('A' + encodeAction('callPieces', ())))
+        self.assertEqual(self.receive(b)[0][0], 'E')
+
+        a[0].sendall(encodeFrame('A' + encodeAction('callPieces', ())))
+        frames = self.receive(a)
+        self.assertEqual(session.stats.actions, 1)
+        deltas = [f for f in frames if f[0] == 'D' and f[1] == '\x00']
+        pieces = set()
+        for d in deltas:
+            seq, records = decodeDelta(d[2:])
+            pieces.update(r[0] for r in records)
+        self.assertEqual(len(pieces), len(session.manager.boards[0].units))
+
+        # Actions after the end of the turn are refused, even in the
+        # same frame.
+        turn = session.manager.turn
+        a[0].sendall(encodeFrame('A' + encodeAction('endTurn', ()) +
+                                 encodeAction('callPieces', ())))
+        self.assertEqual([f for f in self.receive(a) if f[0] == 'E'], ['Enot your turn'])
+        self.assertEqual(session.manager.turn, turn + 1)
+        self.assertEqual(session.manager.boards[1].units, set())
+
+        # A third client can't join.
+        c = self.connect('game')
+        self.assertEqual(self.receive(c)[0][0], 'E')
+
+        # Once both players leave, the session is closed.
+        a[0].close()
+        b[0].close()
+        self.receive(c)
+        self.assertEqual(self.server.sessions, {})
+
+    def testIllegalMove(self):
+        game = self.newGame()
+        board = game.boards[0]
+        bottom = self.unitFac.create('Swordsman', 'red', player=game.players[0])
+        top = self.unitFac.create('Swordsman', 'blue', player=game.players[0])
+        board.addPiece(bottom, 0)
+        board.addPiece(top, 0)
+        self.server.newGame = lambda: game
+
+        a = self.connect('game')
+        self.connect('game')
+        self.receive(a)
+
+        # The bottom piece can't be picked up from under the top one.
+        a[0].sendall(encodeFrame('A' + encodeAction('movePiece', (0, 0, 5))))
+        self.assertEqual([f for f in self.receive(a) if f[0] == 'E'], ['Eillegal action'])
+        self.assertEqual(board[0, 0], bottom)
+
+        # Neither can a piece that isn't moveable.
+        top.moveable = False
+        a[0].sendall(encodeFrame('A' + encodeAction('movePiece', (1, 0, 5))))
+        self.assertEqual([f for f in self.receive(a) if f[0] == 'E'], ['Eillegal action'])
+        self.assertEqual(board[1, 0], top)
+        self.assertEqual(self.server.sessions['game'].stats.actions, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+import gc
+import logging
+import unittest
+import weakref
+
+from board import Board
+from event_hook import EventHook
+from game_manager import GameManager
+import leak_check
+
+class Listener(object):
+    def __init__(self):
+        self.calls = []
+
+    def handle(self, x):
+        self.calls.append(x)
+
+class TestWeakHandlers(unittest.TestCase):
+    def testBoundMethod(self):
+        hook = EventHook()
+        listener = Listener()
+        hook.addWeakHandler(listener.handle)
+        hook.addWeakHandler(listener.handle)
+        hook.addHandler(listener.handle)
+        hook.callHandlers(1)
+        self.assertEqual(listener.calls, [1])
+
+        ref = weakref.ref(listener)
+        del listener
+        gc.collect()
+        self.assertEqual(ref(), None)
+        self.assertEqual(hook._handlers, [])
+        hook.callHandlers(2)
+
+    def testRemove(self):
+        hook = EventHook()
+        listener = Listener()
+        hook.addWeakHandler(listener.handle)
+        hook.removeHandler(listener.handle)
+        hook.callHandlers(1)
+        self.assertEqual(listener.calls, [])
+
+    def testFunction(self):
+        hook = EventHook()
+        calls = []
+        def handler(x):
+            calls.append(x)
+        hook.addWeakHandler(handler)
+        hook.callHandlers(1)
+        del handler
+        gc.collect()
+        hook.callHandlers(2)
+        self.assertEqual(calls, [1])
+
+class TestLeakCheck(unittest.TestCase):
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.check = leak_check.LeakCheck(actions=8, seed=1)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def testTeardown(self):
+        players = self.check.players
+        boards = [Board(6, 8), Board(6, 8)]
+        manager = GameManager(players[0], boards[0], players[1], boards[1])
+        manager.switchTurn.addHandler(lambda: None)
+        manager.teardown()
+        for hook in [players[0].justDied, boards[0].wallMade, boards[0].attackNow,
+                     boards[1].attackReceived, manager.switchTurn]:
+            self.assertEqual(hook._handlers, [])
+
+        # The players don't keep a game alive, even without teardown.
+        ref = weakref.ref(GameManager(players[0], Board(6, 8), players[1], Board(6, 8)))
+        gc.collect()
+        self.assertEqual(ref(), None)
+        self.assertEqual(players[0].justDied._handlers, [])
+
+    def testNoLeaks(self):
+        checkpoints = self.check.run(12, interval=4, warmup=4)
+        self.assertEqual([c[0] for c in checkpoints], [4, 8, 12])
+        self.assertEqual(leak_check.leaks(checkpoints, 64), [])
+        # The memory is only measured with tracemalloc.
+        self.assertEqual(checkpoints[-1][3] is None, leak_check.tracemalloc is None)
+
+    def testLeaks(self):
+        checkpoints = [(10, 100, 5000, 1000), (20, 150, 5000, 1000)]
+        self.assertEqual(len(leak_check.leaks(checkpoints, 64)), 1)
+        checkpoints = [(10, 100, 5000, 1000), (20, 100, 5010, 1000)]
+        self.assertEqual(len(leak_check.leaks(checkpoints, 64)), 1)
+        checkpoints = [(10, 100, 5000, 1000), (20, 100, 5009, 1640)]
+        self.assertEqual(leak_check.leaks(checkpoints, 64), [])
+        # Objects that only appear once aren't a leak.
+        checkpoints = [(10, 100, 5000, 1000), (15, 100, 5030, 1000), (20, 100, 5030, 1000)]
+        self.assertEqual(leak_check.leaks(checkpoints, 64), [])
+        checkpoints = [(10, 100, 5000, 1000), (20, 100, 5000, 1650)]
+        self.assertEqual(len(leak_check.leaks(checkpoints, 64)), 1)
+        # Without tracemalloc, the memory isn't checked.
+        checkpoints = [(10, 100, 5000, None), (20, 100, 5000, None)]
+        self.assertEqual(leak_check.leaks(checkpoints, 64), [])
+
+if __name__ == '__main__':
+    unittest.main()
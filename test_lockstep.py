@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import numpy as np
+
+from board import Board
+from game_manager import GameManager
+from described_object_factory import UnitFactory, PlayerFactory
+from type_table import TypeTable
+from lockstep import LockstepPeer, stateHash
+from replay import encodeAction
+
+class TestLockstep(unittest.TestCase):
+    def setUp(self):
+        self.unitFac = UnitFactory('unit_descriptions.xml')
+        self.playerFac = PlayerFactory('player_descriptions.xml')
+        self.table = TypeTable(self.unitFac, self.playerFac)
+
+    def newGame(self, seed):
+        players = [self.playerFac.create('Camel', self.unitFac,
+                       baseWeights=[1, 1, 1], baseNames=['Archer', 'Swordsman', 'Swordsman'],
+                       specialWeights=[10], specialNames=['Angel'], specialRarity=[3])
+                   for i in range(2)]
+        return GameManager(players[0], Board(6, 8), players[1], Board(6, 8), seed=seed)
+
+    def connect(self, seed):
+        """Makes two peers playing the same game, with a message queue
+        between them."""
+        games = [self.newGame(seed), self.newGame(seed)]
+        self.queues = [[], []]
+        peers = [LockstepPeer(games[i], i, self.queues[1 - i].append, self.table)
+                 for i in range(2)]
+        self.desyncs = []
+        def desynced(turn, local, remote):
+            self.desyncs.append(turn)
+        for p in peers:
+            p.desynced.addHandler(desynced)
+        return games, peers
+
+    def deliver(self, peers):
+        while self.queues[0] or self.queues[1]:
+            for peer, queue in zip(peers, self.queues):
+                while queue:
+                    peer.receive(queue.pop(0))
+
+    def playRandomly(self, games, peers, actions, rand):
+        for i in range(actions):
+            seat = [p.localTurn for p in peers].index(True)
+            game = games[seat]
+            board = game.currentBoard
+            choice = rand.randint(4)
+            if choice == 0:
+                game.callPieces()
+            elif choice == 1 and board.units:
+                piece = sorted(board.units, key=lambda p: p.position)[rand.randint(len(board.units))]
+                game.movePiece(piece, rand.randint(board.width))
+            elif choice == 2 and board.units:
+                piece = sorted(board.units, key=lambda p: p.position)[rand.randint(len(board.units))]
+                game.deletePiece(list(piece.position))
+            else:
+                game.endTurn()
+            self.deliver(peers)
+
+    def testStaysInSync(self):
+        games, peers = self.connect(12)
+        self.playRandomly(games, peers, 80, np.random.RandomState(3))
+        self.assertTrue(games[0].turn > 2)
+        self.assertEqual(self.desyncs, [])
+        self.assertEqual(stateHash(games[0], self.table),
+                         stateHash(games[1], self.table))
+
+    def testSeparateGamesDontShareRandomNumbers(self):
+        a, b = self.newGame(7), self.newGame(7)
+        a.callPieces()
+        np.random.uniform()
+        b.callPieces()
+        self.assertEqual(stateHash(a, self.table), stateHash(b, self.table))
+
+    def testDetectsDesync(self):
+        games, peers = self.connect(12)
+        games[1].players[0].effWeights[0] += 1
+        games[0].endTurn()
+        self.deliver(peers)
+        self.assertEqual(self.desyncs, [1, 1])
+
+    def testRejectsActionOutOfTurn(self):
+        games, peers = self.connect(12)
+        self.assertRaises(ValueError, peers[0].receive, 'A\x05')
+
+        # Actions after the end of the turn are refused, even in the
+        # same message.
+        games[0].endTurn()
+        self.deliver(peers)
+        games[1].callPieces()
+        games[1].endTurn()
+        self.deliver(peers)
+        piece = games[1].boards[1][0, 0]
+        self.assertIsNotNone(piece)
+        message = 'A' + encodeAction('endTurn', ()) + encodeAction('deletePiece', (0, 0))
+        self.assertRaises(ValueError, peers[1].receive, message)
+        self.assertTrue(peers[1].localTurn)
+        self.assertIs(games[1].boards[1][0, 0], piece)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import json
+import unittest
+from StringIO import StringIO
+
+from board import Board
+from described_object_factory import UnitFactory, PlayerFactory
+from normalize_profiler import NormalizeProfiler, HistogramSink, JsonLinesSink, PHASES
+import fuzz_board
+
+class ListSink(object):
+    def __init__(self):
+        self.records = []
+
+    def record(self, record):
+        self.records.append(record)
+
+class TestNormalizeProfiler(unittest.TestCase):
+    def setUp(self):
+        self.unitFac = UnitFactory('unit_descriptions.xml')
+        self.playerFac = PlayerFactory('player_descriptions.xml')
+        self.player = self.playerFac.create('Camel', self.unitFac,
+                baseWeights=[3], baseNames=['Swordsman'],
+                specialWeights=[10], specialNames=['Swordsman'],
+                specialRarity=[10])
+        configs = json.load(open('test_board_configurations.json'))
+        self.configs = dict((c['comment'], c) for c in configs)
+
+    def buildBoard(self, comment):
+        config = self.configs[comment]
+        board = Board(*config['dimensions'])
+        for pieceDesc in config['startConfig']:
+            fuzz_board.addJSONPiece(board, pieceDesc, self.unitFac, self.player)
+        return board
+
+    def normalize(self, board):
+        events = []
+        board.pieceUpdated.addHandler(lambda pieces: events.append(
+            sorted((p.name, tuple(p.position or ())) for p in pieces)))
+        board.normalize()
+        return events, fuzz_board.boardToJSON(board)
+
+    def testRecords(self):
+        comment = 'Test L-shape: this should make walls and a charging formation'
+        sink = ListSink()
+        board = self.buildBoard(comment)
+        board.profiler = NormalizeProfiler([sink])
+        profiled = self.normalize(board)
+
+        # Profiling doesn't change what normalize does.
+        self.assertEqual(profiled, self.normalize(self.buildBoard(comment)))
+
+        self.assertEqual(len(sink.records), 1)
+        record = sink.records[0]
+        self.assertEqual((record['height'], record['width'], record['pieces']), (4, 3, 5))
+        self.assertEqual(record['counts']['formations'], 1)
+        self.assertEqual(record['counts']['walls'], 3)
+        self.assertEqual(record['counts']['merges'], 0)
+        self.assertTrue(record['counts']['passes'] >= 2)
+        self.assertEqual(set(record['times']), set(PHASES))
+        self.assertTrue(record['total'] >= sum(record['times'].values()) - record['times']['alignFatty'])
+        self.assertFalse('error' in record)
+
+        board.normalize()
+        self.assertEqual(sink.records[1]['counts']['passes'], 1)
+        self.assertEqual(sink.records[1]['counts']['formations'], 0)
+
+    def testFatties(self):
+        sink = ListSink()
+        board = self.buildBoard('Fatty alignment challenge: None error')
+        board.profiler = NormalizeProfiler([sink])
+        board.normalize()
+        self.assertTrue(sink.records[0]['counts']['alignFattyTries'] > 0)
+        self.assertTrue(sink.records[0]['times']['alignFatty'] > 0)
+
+    def testSinks(self):
+        histogram = HistogramSink(keepSlowest=2)
+        out = StringIO()
+        profiler = NormalizeProfiler([histogram, JsonLinesSink(out)])
+        for comment in sorted(self.configs)[:4]:
+            board = self.buildBoard(comment)
+            board.profiler = profiler
+            board.normalize()
+
+        self.assertEqual(histogram.calls, 4)
+        self.assertEqual(sum(histogram.histograms['total']), 4)
+        self.assertEqual(len(histogram.slowest()), 2)
+        self.assertTrue(histogram.slowest()[0]['total'] >= histogram.slowest()[1]['total'])
+        self.assertTrue(histogram.report().startswith('4 normalize calls'))
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(sum(json.loads(l)['counts']['formations'] for l in lines),
+                         histogram.counts['formations'])
+
+    def testErrors(self):
+        class FailingBoard(Board):
+            def _createFormations(self):
+                raise ValueError('oops')
+
+        sink = ListSink()
+        board = FailingBoard(4, 4)
+        board.profiler = NormalizeProfiler([sink])
+        self.assertRaises(ValueError, board.normalize)
+        self.assertEqual(sink.records[0]['error'], 'ValueError')
+        self.assertEqual(board.profiler._records, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from object_pool import KeyedPool
+
+class TestKeyedPool(unittest.TestCase):
+    def testReusesByKey(self):
+        pool = KeyedPool()
+        a = pool.acquire('a', object)
+        self.assertTrue(pool.release('a', a))
+        self.assertTrue(pool.acquire('b', object) is not a)
+        self.assertTrue(pool.acquire('a', object) is a)
+        self.assertEqual((pool.created, pool.reused), (2, 1))
+        self.assertEqual(len(pool), 0)
+
+    def testMaxPerKey(self):
+        pool = KeyedPool(maxPerKey=2)
+        objs = [object() for i in range(3)]
+        self.assertEqual([pool.release('a', x) for x in objs], [True, True, False])
+        self.assertTrue(pool.release('b', objs[2]))
+        self.assertEqual(len(pool), 3)
+        self.assertEqual(pool.free('a'), objs[:2])
+
+    def testReset(self):
+        pool = KeyedPool()
+        a = pool.acquire('a', list, lambda x: x.append('reset'))
+        self.assertEqual(a, [])
+        pool.release('a', a)
+        self.assertTrue(pool.acquire('a', list, lambda x: x.append('reset')) is a)
+        self.assertEqual(a, ['reset'])
+
+    def testClear(self):
+        pool = KeyedPool()
+        pool.release('a', object())
+        pool.clear()
+        self.assertEqual(pool.free(), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import unittest
+from StringIO import StringIO
+
+from event_hook import EventHook
+from perf_stats import PerfStats, handlerName
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class Handlers(object):
+    def onEvent(self, x):
+        pass
+
+class TestPerfStats(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.stats = PerfStats(keepFrames=3, slowFrame=1.0, clock=self.clock)
+
+    def tearDown(self):
+        EventHook.profiler = None
+
+    def testFrames(self):
+        self.assertEqual(self.stats.summary(), {})
+        for seconds in [0.01, 0.02, 0.03, 0.04]:
+            self.stats.frame(seconds, 12, [0, 2])
+        summary = self.stats.summary()
+        self.assertEqual(summary['frames'], 3)
+        self.assertAlmostEqual(summary['meanFrame'], 30)
+        self.assertAlmostEqual(summary['maxFrame'], 40)
+        self.assertEqual(summary['drawCalls'], 12)
+        self.assertEqual(summary['queueDepths'], [0, 2])
+        self.assertEqual(summary['latency'], None)
+
+    def testLatency(self):
+        # Stages without a pending input don't count.
+        self.stats.stageStarted(3)
+        self.assertEqual(len(self.stats.latencies), 0)
+
+        self.clock.now = 1.0
+        self.stats.inputStarted('SPACE')
+        self.clock.now = 1.25
+        self.stats.stageStarted(3)
+        self.clock.now = 1.5
+        self.stats.stageStarted(1)
+        self.assertEqual(list(self.stats.latencies), [('SPACE', 0.25)])
+        self.assertEqual(self.stats.frame(0.01).latency, 0.25)
+        self.assertEqual(self.stats.frame(0.01).latency, None)
+        self.assertAlmostEqual(self.stats.summary()['latency'], 250)
+
+    def testHandlers(self):
+        hook = EventHook()
+        handlers = Handlers()
+        hook.addHandler(handlers.onEvent)
+        hook.addHandler(lambda x: None)
+
+        hook.callHandlers(1)
+        self.assertEqual(self.stats.handlers, {})
+
+        EventHook.profiler = self.stats
+        hook.callHandlers(1)
+        hook.callHandlers(2)
+        names = sorted(self.stats.handlers)
+        self.assertEqual(names[0], 'Handlers.onEvent')
+        self.assertTrue(names[1].startswith('lambda at test_perf_stats.py:'))
+        self.assertEqual(self.stats.handlers['Handlers.onEvent'].calls, 2)
+        self.assertEqual(handlerName(len), 'len')
+        self.assertEqual(len(self.stats.slowestHandlers(1)), 1)
+
+    def testNestedHandlers(self):
+        # A handler's time includes the handlers that it triggers, so those
+        # don't count towards the frame again.
+        inner = EventHook()
+        inner.addHandler(lambda: None)
+        outer = EventHook()
+        outer.addHandler(inner.callHandlers)
+        EventHook.profiler = self.stats
+        outer.callHandlers()
+        outer.callHandlers()
+        frame = self.stats.frame(0.01)
+        self.assertEqual(self.stats.handlers['EventHook.callHandlers'].calls, 2)
+        self.assertAlmostEqual(frame.handlerSeconds,
+                               self.stats.handlers['EventHook.callHandlers'].total)
+
+    def testCSV(self):
+        self.stats.handlerCalled(Handlers().onEvent, 0.002)
+        self.stats.frame(0.02, 5, [1, 0])
+        self.stats.frame(0.03, 6, [0, 0])
+
+        f = StringIO()
+        self.stats.writeFramesCSV(f)
+        rows = list(csv.reader(StringIO(f.getvalue())))
+        self.assertEqual(rows[0], ['time', 'frame_ms', 'draw_calls', 'handler_ms',
+                                   'latency_ms', 'queue0', 'queue1'])
+        self.assertEqual(rows[1][1:], ['20.000', '5', '2.000', '', '1', '0'])
+        self.assertEqual(rows[2][3], '0.000')
+
+        f = StringIO()
+        self.stats.writeHandlersCSV(f)
+        rows = list(csv.reader(StringIO(f.getvalue())))
+        self.assertEqual(rows[1], ['Handlers.onEvent', '1', '2.000', '2.000'])
+
+if __name__ == '__main__':
+    unittest.main()
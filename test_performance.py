@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Performance regression tests.
+
+These are skipped unless the CLASHADASH_PERF environment variable is set:
+
+    CLASHADASH_PERF=1 python -m unittest test_performance
+        compares the median time of every scenario with the baseline in
+        performance_baseline.json, and fails if any of them got slower by
+        more than the tolerance.
+    CLASHADASH_PERF=record python -m unittest test_performance
+        measures the scenarios and writes a new baseline.
+
+The times are divided by the time of a calibration loop, so that a
+baseline recorded on one machine can be checked on another. The
+tolerance is generous, since timings are noisy; the tests are meant to
+catch things like an accidental quadratic loop, not a 5% slowdown.
+"""
+
+import json
+import logging
+import os
+import timeit
+import unittest
+
+import numpy as np
+
+from board import Board
+from described_object_factory import UnitFactory, PlayerFactory
+import benchmark_board
+import fuzz_board
+import snapshot
+
+MODE = os.environ.get('CLASHADASH_PERF')
+BASELINE_FILE = 'performance_baseline.json'
+
+# The slowdown (as a fraction of the baseline) that fails a scenario,
+# unless the baseline file says otherwise.
+TOLERANCE = 0.5
+
+# How many times each board configuration is replayed per sample.
+CONFIGURATION_REPLAYS = 50
+
+class _Thing(object):
+    def __init__(self, n):
+        self.n = n
+
+def calibrationLoop():
+    """A fixed amount of interpreter work (object creation, dict and list
+    operations and attribute lookups, like the board code)."""
+
+    things = {}
+    for i in range(5000):
+        t = _Thing(i)
+        things[i % 97] = [t.n, t]
+        if t.n in things:
+            things[t.n][0] += 1
+    return things
+
+def relativeMedian(setup, run, samples=15):
+    """Returns the median time of run(setup()), in units of the calibration
+    loop; setup is not timed.
+
+    The calibration loop runs right before every sample, so that a machine
+    that is busy for a while slows down both.
+    """
+
+    ratios = []
+    for i in range(samples):
+        arg = setup()
+        start = timeit.default_timer()
+        calibrationLoop()
+        calibration = timeit.default_timer() - start
+        start = timeit.default_timer()
+        run(arg)
+        ratios.append((timeit.default_timer() - start) / calibration)
+    return float(np.median(ratios))
+
+@unittest.skipUnless(MODE, 'set CLASHADASH_PERF to run the performance tests')
+class TestPerformance(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Logging would mostly measure the terminal.
+        logging.disable(logging.CRITICAL)
+        cls.baseline = {}
+        if os.path.exists(BASELINE_FILE):
+            with open(BASELINE_FILE) as f:
+                cls.baseline = json.load(f)
+        cls.measured = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+        if MODE == 'record':
+            baseline = {'tolerance': cls.baseline.get('tolerance', TOLERANCE),
+                        'scenarios': cls.measured}
+            with open(BASELINE_FILE, 'w') as f:
+                json.dump(baseline, f, indent=1, sort_keys=True)
+                f.write('\n')
+
+    def setUp(self):
+        self.unitFac = UnitFactory('unit_descriptions.xml')
+        self.playerFac = PlayerFactory('player_descriptions.xml')
+        self.player = self.playerFac.create('Camel', self.unitFac,
+                baseWeights=[3], baseNames=['Swordsman'],
+                specialWeights=[10], specialNames=['Swordsman'],
+                specialRarity=[10])
+
+    def check(self, scenarios):
+        """Checks (or records) a dict of scenario names and relative times."""
+
+        failures = []
+        tolerance = self.baseline.get('tolerance', TOLERANCE)
+        for name, relative in sorted(scenarios.items()):
+            self.measured[name] = relative
+            if MODE == 'record':
+                continue
+            expected = self.baseline.get('scenarios', {}).get(name)
+            if expected is None:
+                failures.append('%s: not in %s' % (name, BASELINE_FILE))
+            elif relative > expected * (1 + tolerance):
+                failures.append('%s: %.1f%% slower than the baseline'
+                                % (name, (relative / expected - 1) * 100))
+        if failures:
+            self.fail('\n'.join(failures))
+
+    def testBoardConfigurations(self):
+        configs = json.load(open('test_board_configurations.json'))
+
+        def setup(config):
+            boards = []
+            for i in range(CONFIGURATION_REPLAYS):
+                b = Board(*config['dimensions'])
+                for pieceDesc in config['startConfig']:
+                    fuzz_board.addJSONPiece(b, pieceDesc, self.unitFac, self.player)
+                boards.append(b)
+            return boards
+
+        def run(boards):
+            for b in boards:
+                b.normalize()
+
+        scenarios = {}
+        for config in configs:
+            name = 'configuration: ' + config['comment']
+            scenarios[name] = relativeMedian(lambda: setup(config), run)
+        self.check(scenarios)
+
+    def testGetPieces(self):
+        # A tall board full of small pieces.
+        board = Board(128, 8)
+        for i in range(board.height):
+            for j in range(board.width):
+                piece = self.unitFac.create('Swordsman', 'blue', self.player)
+                board.addPieceAtPosition(piece, i, j)
+
+        rows = range(board.height)
+        cols = range(board.width)
+        self.check({'getPieces 128x8':
+                    relativeMedian(lambda: None,
+                                   lambda arg: board.getPieces(rows, cols))})
+
+    def testBenchmarkScenarios(self):
+        benchmark = benchmark_board.Benchmark(seed=0)
+        operations = dict((name, (setup, run))
+                          for name, setup, run in benchmark.operations)
+        scenarios = {}
+        for size, opNames in [((8, 8), ['normalize', 'colToAdd', 'callPieces']),
+                              ((16, 16), ['normalize', 'ghostBoard'])]:
+            scenario = {'height': size[0], 'width': size[1],
+                        'density': 0.7, 'mix': 'mixed'}
+            board = benchmark.buildBoard(scenario, benchmark.seed)
+            data = snapshot.packBoard(board, benchmark.table)
+            for opName in opNames:
+                setup, run = operations[opName]
+                random = np.random.RandomState(benchmark.seed)
+                name = '%s %s' % (benchmark_board.scenarioName(scenario), opName)
+                scenarios[name] = relativeMedian(lambda: setup(data, random), run)
+        self.check(scenarios)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import numpy as np
+
+from board import Board
+from game_manager import GameManager
+from described_object_factory import UnitFactory, PlayerFactory
+from type_table import TypeTable
+from replay import ReplayLog, replay, VERSION
+import snapshot
+
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        self.unitFac = UnitFactory('unit_descriptions.xml')
+        self.playerFac = PlayerFactory('player_descriptions.xml')
+        self.table = TypeTable(self.unitFac, self.playerFac)
+
+    def newGame(self):
+        players = [self.playerFac.create('Camel', self.unitFac,
+                       baseWeights=[1, 1, 1], baseNames=['Archer', 'Swordsman', 'Swordsman'],
+                       specialWeights=[10], specialNames=['Angel'], specialRarity=[3])
+                   for i in range(2)]
+        return GameManager(players[0], Board(6, 8), players[1], Board(6, 8))
+
+    def playRandomly(self, game, actions, rand):
+        """Plays random actions; rand is used for choosing them, so that
+        the game's random numbers are not affected."""
+        for i in range(actions):
+            choice = rand.randint(4)
+            board = game.currentBoard
+            if choice == 0:
+                game.callPieces()
+            elif choice == 1 and board.units:
+                piece = sorted(board.units, key=lambda p: p.position)[rand.randint(len(board.units))]
+                game.movePiece(piece, rand.randint(board.width))
+            elif choice == 2 and board.units:
+                piece = sorted(board.units, key=lambda p: p.position)[rand.randint(len(board.units))]
+                game.deletePiece(list(piece.position))
+            else:
+                game.endTurn()
+
+    def record(self, seed, interval=0):
+        np.random.seed(seed)
+        game = self.newGame()
+        log = ReplayLog(seed, interval, self.table)
+        log.attach(game)
+        self.playRandomly(game, 60, np.random.RandomState(seed))
+        log.detach()
+        return game, log
+
+    def testReplay(self):
+        game, log = self.record(4)
+        replayed = replay(ReplayLog.fromstring(log.tostring(), self.table), self.newGame)
+        self.assertEqual(snapshot.packGame(replayed, self.table),
+                         snapshot.packGame(game, self.table))
+
+    def testRejectsOtherFormats(self):
+        game, log = self.record(4)
+        data = log.tostring()
+        self.assertRaises(ValueError, ReplayLog.fromstring, 'XXXX' + data[4:])
+        newer = data[:4] + chr(VERSION + 1) + data[5:]
+        self.assertRaises(ValueError, ReplayLog.fromstring, newer)
+
+    def testActionsAreSmall(self):
+        game, log = self.record(5)
+        self.assertTrue(len(log.actions) <= 4 * 60)
+
+    def testSeek(self):
+        game, log = self.record(6, interval=3)
+        self.assertTrue(log.snapshots)
+        turn = game.turn - 1
+        plain = ReplayLog(log.seed)
+        plain.actions = log.actions
+        fromStart = replay(plain, self.newGame, turn)
+        seeked = replay(log, self.newGame, turn)
+        self.assertEqual(fromStart.turn, turn)
+        self.assertEqual(snapshot.packGame(seeked, self.table),
+                         snapshot.packGame(fromStart, self.table))
+
+if __name__ == '__main__':
+    unittest.main()
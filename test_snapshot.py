@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import numpy as np
+
+from board import Board
+from game_manager import GameManager
+from described_object_factory import UnitFactory, PlayerFactory
+from type_table import TypeTable
+import snapshot
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.unitFac = UnitFactory('unit_descriptions.xml')
+        self.playerFac = PlayerFactory('player_descriptions.xml')
+        self.table = TypeTable(self.unitFac, self.playerFac)
+
+    def newGame(self):
+        players = [self.playerFac.create('Camel', self.unitFac,
+                       baseWeights=[1, 1, 1], baseNames=['Archer', 'Swordsman', 'Swordsman'],
+                       specialWeights=[10], specialNames=['Angel'], specialRarity=[3])
+                   for i in range(2)]
+        boards = [Board(6, 8), Board(6, 8)]
+        return GameManager(players[0], boards[0], players[1], boards[1])
+
+    def playSomeTurns(self, game, turns):
+        for i in range(turns):
+            game.callPieces()
+            game.endTurn()
+
+    def testBoardRoundTrip(self):
+        np.random.seed(1)
+        game = self.newGame()
+        self.playSomeTurns(game, 6)
+        board = game.boards[0]
+        data = snapshot.packBoard(board, self.table)
+
+        copy = snapshot.unpackBoard(data, self.table, game.players[0])
+        self.assertTrue(copy.selfConsistent())
+        self.assertEqual(len(copy.units), len(board.units))
+        self.assertEqual(len(copy.currentAttacks), len(board.currentAttacks))
+        for i in range(board.height):
+            for j in range(board.width):
+                self.assertEqual(self.table.encode(board[i, j]),
+                                 self.table.encode(copy[i, j]))
+        self.assertEqual(snapshot.packBoard(copy, self.table), data)
+
+    def testLoadIntoBoard(self):
+        np.random.seed(2)
+        game = self.newGame()
+        self.playSomeTurns(game, 2)
+        data = snapshot.packBoard(game.boards[0], self.table)
+
+        updates = []
+        def updateHandler(p): updates.append(p)
+        target = Board(6, 8)
+        target.pieceUpdated.addHandler(updateHandler)
+        snapshot.unpackBoard(data, self.table, game.players[0], target)
+        self.assertEqual(updates, [target.units])
+
+        with self.assertRaises(ValueError):
+            snapshot.unpackBoard(data, self.table, game.players[0], Board(3, 3))
+
+    def testGameRoundTrip(self):
+        np.random.seed(3)
+        game = self.newGame()
+        self.playSomeTurns(game, 5)
+        data = snapshot.packGame(game, self.table)
+
+        fork = self.newGame()
+        snapshot.unpackGame(data, fork, self.table)
+        self.assertEqual(snapshot.packGame(fork, self.table), data)
+        self.assertEqual(fork.turn, 5)
+        self.assertIs(fork.currentPlayer, fork.players[1])
+
+        # Since the random state is part of the snapshot, both games
+        # should continue identically.
+        self.playSomeTurns(fork, 3)
+        forkData = snapshot.packGame(fork, self.table)
+        snapshot.unpackGame(data, fork, self.table)
+        self.playSomeTurns(game, 3)
+        self.assertEqual(snapshot.packGame(game, self.table), forkData)
+
+if __name__ == '__main__':
+    unittest.main()
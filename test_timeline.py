@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from timeline import Timeline
+
+class FakeClock(object):
+    def __init__(self):
+        self.scheduled = []
+
+    def schedule(self, fn):
+        self.scheduled.append(fn)
+
+    def unschedule(self, fn):
+        self.scheduled.remove(fn)
+
+class TestTimeline(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+
+    def record(self, name):
+        self.calls.append(name)
+
+    def testOrder(self):
+        t = Timeline()
+        t.after(0.2, self.record, 'b')
+        t.after(0.1, self.record, 'a')
+        t.after(0.2, self.record, 'c')
+        t.tick(0.15)
+        self.assertEqual(self.calls, ['a'])
+        t.tick(0.05)
+        self.assertEqual(self.calls, ['a', 'b', 'c'])
+
+    def testChains(self):
+        t = Timeline()
+        def step(n):
+            self.record(n)
+            if n < 3:
+                t.after(1, step, n + 1)
+        t.after(0, step, 0)
+        t.tick(0)
+        t.tick(2.5)
+        self.assertEqual(self.calls, [0, 1])
+
+    def testTimeScale(self):
+        t = Timeline()
+        t.timeScale = 4.0
+        t.after(1, self.record, 'a')
+        t.tick(0.2)
+        self.assertEqual(self.calls, [])
+        t.tick(0.05)
+        self.assertEqual(self.calls, ['a'])
+        self.assertEqual(t.scaled(1), 0.25)
+
+    def testFastForward(self):
+        t = Timeline()
+        def step(n):
+            self.record(n)
+            if n < 3:
+                t.after(10, step, n + 1)
+        t.after(10, step, 0)
+        t.fastForward = True
+        t.tick(0)
+        self.assertEqual(self.calls, [0, 1, 2, 3])
+        self.assertEqual(t.time, 40)
+        self.assertEqual(t.scaled(1), 0)
+
+    def testSchedulesOnlyWhenBusy(self):
+        clock = FakeClock()
+        t = Timeline(clock)
+        self.assertEqual(clock.scheduled, [])
+        t.after(1, self.record, 'a')
+        t.after(2, self.record, 'b')
+        self.assertEqual(clock.scheduled, [t.tick])
+        t.tick(1)
+        self.assertEqual(clock.scheduled, [t.tick])
+        t.tick(1)
+        self.assertEqual(clock.scheduled, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import json
+import unittest
+
+from board import Board
+from described_object_factory import UnitFactory, PlayerFactory
+import fuzz_board
+import tracing
+
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        tracing.disable()
+        tracing.clear()
+
+    def tearDown(self):
+        tracing.disable()
+        tracing.clear()
+        tracing.setBufferSize(tracing.BUFFER_SIZE)
+
+    def testSubsystems(self):
+        a = tracing.getTracer('test.a')
+        b = tracing.getTracer('test.b')
+        self.assertTrue(tracing.getTracer('test.a') is a)
+        self.assertFalse(a.enabled)
+
+        position = [1, 2]
+        a.event('ignored', position=position)
+        self.assertEqual(tracing.events(), [])
+
+        tracing.enable('test.a')
+        self.assertTrue(a.enabled)
+        self.assertFalse(b.enabled)
+        a.event('moved', position=position)
+        position[0] = 5
+        event, = tracing.events()
+        self.assertEqual((event.subsystem, event.name, event.fields),
+                         ('test.a', 'moved', {'position': [1, 2]}))
+
+        tracing.enable('test')
+        self.assertTrue(b.enabled)
+        self.assertTrue(tracing.getTracer('test.c.d').enabled)
+        self.assertFalse(tracing.getTracer('testing').enabled)
+        b.event('other')
+        self.assertEqual([e.name for e in tracing.events('test.b')], ['other'])
+
+        tracing.disable('test')
+        self.assertTrue(a.enabled)
+        self.assertFalse(b.enabled)
+
+    def testRingBuffer(self):
+        tracing.setBufferSize(3)
+        tracing.enable('*')
+        received = []
+        tracing.addSink(received.append)
+        try:
+            tracer = tracing.getTracer('test')
+            for i in range(5):
+                tracer.event('count', i=i)
+        finally:
+            tracing.removeSink(received.append)
+        self.assertEqual([e.fields['i'] for e in tracing.events()], [2, 3, 4])
+        self.assertEqual(len(received), 5)
+        self.assertTrue(tracing.dump().splitlines()[0].endswith('test count i=2'))
+
+    def testFattyAlignment(self):
+        unitFac = UnitFactory('unit_descriptions.xml')
+        player = PlayerFactory('player_descriptions.xml').create('Camel', unitFac,
+                baseWeights=[3], baseNames=['Swordsman'],
+                specialWeights=[10], specialNames=['Swordsman'],
+                specialRarity=[10])
+        configs = json.load(open('test_board_configurations.json'))
+        config = [c for c in configs if c['comment'].startswith('Fatty alignment')][0]
+
+        def normalize():
+            board = Board(*config['dimensions'])
+            for pieceDesc in config['startConfig']:
+                fuzz_board.addJSONPiece(board, pieceDesc, unitFac, player)
+            board.normalize()
+
+        normalize()
+        self.assertEqual(tracing.events(), [])
+
+        tracing.enable('board')
+        normalize()
+        names = [e.name for e in tracing.events('board.fatty')]
+        self.assertTrue('misaligned' in names)
+        self.assertTrue('try' in names)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+import itertools
+import unittest
+
+from described_object_factory import UnitFactory, PlayerFactory
+from type_table import TypeTable, COLORS
+
+class TestTypeTable(unittest.TestCase):
+    def setUp(self):
+        self.unitFac = UnitFactory('unit_descriptions.xml')
+        self.playerFac = PlayerFactory('player_descriptions.xml')
+        self.player = self.playerFac.create('Camel', self.unitFac,
+                baseWeights=[3], baseNames=['Swordsman'],
+                specialWeights=[10], specialNames=['Swordsman'],
+                specialRarity=[10])
+        self.table = TypeTable(self.unitFac, self.playerFac)
+
+    def allPieces(self):
+        """One piece of every type and color."""
+        pieces = []
+        for name in sorted(self.unitFac.descriptions):
+            for color in COLORS:
+                unit = self.unitFac.create(name, color, self.player)
+                unit.position = [0, 0]
+                pieces.append(unit)
+                pieces.append(unit.charge())
+        pieces.append(pieces[0].transform())
+        return pieces
+
+    def testIdsStable(self):
+        other = TypeTable(UnitFactory('unit_descriptions.xml'),
+                          PlayerFactory('player_descriptions.xml'))
+        self.assertEqual(self.table.names, other.names)
+        self.assertEqual(self.table.unitId('Angel'), 1)
+        self.assertEqual(self.table.typeId(None), 0)
+
+    def testPredicatesMatch(self):
+        pieces = self.allPieces()
+        t = self.table
+        for a, b in itertools.product(pieces, pieces):
+            ta, ca = t.encode(a)
+            tb, cb = t.encode(b)
+            self.assertEqual(bool(t.canTransform(ta, ca, tb, cb)), bool(a.canTransform(b)))
+            self.assertEqual(bool(t.canMerge(ta, ca, tb, cb, a.toughness, b.toughness)),
+                             bool(a.canMerge(b)))
+            if hasattr(b, 'color'):
+                self.assertEqual(bool(t.canCharge(ta, ca, tb, cb)), bool(a.canCharge(b)))
+
+    def testWallMergeLimit(self):
+        wall = self.allPieces()[-1]
+        t = self.table
+        w, c = t.encode(wall)
+        self.assertTrue(t.canMerge(w, c, w, c, 7, 7))
+        self.assertFalse(t.canMerge(w, c, w, c, 8, 7))
+
+if __name__ == '__main__':
+    unittest.main()
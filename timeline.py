@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+
+class Timeline(object):
+    """Runs delayed calls, all from a single clock tick.
+
+    This replaces chains of pyglet.clock.schedule_once calls: the
+    animations of both boards and of the attacks queue their next steps
+    here, and the timeline advances them all at once. Time on the
+    timeline can run faster or slower than real time (timeScale), and in
+    fastForward mode everything that is queued runs straight away.
+    """
+
+    def __init__(self, clock=None):
+        """Creates an empty timeline.
+
+        If clock is given (eg. pyglet.clock), the timeline schedules its
+        tick with it whenever there is something queued. Otherwise, tick
+        has to be called by hand.
+        """
+
+        self.clock = clock
+        self.timeScale = 1.0
+        self.fastForward = False
+        # The current time on the timeline, in seconds.
+        self.time = 0.0
+        # A heap of (time, sequence number, function, args).
+        self._queue = []
+        self._sequence = 0
+        self._scheduled = False
+
+    def after(self, delay, fn, *args):
+        """Calls fn(*args) after delay seconds (of timeline time)."""
+
+        heapq.heappush(self._queue, (self.time + delay, self._sequence, fn, args))
+        self._sequence += 1
+        if self.clock is not None and not self._scheduled:
+            self.clock.schedule(self.tick)
+            self._scheduled = True
+
+    def scaled(self, seconds):
+        """Converts a duration on the timeline to real time.
+
+        This is for animations that don't run on the timeline (eg. cocos
+        actions). In fastForward mode, it is 0.
+        """
+
+        if self.fastForward:
+            return 0
+        return seconds / self.timeScale
+
+    @property
+    def pending(self):
+        return len(self._queue)
+
+    def tick(self, dt):
+        """Advances the timeline by dt seconds of real time."""
+
+        if self.fastForward:
+            # Run everything, including whatever gets queued on the way.
+            while self._queue:
+                self._runNext()
+        else:
+            self.time += dt * self.timeScale
+            while self._queue and self._queue[0][0] <= self.time:
+                self._runNext()
+
+        if not self._queue and self._scheduled:
+            self.clock.unschedule(self.tick)
+            self._scheduled = False
+
+    def _runNext(self):
+        when, sequence, fn, args = heapq.heappop(self._queue)
+        self.time = max(self.time, when)
+        fn(*args)
+
+    def clear(self):
+        """Drops everything that is queued."""
+        self._queue = []
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Structured tracing, for debugging the hot paths without slowing them down.
+
+Every subsystem gets a Tracer, and its trace points check whether it is
+enabled before building anything:
+
+    _trace = tracing.getTracer('board.fatty')
+    ...
+    if _trace.enabled:
+        _trace.event('misaligned', name=unit.name, position=unit.position)
+
+When the tracer is disabled (the default), a trace point costs one
+attribute lookup. When it is enabled, the event (a TraceEvent, with the
+fields as they were given) goes into a ring buffer that keeps the latest
+events, and to any sinks that were added; the fields are only turned
+into text when the event is formatted.
+
+Subsystems are enabled by name, and a name also enables the subsystems
+below it: enable('board') enables 'board.fatty'. The
+CLASHADASH_TRACE environment variable holds a comma-separated list of
+names to enable at startup ('*' enables everything).
+"""
+
+import collections
+import copy
+import logging
+import os
+import timeit
+
+# The number of events that the ring buffer keeps, unless setBufferSize
+# is called.
+BUFFER_SIZE = 10000
+
+TraceEvent = collections.namedtuple('TraceEvent', 'time subsystem name fields')
+
+class Tracer(object):
+    """The trace points of one subsystem."""
+
+    def __init__(self, subsystem):
+        self.subsystem = subsystem
+        # Check this before calling event, so that the arguments aren't
+        # even built when tracing is off.
+        self.enabled = False
+
+    def event(self, eventName, **fields):
+        """Records an event.
+
+        The fields are copied (shallowly), so that mutable values (like
+        piece positions) keep the value they had at the time.
+        """
+
+        if not self.enabled:
+            return
+        for key, value in fields.items():
+            if isinstance(value, (list, dict, set)):
+                fields[key] = copy.copy(value)
+        event = TraceEvent(timeit.default_timer(), self.subsystem, eventName, fields)
+        _buffer.append(event)
+        for sink in _sinks:
+            sink(event)
+
+_tracers = {}
+_enabled = set()
+_buffer = collections.deque(maxlen=BUFFER_SIZE)
+_sinks = []
+
+def getTracer(subsystem):
+    """Returns the tracer of a subsystem, creating it if necessary."""
+
+    tracer = _tracers.get(subsystem)
+    if tracer is None:
+        tracer = _tracers[subsystem] = Tracer(subsystem)
+        tracer.enabled = _matches(subsystem)
+    return tracer
+
+def _matches(subsystem):
+    if '*' in _enabled:
+        return True
+    parts = subsystem.split('.')
+    return any('.'.join(parts[:k]) in _enabled for k in range(1, len(parts) + 1))
+
+def _update():
+    for subsystem, tracer in _tracers.items():
+        tracer.enabled = _matches(subsystem)
+
+def enable(*subsystems):
+    """Enables tracing of the subsystems (and of the ones below them)."""
+
+    _enabled.update(subsystems)
+    _update()
+
+def disable(*subsystems):
+    """Disables tracing of the subsystems that were enabled by these
+    names; with no names, disables everything."""
+
+    if subsystems:
+        _enabled.difference_update(subsystems)
+    else:
+        _enabled.clear()
+    _update()
+
+def enabledSubsystems():
+    return sorted(_enabled)
+
+def events(subsystem=None):
+    """Returns the events in the ring buffer, oldest first.
+
+    If subsystem is given, only returns the events of that subsystem and
+    of the ones below it.
+    """
+
+    if subsystem is None:
+        return list(_buffer)
+    prefix = subsystem + '.'
+    return [e for e in _buffer
+            if e.subsystem == subsystem or e.subsystem.startswith(prefix)]
+
+def clear():
+    """Empties the ring buffer."""
+
+    _buffer.clear()
+
+def setBufferSize(size):
+    """Changes how many events the ring buffer keeps."""
+
+    global _buffer
+    _buffer = collections.deque(_buffer, maxlen=size)
+
+def addSink(sink):
+    """Calls sink(event) for every event from now on."""
+
+    _sinks.append(sink)
+
+def removeSink(sink):
+    _sinks.remove(sink)
+
+def formatEvent(event):
+    fields = ' '.join('%s=%r' % item for item in sorted(event.fields.items()))
+    return '%.6f %s %s %s' % (event.time, event.subsystem, event.name, fields)
+
+def logSink(event):
+    """A sink that logs the events (at the DEBUG level)."""
+
+    logging.debug(formatEvent(event))
+
+def dump(subsystem=None):
+    """Returns the events in the ring buffer as text, one per line."""
+
+    return '\n'.join(formatEvent(e) for e in events(subsystem))
+
+def _enableFromEnvironment():
+    names = os.environ.get('CLASHADASH_TRACE', '')
+    names = [n.strip() for n in names.split(',') if n.strip()]
+    if names:
+        enable(*names)
+
+_enableFromEnvironment()
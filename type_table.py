@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from unit import Unit
+from charging_unit import ChargingUnit
+from wall import Wall
+from ghost_piece import GhostPiece
+
+# The colors that units can have, in the order of their ids. Id 0 is
+# reserved for pieces without a color (eg. walls).
+COLORS = ('red', 'white', 'blue')
+
+# The different kinds of piece types. Kind 0 (and type id 0) is reserved
+# for empty squares.
+EMPTY = 0
+UNIT = 1
+CHARGING_UNIT = 2
+WALL = 3
+
+class TypeTable(object):
+    """Assigns integer ids to every type of piece that can appear in a game.
+
+    Type ids are stable: they only depend on the names in the description
+    files. Unit types come first (sorted by name), then charged unit types,
+    then one wall type per player description.
+
+    The rule predicates of the pieces (canCharge, canTransform and canMerge)
+    are tabulated as boolean matrices indexed by type id, so that they can
+    be evaluated for whole arrays of pieces at once. The matrices assume
+    that the two pieces have the same color; the color check, and the
+    toughness limit on merging walls, depend on the state of the pieces
+    and are done separately (see canCharge, etc.).
+    """
+
+    def __init__(self, unitFactory, playerFactory, colors=COLORS):
+        self.colors = [None] + list(colors)
+        self._colorIds = dict((c, i) for i, c in enumerate(self.colors))
+
+        units = unitFactory.descriptions
+        players = playerFactory.descriptions
+        unitNames = sorted(units)
+        chargeNames = sorted(set(units[n]['charge']['name'] for n in unitNames))
+        playerNames = sorted(players)
+
+        # Make a prototype piece of every type; the tables are filled in by
+        # asking the prototypes.
+        unitPrototypes = [Unit(units[n], colors[0], None) for n in unitNames]
+        prototypes = [None] + unitPrototypes
+        for c in chargeNames:
+            unit = [u for u in unitPrototypes if u.chargeDescription['name'] == c][0]
+            unit.position = [0, 0]
+            prototypes.append(unit.charge())
+            unit.position = None
+        for n in playerNames:
+            wall = Wall(players[n]['wall'], [0, 0])
+            # Merging walls is limited by their toughness, which is part
+            # of their state. See mergeLimit.
+            wall.toughness = 0
+            prototypes.append(wall)
+
+        self.names = [None] + unitNames + chargeNames + playerNames
+        # The description used to create pieces of each type.
+        self.descriptions = ([None] + [units[n] for n in unitNames] +
+                             [p.description for p in prototypes[1 + len(unitNames):]])
+        self._unitIds = dict((n, i + 1) for i, n in enumerate(unitNames))
+        self._chargeIds = dict((n, i + 1 + len(unitNames))
+                               for i, n in enumerate(chargeNames))
+        self._wallIds = {}
+        for i, n in enumerate(playerNames):
+            wall = players[n]['wall']
+            self._wallIds[(wall['image'], wall['maxToughness'])] = (
+                    i + 1 + len(unitNames) + len(chargeNames))
+
+        count = len(prototypes)
+        self.kinds = np.zeros(count, dtype='uint8')
+        self.sizes = np.zeros((count, 2), dtype='int8')
+        self.mergeLimit = np.zeros(count, dtype='int32')
+        self.canChargeTable = np.zeros((count, count), dtype=bool)
+        self.canTransformTable = np.zeros((count, count), dtype=bool)
+        self.canMergeTable = np.zeros((count, count), dtype=bool)
+
+        for i, p in enumerate(prototypes):
+            if p is None:
+                continue
+            self.kinds[i] = self._kind(p)
+            self.sizes[i] = p.size
+            if isinstance(p, Wall):
+                self.mergeLimit[i] = p.maxToughness
+            for j, q in enumerate(prototypes):
+                if q is None:
+                    continue
+                # Pieces without a color can't be used for charging; Unit
+                # would raise an AttributeError on them.
+                self.canChargeTable[i, j] = hasattr(q, 'color') and bool(p.canCharge(q))
+                self.canTransformTable[i, j] = bool(p.canTransform(q))
+                self.canMergeTable[i, j] = bool(p.canMerge(q))
+
+        self.canChargeTable.setflags(write=False)
+        self.canTransformTable.setflags(write=False)
+        self.canMergeTable.setflags(write=False)
+
+    def _kind(self, piece):
+        if isinstance(piece, GhostPiece):
+            return self._kind(piece.piece)
+        if isinstance(piece, Wall):
+            return WALL
+        if isinstance(piece, ChargingUnit):
+            return CHARGING_UNIT
+        if isinstance(piece, Unit):
+            return UNIT
+        raise ValueError('Piece has no type id', piece)
+
+    def typeId(self, piece):
+        """Returns the type id of a piece (0 for None)."""
+
+        if piece is None:
+            return 0
+        if isinstance(piece, GhostPiece):
+            return self.typeId(piece.piece)
+        try:
+            if isinstance(piece, Wall):
+                return self._wallIds[(piece.image, piece.maxToughness)]
+            if isinstance(piece, ChargingUnit):
+                return self._chargeIds[piece.name]
+            if isinstance(piece, Unit):
+                return self._unitIds[piece.name]
+        except KeyError:
+            pass
+        raise ValueError('Piece has no type id', piece)
+
+    def unitId(self, name):
+        """The type id of the unit with the given name."""
+        return self._unitIds[name]
+
+    def chargeId(self, name):
+        """The type id of the charged unit with the given name."""
+        return self._chargeIds[name]
+
+    def colorId(self, color):
+        """The id of a color (0 for None)."""
+        return self._colorIds[color]
+
+    def encode(self, piece):
+        """Returns the pair (type id, color id) of a piece."""
+
+        return (self.typeId(piece),
+                self._colorIds[getattr(piece, 'color', None)])
+
+    def canCharge(self, typeA, colorA, typeB, colorB):
+        """Whether pieces of type B can charge pieces of type A.
+
+        The arguments can be integers or numpy arrays of ids.
+        """
+        return self.canChargeTable[typeA, typeB] & (np.asarray(colorA) == colorB)
+
+    def canTransform(self, typeA, colorA, typeB, colorB):
+        """Whether pieces of type B can transform pieces of type A."""
+        return self.canTransformTable[typeA, typeB] & (np.asarray(colorA) == colorB)
+
+    def canMerge(self, typeA, colorA, typeB, colorB, toughnessA=0, toughnessB=0):
+        """Whether a piece of type B can be merged into a piece of type A.
+
+        Charged units only merge if their colors match; walls only merge
+        if their combined toughness is at most mergeLimit.
+        """
+        limit = self.mergeLimit[typeA]
+        colorOk = (self.kinds[typeA] == WALL) | (np.asarray(colorA) == colorB)
+        toughOk = (limit == 0) | (np.asarray(toughnessA) + toughnessB <= limit)
+        return self.canMergeTable[typeA, typeB] & colorOk & toughOk